@@ -1,22 +1,63 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from jinja2 import FileSystemBytecodeCache
+from redis import asyncio as aioredis
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, union_all, literal_column, null
+import asyncio
 import csv
+import hashlib
 import io
+from contextlib import asynccontextmanager
 from datetime import datetime, date
+from typing import Dict
 
 from models.base import async_session_maker
-from models.repositories import ConsultationRequestRepository, UserRepository, ServiceRepository
-from models.database import ConsultationRequest, User, Service
-from config.settings import settings
+from models.repositories import (
+    ConsultationRequestRepository, ConsultationStatsRepository, ServiceRepository
+)
+from models.database import ConsultationRequest, ConsultationStatsDaily, User, Service
+from services.service_cache import service_cache
+from config.settings import Settings, settings, get_settings
 
-app = FastAPI(title="Med-Plastic Admin Panel", version="1.0.0")
+# Время жизни кэша агрегированной статистики (секунды)
+STATS_CACHE_TTL = 60
+# Заявок на одной странице списка
+REQUESTS_PAGE_SIZE = 50
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Инициализация кэша ответов (Redis, либо память процесса)"""
+    if settings.redis_url:
+        backend = RedisBackend(aioredis.from_url(settings.redis_url))
+    else:
+        backend = InMemoryBackend()
+    FastAPICache.init(backend, prefix="med-plastic")
+    yield
+    await service_cache.close()
+
+
+async def invalidate_stats_cache():
+    """Сброс закэшированной статистики после изменения заявок"""
+    await FastAPICache.clear(namespace="dashboard")
+    await FastAPICache.clear(namespace="stats")
+
+
+app = FastAPI(title="Med-Plastic Admin Panel", version="1.0.0", lifespan=lifespan)
 
 # Настройка шаблонов
 templates = Jinja2Templates(directory="admin/templates")
+# Шаблоны не перечитываются с диска на каждый рендер (кроме режима отладки),
+# а скомпилированный байткод переживает перезапуск процесса
+templates.env.auto_reload = settings.log_level.upper() == "DEBUG"
+templates.env.bytecode_cache = FileSystemBytecodeCache()
 
 # Статические файлы
 app.mount("/static", StaticFiles(directory="admin/static"), name="static")
@@ -28,69 +69,137 @@ async def get_session():
         yield session
 
 
+async def compute_etag(session: AsyncSession) -> str:
+    """
+    ETag страниц админки: версия данных, которые эти страницы показывают
+    
+    Только индексные max() по первичным ключам и маленькие таблицы (услуги,
+    сводка заявок), без подсчета строк в больших таблицах - запрос идет и для 304.
+    """
+    stmt = select(
+        # Новая заявка или пользователь увеличивают max(id)
+        select(func.max(ConsultationRequest.id)).scalar_subquery(),
+        select(func.max(User.id)).scalar_subquery(),
+        select(func.max(Service.id)).scalar_subquery(),
+        select(func.max(Service.updated_at)).scalar_subquery(),
+    )
+    result = await session.execute(stmt)
+    # Смена статуса заявки меняет суммы по статусам в сводной таблице
+    status_totals = await ConsultationStatsRepository(session).get_status_totals()
+    version = (tuple(result.one()), sorted(status_totals.items()))
+    return f'"{hashlib.md5(repr(version).encode()).hexdigest()}"'
+
+
+def render_with_etag(template_name: str, context: Dict, etag: str) -> Response:
+    """Рендерит шаблон и проставляет заголовок ETag"""
+    response = templates.TemplateResponse(template_name, context)
+    response.headers["ETag"] = etag
+    return response
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Проверяет, совпадает ли ETag клиента с актуальным"""
+    return request.headers.get("if-none-match") == etag
+
+
+@cache(expire=STATS_CACHE_TTL, namespace="dashboard")
+async def get_dashboard_counts(etag: str) -> Dict:
+    """
+    Статистика по статусам и общие счетчики одним запросом (UNION ALL)
+    
+    etag входит в ключ кэша: при изменении данных страница не получит
+    устаревшие счетчики под новым ETag.
+    """
+    # Заявки считаются по сводной таблице, а не сканированием consultation_requests
+    status_stmt = select(
+        literal_column("'status'").label("kind"),
+        ConsultationStatsDaily.status.label("status"),
+        func.sum(ConsultationStatsDaily.count).label("count")
+    ).group_by(ConsultationStatsDaily.status)
+    users_stmt = select(
+        literal_column("'users'"), null(), func.count(User.id)
+    )
+    requests_stmt = select(
+        literal_column("'requests'"), null(),
+        func.coalesce(func.sum(ConsultationStatsDaily.count), 0)
+    )
+    
+    # Отдельная сессия: AsyncSession нельзя использовать из параллельных задач
+    async with async_session_maker() as session:
+        result = await session.execute(union_all(status_stmt, users_stmt, requests_stmt))
+        rows = result.all()
+    
+    counts = {"stats": {}, "total_users": 0, "total_requests": 0}
+    for kind, status, count in rows:
+        if kind == "status":
+            if count:
+                counts["stats"][status] = count
+        else:
+            counts[f"total_{kind}"] = count
+    return counts
+
+
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, session: AsyncSession = Depends(get_session)):
+async def dashboard(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    app_settings: Settings = Depends(get_settings)
+):
     """Главная панель администратора"""
     
-    # Получаем статистику
-    request_repo = ConsultationRequestRepository(session)
-    user_repo = UserRepository(session)
-    
-    # Новые заявки
-    new_requests = await request_repo.get_all(status="new")
+    etag = await compute_etag(session)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    # Статистика по статусам
-    stats_query = select(
-        ConsultationRequest.status,
-        func.count(ConsultationRequest.id)
-    ).group_by(ConsultationRequest.status)
-    stats_result = await session.execute(stats_query)
-    stats = dict(stats_result.all())
+    request_repo = ConsultationRequestRepository(session)
     
-    # Всего пользователей и заявок
-    total_users = await session.execute(select(func.count(User.id)))
-    total_requests = await session.execute(select(func.count(ConsultationRequest.id)))
+    # Новые заявки и статистика загружаются параллельно
+    new_requests, counts = await asyncio.gather(
+        request_repo.get_all(status="new", eager=True, limit=5),
+        get_dashboard_counts(etag)
+    )
     
     context = {
         "request": request,
-        "new_requests": new_requests[:5],  # Последние 5 заявок
-        "stats": stats,
-        "total_users": total_users.scalar(),
-        "total_requests": total_requests.scalar(),
-        "clinic_name": settings.clinic_name
+        "new_requests": new_requests,  # Последние 5 заявок
+        "stats": counts["stats"],
+        "total_users": counts["total_users"],
+        "total_requests": counts["total_requests"],
+        "clinic_name": app_settings.clinic_name
     }
     
-    return templates.TemplateResponse("dashboard.html", context)
+    return render_with_etag("dashboard.html", context, etag)
 
 
 @app.get("/requests", response_class=HTMLResponse)
 async def requests_page(
     request: Request, 
     status: str = None,
-    session: AsyncSession = Depends(get_session)
+    cursor: int = None,
+    session: AsyncSession = Depends(get_session),
+    app_settings: Settings = Depends(get_settings)
 ):
-    """Страница со всеми заявками"""
+    """Страница со всеми заявками (постранично, cursor - id последней заявки)"""
     
-    request_repo = ConsultationRequestRepository(session)
-    requests = await request_repo.get_all(status=status)
+    etag = await compute_etag(session)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    # Получаем информацию о пользователях и услугах
-    for req in requests:
-        # Загружаем связанные данные
-        user = await session.get(User, req.user_id)
-        service = await session.get(Service, req.service_id)
-        req.user_name = user.first_name if user else "Unknown"
-        req.user_phone = user.phone if user else "Unknown"
-        req.service_name = service.name if service else "Unknown"
+    request_repo = ConsultationRequestRepository(session)
+    # Пользователи и услуги подгружаются вместе с заявками
+    requests, next_cursor = await request_repo.page(
+        status=status, limit=REQUESTS_PAGE_SIZE, cursor=cursor
+    )
     
     context = {
         "request": request,
         "requests": requests,
+        "next_cursor": next_cursor,
         "current_status": status,
-        "clinic_name": settings.clinic_name
+        "clinic_name": app_settings.clinic_name
     }
     
-    return templates.TemplateResponse("requests.html", context)
+    return render_with_etag("requests.html", context, etag)
 
 
 @app.post("/api/requests/{request_id}/status")
@@ -107,66 +216,76 @@ async def update_request_status(
     if not updated_request:
         raise HTTPException(status_code=404, detail="Request not found")
     
+    await session.commit()
+    await invalidate_stats_cache()
     return {"success": True, "status": status}
 
 
 @app.get("/api/requests/export")
-async def export_requests(session: AsyncSession = Depends(get_session)):
-    """Экспорт заявок в CSV"""
+async def export_requests():
+    """Экспорт заявок в CSV (построчная потоковая выгрузка)"""
     
-    request_repo = ConsultationRequestRepository(session)
-    requests = await request_repo.get_all()
-    
-    # Создаем CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Заголовки
-    writer.writerow([
-        'ID', 'Имя', 'Телефон', 'Услуга', 'Статус', 
-        'Предпочтительная дата', 'Комментарий', 'Дата создания'
-    ])
-    
-    # Данные
-    for req in requests:
-        user = await session.get(User, req.user_id)
-        service = await session.get(Service, req.service_id)
+    async def csv_rows():
+        output = io.StringIO()
+        writer = csv.writer(output)
         
+        # Заголовки
         writer.writerow([
-            req.id,
-            req.name,
-            req.phone,
-            service.name if service else 'Unknown',
-            req.status,
-            req.preferred_date.strftime('%d.%m.%Y') if req.preferred_date else '',
-            req.comment,
-            req.created_at.strftime('%d.%m.%Y %H:%M')
+            'ID', 'Имя', 'Телефон', 'Услуга', 'Статус', 
+            'Предпочтительная дата', 'Комментарий', 'Дата создания'
         ])
+        yield output.getvalue()
+        
+        # Собственная сессия: генератор работает уже после выхода из обработчика
+        async with async_session_maker() as session:
+            request_repo = ConsultationRequestRepository(session)
+            
+            # Данные
+            async for req in request_repo.iter_all():
+                output.seek(0)
+                output.truncate(0)
+                writer.writerow([
+                    req.id,
+                    req.name,
+                    req.phone,
+                    req.service.name if req.service else 'Unknown',
+                    req.status,
+                    req.preferred_date.strftime('%d.%m.%Y') if req.preferred_date else '',
+                    req.comment,
+                    req.created_at.strftime('%d.%m.%Y %H:%M')
+                ])
+                yield output.getvalue()
     
-    # Возвращаем файл
-    output.seek(0)
-    return JSONResponse(
-        content={
-            "csv": output.getvalue(),
-            "filename": f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        }
+    filename = f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return StreamingResponse(
+        csv_rows(),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
 @app.get("/services", response_class=HTMLResponse)
-async def services_page(request: Request, session: AsyncSession = Depends(get_session)):
+async def services_page(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    app_settings: Settings = Depends(get_settings)
+):
     """Страница управления услугами"""
     
+    etag = await compute_etag(session)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
     service_repo = ServiceRepository(session)
     services = await service_repo.get_all()
     
     context = {
         "request": request,
         "services": services,
-        "clinic_name": settings.clinic_name
+        "clinic_name": app_settings.clinic_name
     }
     
-    return templates.TemplateResponse("services.html", context)
+    return render_with_etag("services.html", context, etag)
 
 
 @app.post("/api/services/{service_id}")
@@ -183,35 +302,29 @@ async def update_service(
     if not updated_service:
         raise HTTPException(status_code=404, detail="Service not found")
     
+    await session.commit()
+    # Бот - отдельный процесс: кэш услуг сбрасывается через версию в Redis
+    await service_cache.invalidate_shared()
     return {"success": True}
 
 
 @app.get("/api/stats")
-async def get_stats(session: AsyncSession = Depends(get_session)):
+@cache(expire=STATS_CACHE_TTL, namespace="stats")
+async def get_stats():
     """Получение статистики для графиков"""
     
-    # Заявки по дням за последние 30 дней
-    daily_stats_query = select(
-        func.date(ConsultationRequest.created_at).label('date'),
-        func.count(ConsultationRequest.id).label('count')
-    ).where(
-        ConsultationRequest.created_at >= datetime.now().replace(day=1)
-    ).group_by(func.date(ConsultationRequest.created_at))
-    
-    daily_result = await session.execute(daily_stats_query)
-    daily_stats = [
-        {"date": str(row.date), "count": row.count}
-        for row in daily_result
-    ]
-    
-    # Статистика по статусам
-    status_stats_query = select(
-        ConsultationRequest.status,
-        func.count(ConsultationRequest.id)
-    ).group_by(ConsultationRequest.status)
-    
-    status_result = await session.execute(status_stats_query)
-    status_stats = dict(status_result.all())
+    async with async_session_maker() as session:
+        stats_repo = ConsultationStatsRepository(session)
+        
+        # Заявки по дням с начала месяца
+        daily_rows = await stats_repo.get_daily(since=date.today().replace(day=1))
+        daily_stats = [
+            {"date": str(row.date), "count": row.count}
+            for row in daily_rows
+        ]
+        
+        # Статистика по статусам
+        status_stats = await stats_repo.get_status_totals()
     
     return {
         "daily": daily_stats,
@@ -86,10 +86,9 @@ function formatDate(dateString) {
 async function exportToCSV(url, filename) {
     try {
         const response = await fetch(url);
-        const data = await response.json();
         
         // Create blob
-        const blob = new Blob([data.csv], { type: 'text/csv;charset=utf-8;' });
+        const blob = await response.blob();
         const link = document.createElement('a');
         
         if (link.download !== undefined) {
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -7,16 +8,34 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     bot_token: str = Field(..., env="BOT_TOKEN")
     database_url: str = Field(default="sqlite+aiosqlite:///./med_plastic_bot.db", env="DATABASE_URL")
+    db_pool_size: int = Field(default=20, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, env="DB_MAX_OVERFLOW")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")  # секунды
     
     # OpenAI Configuration
     openai_api_key: str = Field(..., env="OPENAI_API_KEY")
     openai_model: str = Field(default="gpt-4o-mini", env="OPENAI_MODEL")
     openai_base_url: str = Field(default="https://api.openai.com/v1", env="OPENAI_BASE_URL")
+    # Время жизни кэша готовых ответов на одинаковые вопросы, секунды (0 - отключить)
+    openai_response_cache_ttl: int = Field(default=3600, env="OPENAI_RESPONSE_CACHE_TTL")
+    # Кэш по смыслу вопроса: минимальная косинусная близость эмбеддингов (0 - отключить)
+    openai_semantic_cache_threshold: float = Field(default=0.0, env="OPENAI_SEMANTIC_CACHE_THRESHOLD")
+    openai_embedding_model: str = Field(default="text-embedding-3-small", env="OPENAI_EMBEDDING_MODEL")
     
     # Legacy Ollama settings (for backward compatibility)
     ollama_host: str = Field(default="http://localhost:11434", env="OLLAMA_HOST")
     ollama_model: str = Field(default="mistral:7b", env="OLLAMA_MODEL")
     
+    # Redis для кэша админ-панели и состояний FSM бота (если не задан - память процесса)
+    redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
+    
+    # Вебхук Telegram (если webhook_url не задан - бот получает обновления polling'ом)
+    webhook_url: Optional[str] = Field(default=None, env="WEBHOOK_URL")
+    webhook_secret: Optional[str] = Field(default=None, env="WEBHOOK_SECRET")
+    webhook_path: str = Field(default="/tg/webhook", env="WEBHOOK_PATH")
+    webhook_host: str = Field(default="0.0.0.0", env="WEBHOOK_HOST")
+    webhook_port: int = Field(default=8080, env="WEBHOOK_PORT")
+    
     admin_telegram_id: Optional[int] = Field(default=None, env="ADMIN_TELEGRAM_ID")
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     clinic_name: str = Field(default="Мед-Пластик", env="CLINIC_NAME")
@@ -29,4 +48,10 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Единственный экземпляр настроек (также используется как FastAPI dependency)"""
+    return Settings()
+
+
+settings = get_settings()
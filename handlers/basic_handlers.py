@@ -1,13 +1,20 @@
+import asyncio
+import html
 import logging
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from aiogram import Router, F, types
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, or_f
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.repositories import UserRepository, ServiceRepository, ChatLogRepository
-from keyboards.reply_keyboards import get_main_keyboard
+from models.database import User
+from models.repositories import ChatLogRepository
+from keyboards.reply_keyboards import get_main_keyboard, get_faq_categories_keyboard
 from states.consultation import ConsultationStates
-from services.openai_service import openai_service
+from services.openai_service import openai_service, trim_response, uses_history
+from services.service_cache import service_cache
+from services.chat_log_writer import chat_log_writer
 from config.settings import settings
 from utils.message_splitter import split_message
 from utils.message_handler import safe_send_message, safe_send_messages
@@ -15,25 +22,26 @@ from utils.message_handler import safe_send_message, safe_send_messages
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Максимум одновременных запросов к OpenAI из фоновых задач
+OPENAI_CONCURRENCY = 10
+_openai_semaphore: Optional[asyncio.Semaphore] = None
+# Сколько последних обменов из истории диалога передавать модели
+# (в промпт идут только последние вопрос и ответ)
+HISTORY_EXCHANGES = 1
+# Как часто обновлять сообщение с ответом, пока он генерируется, секунды
+STREAM_EDIT_INTERVAL = 1.0
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
 
-@router.message(CommandStart())
-async def cmd_start(message: types.Message, session: AsyncSession, state: FSMContext):
-    """Обработчик команды /start"""
-    await state.clear()
-    
-    # Получаем или создаем пользователя
-    user_repo = UserRepository(session)
-    user = await user_repo.get_or_create(
-        telegram_id=message.from_user.id,
-        username=message.from_user.username,
-        first_name=message.from_user.first_name,
-        last_name=message.from_user.last_name
-    )
-    
-    # Приветственное сообщение
-    welcome_text = f"""👋 Добрый день, {message.from_user.first_name or 'гость'}!
 
-Вас приветствует виртуальный помощник клиники **"{settings.clinic_name}"**. 
+# Статические тексты собираются (и экранируются для HTML) один раз при импорте модуля
+CLINIC_NAME = html.escape(settings.clinic_name)
+CLINIC_PHONE = html.escape(settings.clinic_phone)
+CLINIC_EMAIL = html.escape(settings.clinic_email)
+
+WELCOME_TEMPLATE = f"""👋 Добрый день, {{name}}!
+
+Вас приветствует виртуальный помощник клиники <b>"{CLINIC_NAME}"</b>. 
 Меня зовут Анна, и я готова ответить на ваши вопросы о пластике верхних век.
 
 Я могу помочь вам:
@@ -44,17 +52,88 @@ async def cmd_start(message: types.Message, session: AsyncSession, state: FSMCon
 ❓ Ответить на частые вопросы
 
 Выберите интересующий вас пункт ниже 👇"""
+
+HELP_TEXT = """🆘 <b>Помощь</b>
+
+Доступные команды:
+/start - Начать диалог
+/help - Показать это сообщение
+/cancel - Отменить текущее действие
+
+Основные функции:
+📋 Узнать об услуге - подробная информация о блефаропластике
+💰 Цены - информация о стоимости процедур
+📅 Записаться на консультацию - запись на очную консультацию
+👨‍💼 Связаться с менеджером - быстрый контакт с живым специалистом
+❓ Частые вопросы - ответы на популярные вопросы
+
+Если у вас возникли проблемы, напишите @admin"""
+
+CONTACT_TEXT = f"""👨‍💼 <b>Связь с менеджером</b>
+
+Ваш запрос передан живому менеджеру клиники.
+
+📞 <b>Телефон клиники:</b> {CLINIC_PHONE}
+📧 <b>Email:</b> {CLINIC_EMAIL}
+
+⏰ <b>Время работы:</b> Пн-Пт с 9:00 до 18:00
+
+Менеджер свяжется с вами в течение 15 минут в рабочее время.
+
+Могу я помочь вам с чем-то еще пока вы ждете?"""
+
+FAQ_TEXT = """❓ <b>Частые вопросы</b>
+
+Выберите категорию вопросов, которая вас интересует:
+
+💰 Цены и стоимость
+⏰ Длительность и реабилитация  
+⚕️ Безопасность и риски
+📋 Подготовка к операции
+🏥 Общие вопросы"""
+
+ABOUT_TEXT = f"""🏥 <b>О клинике "{CLINIC_NAME}"</b>
+
+Наша клиника специализируется на пластической хирургии премиум-класса.
+
+✅ <b>Наши преимущества:</b>
+• Опытные хирурги с международной сертификацией
+• Современное оборудование
+• Индивидуальный подход к каждому пациенту
+• Конфиденциальность и безопасность
+• Гарантия качества
+
+📍 <b>Адрес:</b> Москва, ул. Примерная, д. 123
+📞 <b>Телефон:</b> {CLINIC_PHONE}
+🌐 <b>Сайт:</b> med-plastic.ru
+
+Готова ответить на ваши вопросы о процедурах!"""
+
+
+def _get_openai_semaphore() -> asyncio.Semaphore:
+    """Семафор создается лениво, внутри работающего event loop"""
+    global _openai_semaphore
+    if _openai_semaphore is None:
+        _openai_semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
+    return _openai_semaphore
+
+
+@router.message(CommandStart())
+async def cmd_start(message: types.Message, state: FSMContext, user: User):
+    """Обработчик команды /start"""
+    await state.clear()
+    
+    welcome_text = WELCOME_TEMPLATE.format(name=html.escape(message.from_user.first_name or 'гость'))
     
     await safe_send_message(
         message, 
         welcome_text, 
-        parse_mode="Markdown",
+        parse_mode="HTML",
         reply_markup=get_main_keyboard()
     )
     
     # Логируем обращение
-    chat_log_repo = ChatLogRepository(session)
-    await chat_log_repo.create(
+    chat_log_writer.log(
         user_id=user.id,
         message="/start",
         response=welcome_text,
@@ -65,93 +144,93 @@ async def cmd_start(message: types.Message, session: AsyncSession, state: FSMCon
 @router.message(Command("help"))
 async def cmd_help(message: types.Message):
     """Обработчик команды /help"""
-    help_text = """🆘 *Помощь*
-
-Доступные команды:
-/start - Начать диалог
-/help - Показать это сообщение
-/cancel - Отменить текущее действие
+    await safe_send_message(message, HELP_TEXT, parse_mode="HTML")
 
-Основные функции:
-📋 Узнать об услуге - подробная информация о блефаропластике
-💰 Цены - информация о стоимости процедур
-📅 Записаться на консультацию - запись на очную консультацию
-👨‍💼 Связаться с менеджером - быстрый контакт с живым специалистом
-❓ Частые вопросы - ответы на популярные вопросы
 
-Если у вас возникли проблемы, напишите @admin"""
-    
-    await safe_send_message(message, help_text, parse_mode="Markdown")
+# Текст ответа для каждой из кнопок/команды возврата в главное меню
+CANCEL_TEXT = "❌ Действие отменено. Вы в главном меню."
+MAIN_MENU_TEXT = "🏠 Вы в главном меню. Чем могу помочь?"
+MAIN_MENU_BUTTONS = {
+    "❌ Отмена": CANCEL_TEXT,
+    "🔙 В главное меню": MAIN_MENU_TEXT,
+}
 
 
-@router.message(Command("cancel"))
-async def cmd_cancel(message: types.Message, state: FSMContext):
-    """Обработчик команды /cancel"""
+@router.message(or_f(Command("cancel"), F.text.in_(MAIN_MENU_BUTTONS)))
+async def reset_to_main_menu(message: types.Message, state: FSMContext):
+    """Обработчик /cancel и кнопок 'Отмена' и 'В главное меню'"""
     await state.clear()
     await safe_send_message(
         message,
-        "❌ Действие отменено. Вы в главном меню.",
+        MAIN_MENU_BUTTONS.get(message.text, CANCEL_TEXT),
         reply_markup=get_main_keyboard()
     )
 
 
-@router.message(F.text == "❌ Отмена")
-async def btn_cancel(message: types.Message, state: FSMContext):
-    """Обработчик кнопки Отмена"""
-    await state.clear()
-    await safe_send_message(
-        message,
-        "❌ Действие отменено. Вы в главном меню.",
-        reply_markup=get_main_keyboard()
-    )
+@lru_cache(maxsize=32)
+def _render_service_info(name: str, description: Optional[str], indications: Optional[str],
+                         duration: Optional[str], methods: Optional[str], recovery: Optional[str],
+                         price_range: Optional[str]) -> Tuple[str, ...]:
+    """Формирует описание услуги (HTML), уже разбитое на части для Telegram"""
+    info_text = f"""📋 <b>{html.escape(name)}</b>
 
+{html.escape(description or '')}
 
-@router.message(F.text == "🔙 В главное меню")
-async def btn_main_menu(message: types.Message, state: FSMContext):
-    """Обработчик кнопки возврата в главное меню"""
-    await state.clear()
-    await safe_send_message(
-        message,
-        "🏠 Вы в главном меню. Чем могу помочь?",
-        reply_markup=get_main_keyboard()
-    )
+📍 <b>Показания:</b>
+{html.escape(indications or 'Консультация хирурга')}
 
+⏰ <b>Длительность:</b>
+{html.escape(duration or '1-2 часа')}
 
-@router.message(F.text == "📋 Узнать об услуге")
-async def btn_service_info(message: types.Message, session: AsyncSession):
-    """Обработчик кнопки 'Узнать об услуге'"""
-    service_repo = ServiceRepository(session)
-    services = await service_repo.get_all()
+🔧 <b>Методики:</b>
+{html.escape(methods or 'Хирургическая, трансконъюнктивальная')}
+
+🏥 <b>Реабилитация:</b>
+{html.escape(recovery or '7-10 дней')}
+
+💰 <b>Стоимость:</b>
+{html.escape(price_range or 'от 50 000 рублей')}
+
+Хотите задать конкретный вопрос или записаться на консультацию?"""
     
-    if services:
-        service = services[0]  # Берем первую услугу (блефаропластика)
-        
-        info_text = f"""📋 *{service.name}*
+    # Разделяем длинное сообщение на части
+    return tuple(split_message(info_text))
+
 
-{service.description or ''}
+@lru_cache(maxsize=32)
+def _render_price_text(name: str, price_range: Optional[str]) -> str:
+    """Формирует текст с ценами на услугу (HTML)"""
+    return f"""💰 <b>Цены на {html.escape(name)}</b>
 
-📍 *Показания:*
-{service.indications or 'Консультация хирурга'}
+{html.escape(price_range or 'от 50 000 до 120 000 рублей')}
 
-⏰ *Длительность:*
-{service.duration or '1-2 часа'}
+Стоимость зависит от:
+• Сложности операции
+• Выбранной методики
+• Индивидуальных особенностей
+• Необходимости госпитализации
 
-🔧 *Методики:*
-{service.methods or 'Хирургическая, трансконъюнктивальная'}
+💡 <b>Точную стоимость назовет хирург после очной консультации.</b>
 
-🏥 *Реабилитация:*
-{service.recovery or '7-10 дней'}
+Хотите записаться на бесплатную консультацию?"""
 
-💰 *Стоимость:*
-{service.price_range or 'от 50 000 рублей'}
 
-Хотите задать конкретный вопрос или записаться на консультацию?"""
+@router.message(F.text == "📋 Узнать об услуге")
+async def btn_service_info(message: types.Message, session: AsyncSession):
+    """Обработчик кнопки 'Узнать об услуге'"""
+    services = await service_cache.get_all(session)
+    
+    if services:
+        service = services[0]  # Берем первую услугу (блефаропластика)
         
-        # Разделяем длинное сообщение на части
-        message_parts = split_message(info_text)
+        # Текст и его разбиение на части кэшируются по содержимому услуги
+        message_parts = _render_service_info(
+            service.name, service.description, service.indications, service.duration,
+            service.methods, service.recovery, service.price_range
+        )
         
         # Отправляем части сообщения безопасно
-        await safe_send_messages(message, message_parts, parse_mode="Markdown")
+        await safe_send_messages(message, message_parts, parse_mode="HTML")
     else:
         await safe_send_message(
             message,
@@ -163,27 +242,14 @@ async def btn_service_info(message: types.Message, session: AsyncSession):
 @router.message(F.text == "💰 Цены")
 async def btn_prices(message: types.Message, session: AsyncSession):
     """Обработчик кнопки 'Цены'"""
-    service_repo = ServiceRepository(session)
-    services = await service_repo.get_all()
+    services = await service_cache.get_all(session)
     
     if services:
         service = services[0]
         
-        price_text = f"""💰 *Цены на {service.name}*
-
-{service.price_range or 'от 50 000 до 120 000 рублей'}
-
-Стоимость зависит от:
-• Сложности операции
-• Выбранной методики
-• Индивидуальных особенностей
-• Необходимости госпитализации
-
-💡 *Точную стоимость назовет хирург после очной консультации.*
-
-Хотите записаться на бесплатную консультацию?"""
+        price_text = _render_price_text(service.name, service.price_range)
         
-        await safe_send_message(message, price_text, parse_mode="Markdown")
+        await safe_send_message(message, price_text, parse_mode="HTML")
     else:
         await safe_send_message(
             message,
@@ -193,40 +259,18 @@ async def btn_prices(message: types.Message, session: AsyncSession):
 
 
 @router.message(F.text == "👨‍💼 Связаться с менеджером")
-async def btn_contact_manager(message: types.Message, session: AsyncSession):
+async def btn_contact_manager(message: types.Message, user: User):
     """Обработчик кнопки 'Связаться с менеджером'"""
-    user_repo = UserRepository(session)
-    user = await user_repo.get_or_create(
-        telegram_id=message.from_user.id,
-        username=message.from_user.username,
-        first_name=message.from_user.first_name,
-        last_name=message.from_user.last_name
-    )
-    
     # Здесь можно добавить логику отправки уведомления менеджеру
     # Например, отправить сообщение в админ-чат
     
-    contact_text = f"""👨‍💼 *Связь с менеджером*
-
-Ваш запрос передан живому менеджеру клиники.
-
-📞 *Телефон клиники:* {settings.clinic_phone}
-📧 *Email:* {settings.clinic_email}
-
-⏰ *Время работы:* Пн-Пт с 9:00 до 18:00
-
-Менеджер свяжется с вами в течение 15 минут в рабочее время.
-
-Могу я помочь вам с чем-то еще пока вы ждете?"""
-    
-    await safe_send_message(message, contact_text, parse_mode="Markdown")
+    await safe_send_message(message, CONTACT_TEXT, parse_mode="HTML")
     
     # Логируем запрос
-    chat_log_repo = ChatLogRepository(session)
-    await chat_log_repo.create(
+    chat_log_writer.log(
         user_id=user.id,
         message="Связаться с менеджером",
-        response=contact_text,
+        response=CONTACT_TEXT,
         intent="contact_manager"
     )
 
@@ -234,46 +278,17 @@ async def btn_contact_manager(message: types.Message, session: AsyncSession):
 @router.message(F.text == "❓ Частые вопросы")
 async def btn_faq(message: types.Message):
     """Обработчик кнопки 'Частые вопросы'"""
-    from keyboards.reply_keyboards import get_faq_categories_keyboard
-    
-    faq_text = """❓ *Частые вопросы*
-
-Выберите категорию вопросов, которая вас интересует:
-
-💰 Цены и стоимость
-⏰ Длительность и реабилитация  
-⚕️ Безопасность и риски
-📋 Подготовка к операции
-🏥 Общие вопросы"""
-    
-    await safe_send_message(message, faq_text, parse_mode="Markdown", reply_markup=get_faq_categories_keyboard())
+    await safe_send_message(message, FAQ_TEXT, parse_mode="HTML", reply_markup=get_faq_categories_keyboard())
 
 
 @router.message(F.text == "ℹ️ О клинике")
 async def btn_about_clinic(message: types.Message):
     """Обработчик кнопки 'О клинике'"""
-    about_text = f"""🏥 *О клинике "{settings.clinic_name}"*
-
-Наша клиника специализируется на пластической хирургии премиум-класса.
-
-✅ *Наши преимущества:*
-• Опытные хирурги с международной сертификацией
-• Современное оборудование
-• Индивидуальный подход к каждому пациенту
-• Конфиденциальность и безопасность
-• Гарантия качества
-
-📍 *Адрес:* Москва, ул. Примерная, д. 123
-📞 *Телефон:* {settings.clinic_phone}
-🌐 *Сайт:* med-plastic.ru
-
-Готова ответить на ваши вопросы о процедурах!"""
-    
-    await safe_send_message(message, about_text, parse_mode="Markdown")
+    await safe_send_message(message, ABOUT_TEXT, parse_mode="HTML")
 
 
 @router.message()
-async def handle_text_message(message: types.Message, session: AsyncSession, state: FSMContext):
+async def handle_text_message(message: types.Message, session: AsyncSession, state: FSMContext, user: User):
     """Обработчик текстовых сообщений (вопросы пользователей)"""
     
     # Проверяем, не в процессе ли записи на консультацию
@@ -281,26 +296,15 @@ async def handle_text_message(message: types.Message, session: AsyncSession, sta
     if current_state:
         return  # Если в процессе FSM, обрабатываем в других хендлерах
     
-    user_repo = UserRepository(session)
-    user = await user_repo.get_or_create(
-        telegram_id=message.from_user.id,
-        username=message.from_user.username,
-        first_name=message.from_user.first_name,
-        last_name=message.from_user.last_name
-    )
-    
-    # Получаем историю диалога
-    chat_log_repo = ChatLogRepository(session)
-    history = await chat_log_repo.get_user_logs(user.id, limit=5)
+    # Формируем контекст для LLM
+    service_context = await service_cache.get_service_context(session)
     
-    # Формируем контекст для LLM с улучшенной историей диалога
-    service_repo = ServiceRepository(session)
-    services = await service_repo.get_all()
-    
-    # Получаем историю диалога с ответами бота
+    # История нужна модели только для медицинских вопросов: для остальных в БД не ходим
     chat_history = []
-    if history:
-        for log in reversed(history[-6:]):  # Берем больше сообщений для контекста
+    if uses_history(message.text or ""):
+        chat_log_repo = ChatLogRepository(session)
+        history = await chat_log_repo.get_user_logs(user.id, limit=HISTORY_EXCHANGES)
+        for log in history:  # Последние обмены в хронологическом порядке
             # Добавляем сообщение пользователя
             chat_history.append({'role': 'user', 'text': log.message})
             # Добавляем ответ бота
@@ -308,29 +312,95 @@ async def handle_text_message(message: types.Message, session: AsyncSession, sta
                 chat_history.append({'role': 'assistant', 'text': log.response})
     
     context = {
-        'service': services[0].__dict__ if services else None,
+        'service': service_context,
         'history': chat_history
     }
     
-    # Используем только GPT-4o-mini для всех ответов
-    response = await openai_service.generate_response(message.text, context)
+    # Показываем, что бот печатает, и отвечаем в фоне: сессия БД и
+    # обработчик освобождаются, пока идет запрос к OpenAI
+    try:
+        await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+    except Exception as e:
+        logger.warning(f"Failed to send chat action: {e}")
     
-    # Если GPT недоступен, даем стандартный ответ
-    if not response:
-        response = """Понимаю ваш вопрос. Чтобы дать вам точную информацию, 
-пожалуйста, выберите конкретную тему из главного меню или 
-свяжитесь с живым менеджером для детальной консультации."""
-    
-    # Разделяем длинное сообщение на части
-    message_parts = split_message(response)
+    task = asyncio.create_task(_answer_and_log(message, user.id, context))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class _DraftReply:
+    """Ответ, который показывается пользователю и дописывается по мере генерации"""
     
-    # Отправляем части сообщения безопасно
-    await safe_send_messages(message, message_parts)
+    def __init__(self, message: types.Message):
+        self.message = message
+        self.sent: Optional[types.Message] = None
+        self.shown = ""
     
-    # Логируем диалог (полный ответ)
-    await chat_log_repo.create(
-        user_id=user.id,
-        message=message.text,
-        response=response,
-        intent="question"
-    )
+    async def show(self, text: str) -> bool:
+        """Отправляет или редактирует сообщение с ответом; текст экранируется под HTML"""
+        if text == self.shown:
+            return True
+        try:
+            if self.sent is None:
+                self.sent = await self.message.answer(html.escape(text))
+            else:
+                await self.sent.edit_text(html.escape(text))
+        except Exception as e:
+            logger.warning(f"Failed to show streamed answer: {e}")
+            return False
+        self.shown = text
+        return True
+
+
+async def _stream_answer(message: types.Message, context: Dict, draft: _DraftReply) -> str:
+    """Получает ответ GPT потоком, обновляя черновик не чаще STREAM_EDIT_INTERVAL"""
+    loop = asyncio.get_running_loop()
+    text = ""
+    last_edit = 0.0  # Первый фрагмент показываем сразу
+    try:
+        async for piece in openai_service.stream_response(message.text, context):
+            text += piece
+            if loop.time() - last_edit >= STREAM_EDIT_INTERVAL and text.strip():
+                await draft.show(trim_response(text.strip()))
+                last_edit = loop.time()
+    except Exception as e:
+        logger.error(f"Error streaming OpenAI response: {e}")
+    return text.strip()
+
+
+async def _answer_and_log(message: types.Message, user_id: int, context: Dict):
+    """Получает ответ GPT, отправляет его и логирует диалог (фоновая задача)"""
+    try:
+        # Используем только GPT-4o-mini для всех ответов; первые фрагменты
+        # пользователь видит, пока ответ еще генерируется
+        draft = _DraftReply(message)
+        async with _get_openai_semaphore():
+            response = await _stream_answer(message, context, draft)
+        
+        # Если GPT недоступен, даем стандартный ответ
+        if response:
+            response = trim_response(response)
+        else:
+            response = """Понимаю ваш вопрос. Чтобы дать вам точную информацию, 
+пожалуйста, выберите конкретную тему из главного меню или 
+свяжитесь с живым менеджером для детальной консультации."""
+        
+        if draft.sent is not None:
+            # Черновик уже на экране: дописываем в него полный ответ
+            await draft.show(response)
+        else:
+            # Разделяем длинное сообщение на части
+            message_parts = split_message(response)
+            
+            # Ответ модели отправляется как текст: экранируем каждую часть под HTML
+            await safe_send_messages(message, [html.escape(part) for part in message_parts])
+        
+        # Логируем диалог (полный ответ)
+        chat_log_writer.log(
+            user_id=user_id,
+            message=message.text,
+            response=response,
+            intent="question"
+        )
+    except Exception as e:
+        logger.error(f"Error answering user question: {e}", exc_info=True)
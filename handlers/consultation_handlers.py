@@ -1,25 +1,68 @@
+import html
 import logging
+import re
 from aiogram import Router, F, types
+from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, date
+from datetime import date
+from typing import Optional
 
-from models.repositories import UserRepository, ServiceRepository, ConsultationRequestRepository, ChatLogRepository
+from models.database import User
+from models.repositories import UserRepository, ConsultationRequestRepository
 from keyboards.reply_keyboards import get_services_keyboard, get_confirmation_keyboard, get_main_keyboard
-from states.consultation import ConsultationStates
+from keyboards.callbacks import ServiceCB
+from states.consultation import (
+    ConsultationStates, ENTERING_NAME, ENTERING_PHONE, ENTERING_DATE, ENTERING_COMMENT,
+)
+from services.service_cache import service_cache
+from services.chat_log_writer import chat_log_writer
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+PHONE_RE = re.compile(r'^(\+7|8)\d{10}$')
+PHONE_STRIP_TABLE = str.maketrans('', '', ' -()')
 
-@router.callback_query(F.data.startswith("service_"))
-async def select_service(callback: types.CallbackQuery, session: AsyncSession, state: FSMContext):
+# ДД.ММ.ГГГГ, ДД.ММ.ГГ, ДД-ММ-ГГГГ, ДД-ММ-ГГ (разделитель должен быть одинаковым)
+DATE_RE = re.compile(r'^(\d{1,2})([.\-])(\d{1,2})\2(\d{4}|\d{2})$')
+ANY_TIME_PHRASES = frozenset(('удобно в любое время', 'любое время', 'когда удобно'))
+
+
+def parse_preferred_date(date_input: str) -> Optional[date]:
+    """Разбирает дату консультации, возвращает None если формат неверный или дата в прошлом"""
+    match = DATE_RE.match(date_input)
+    if not match:
+        return None
+    
+    day, _, month, year = match.groups()
+    year = int(year)
+    if year < 100:
+        year += 2000
+    
+    try:
+        parsed_date = date(year, int(month), int(day))
+    except ValueError:
+        return None
+    
+    # Проверяем, что дата не в прошлом
+    return parsed_date if parsed_date >= date.today() else None
+
+
+def preferred_date_from_state(data: dict) -> Optional[date]:
+    """Дата консультации из данных FSM (хранится строкой ISO или None)"""
+    value = data.get('preferred_date')
+    return date.fromisoformat(value) if value else None
+
+
+@router.callback_query(ServiceCB.filter())
+async def select_service(callback: types.CallbackQuery, callback_data: ServiceCB,
+                         session: AsyncSession, state: FSMContext):
     """Выбор услуги для консультации"""
-    service_id = int(callback.data.split("_")[1])
+    service_id = callback_data.id
     
-    service_repo = ServiceRepository(session)
-    service = await service_repo.get_by_id(service_id)
+    service = await service_cache.get_by_id(session, service_id)
     
     if not service:
         await callback.answer("❌ Услуга не найдена", show_alert=True)
@@ -32,14 +75,14 @@ async def select_service(callback: types.CallbackQuery, session: AsyncSession, s
     await state.set_state(ConsultationStates.entering_name)
     
     await callback.message.edit_text(
-        f"✅ Выбрана услуга: *{service.name}*\n\n"
+        f"✅ Выбрана услуга: <b>{html.escape(service.name)}</b>\n\n"
         "Теперь, пожалуйста, введите ваше имя:",
-        parse_mode="Markdown"
+        parse_mode="HTML"
     )
     await callback.answer()
 
 
-@router.message(ConsultationStates.entering_name)
+@router.message(StateFilter(ENTERING_NAME))
 async def process_name(message: types.Message, state: FSMContext):
     """Обработка ввода имени"""
     name = message.text.strip()
@@ -56,22 +99,20 @@ async def process_name(message: types.Message, state: FSMContext):
     await state.set_state(ConsultationStates.entering_phone)
     
     await message.answer(
-        f"✅ Приятно познакомиться, {name}!\n\n"
+        f"✅ Приятно познакомиться, {html.escape(name)}!\n\n"
         "Теперь, пожалуйста, введите ваш номер телефона в формате +7XXXYYYZZZZ:",
         reply_markup=types.ReplyKeyboardRemove()
     )
 
 
-@router.message(ConsultationStates.entering_phone)
+@router.message(StateFilter(ENTERING_PHONE))
 async def process_phone(message: types.Message, state: FSMContext):
     """Обработка ввода телефона"""
-    phone = message.text.strip()
+    # Убираем пробелы, дефисы и скобки за один проход
+    phone = message.text.strip().translate(PHONE_STRIP_TABLE)
     
     # Простая валидация телефона
-    import re
-    phone_pattern = r'^(\+7|8)\d{10}$'
-    
-    if not re.match(phone_pattern, phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')):
+    if not PHONE_RE.match(phone):
         await message.answer(
             "❌ Неверный формат телефона. Пожалуйста, введите номер в формате +7XXXXXXXXXX:",
             reply_markup=types.ReplyKeyboardRemove()
@@ -94,46 +135,29 @@ async def process_phone(message: types.Message, state: FSMContext):
     )
 
 
-@router.message(ConsultationStates.entering_date)
+@router.message(StateFilter(ENTERING_DATE))
 async def process_date(message: types.Message, state: FSMContext):
     """Обработка ввода даты"""
     date_input = message.text.strip()
     preferred_date = None
     
-    if date_input.lower() not in ['удобно в любое время', 'любое время', 'когда удобно']:
-        # Пытаемся распарсить дату
-        try:
-            # Поддерживаем разные форматы
-            for fmt in ('%d.%m.%Y', '%d.%m.%y', '%d-%m-%Y', '%d-%m-%y'):
-                try:
-                    parsed_date = datetime.strptime(date_input, fmt).date()
-                    # Проверяем, что дата не в прошлом
-                    if parsed_date >= date.today():
-                        preferred_date = parsed_date
-                        break
-                except ValueError:
-                    continue
-            
-            if preferred_date is None:
-                await message.answer(
-                    "❌ Неверный формат даты или дата в прошлом. "
-                    "Пожалуйста, введите дату в формате ДД.ММ.ГГГГ "
-                    "или напишите 'удобно в любое время':",
-                    reply_markup=types.ReplyKeyboardRemove()
-                )
-                return
-                
-        except Exception:
+    if date_input.lower() not in ANY_TIME_PHRASES:
+        preferred_date = parse_preferred_date(date_input)
+        
+        if preferred_date is None:
             await message.answer(
-                "❌ Не удалось распознать дату. "
+                "❌ Неверный формат даты или дата в прошлом. "
                 "Пожалуйста, введите дату в формате ДД.ММ.ГГГГ "
                 "или напишите 'удобно в любое время':",
                 reply_markup=types.ReplyKeyboardRemove()
             )
             return
     
-    # Сохраняем дату и переходим к комментарию
-    await state.update_data(preferred_date=preferred_date, date_input=date_input)
+    # Сохраняем дату (строкой ISO: данные FSM в Redis сериализуются в JSON) и переходим к комментарию
+    await state.update_data(
+        preferred_date=preferred_date.isoformat() if preferred_date else None,
+        date_input=date_input,
+    )
     await state.set_state(ConsultationStates.entering_comment)
     
     await message.answer(
@@ -147,14 +171,14 @@ async def process_date(message: types.Message, state: FSMContext):
     )
 
 
-@router.message(ConsultationStates.entering_comment, F.text == "Пропустить")
+@router.message(StateFilter(ENTERING_COMMENT), F.text == "Пропустить")
 async def skip_comment(message: types.Message, state: FSMContext):
     """Пропуск комментария"""
     await state.update_data(comment="")
     await show_confirmation(message, state)
 
 
-@router.message(ConsultationStates.entering_comment)
+@router.message(StateFilter(ENTERING_COMMENT))
 async def process_comment(message: types.Message, state: FSMContext):
     """Обработка комментария"""
     comment = message.text.strip()
@@ -166,42 +190,32 @@ async def show_confirmation(message: types.Message, state: FSMContext):
     """Показываем подтверждение записи"""
     data = await state.get_data()
     
-    confirmation_text = f"""📋 *Проверьте данные для записи:*
+    confirmation_text = f"""📋 <b>Проверьте данные для записи:</b>
 
-👤 Имя: {data['name']}
+👤 Имя: {html.escape(data['name'])}
 📞 Телефон: {data['phone']}
-🏥 Услуга: {data['service_name']}
-📅 Дата: {data.get('date_input', 'удобно в любое время')}
-💬 Комментарий: {data.get('comment', 'нет')}
+🏥 Услуга: {html.escape(data['service_name'])}
+📅 Дата: {html.escape(data.get('date_input', 'удобно в любое время'))}
+💬 Комментарий: {html.escape(data.get('comment', 'нет'))}
 
 Все верно? Подтвердите запись или отмените."""
     
     await message.answer(
         confirmation_text,
-        parse_mode="Markdown",
+        parse_mode="HTML",
         reply_markup=get_confirmation_keyboard()
     )
 
 
 @router.callback_query(F.data == "confirm_request")
-async def confirm_request(callback: types.CallbackQuery, session: AsyncSession, state: FSMContext):
+async def confirm_request(callback: types.CallbackQuery, session: AsyncSession, state: FSMContext, user: User):
     """Подтверждение записи на консультацию"""
     data = await state.get_data()
     
     try:
-        # Получаем пользователя
-        user_repo = UserRepository(session)
-        user = await user_repo.get_or_create(
-            telegram_id=callback.from_user.id,
-            username=callback.from_user.username,
-            first_name=callback.from_user.first_name,
-            last_name=callback.from_user.last_name,
-            phone=data.get('phone')  # Сохраняем телефон если есть
-        )
-        
-        # Обновляем телефон пользователя
+        # Обновляем телефон пользователя (сам пользователь получен в UserMiddleware)
         if not user.phone and data.get('phone'):
-            await user_repo.update_phone(user.id, data['phone'])
+            await UserRepository(session).update_phone(user.id, data['phone'])
         
         # Создаем заявку на консультацию
         request_repo = ConsultationRequestRepository(session)
@@ -210,51 +224,55 @@ async def confirm_request(callback: types.CallbackQuery, session: AsyncSession,
             service_id=data['service_id'],
             name=data['name'],
             phone=data['phone'],
-            preferred_date=data.get('preferred_date'),
+            preferred_date=preferred_date_from_state(data),
             comment=data.get('comment', ''),
             status='new'
         )
         
-        # Очищаем состояние
-        await state.clear()
-        
-        # Отправляем подтверждение
-        success_text = f"""✅ *Заявка успешно создана!*
+        success_text = f"""✅ <b>Заявка успешно создана!</b>
 
-📝 *Номер заявки:* #{consultation_request.id}
-👤 *Имя:* {data['name']}
-📞 *Телефон:* {data['phone']}
-🏥 *Услуга:* {data['service_name']}
+📝 <b>Номер заявки:</b> #{consultation_request.id}
+👤 <b>Имя:</b> {html.escape(data['name'])}
+📞 <b>Телефон:</b> {data['phone']}
+🏥 <b>Услуга:</b> {html.escape(data['service_name'])}
 
 Наш менеджер свяжется с вами в течение 2 часов в рабочее время 
 для подтверждения времени консультации.
 
-⏰ *Время работы:* Пн-Пт с 9:00 до 18:00
-📞 *Телефон клиники:* {settings.clinic_phone}
+⏰ <b>Время работы:</b> Пн-Пт с 9:00 до 18:00
+📞 <b>Телефон клиники:</b> {html.escape(settings.clinic_phone)}
 
-Спасибо за обращение в клинику "{settings.clinic_name}"!"""
+Спасибо за обращение в клинику "{html.escape(settings.clinic_name)}"!"""
         
-        await callback.message.edit_text(
-            success_text,
-            parse_mode="Markdown",
-            reply_markup=get_main_keyboard()
-        )
+        # Фиксируем все изменения одной транзакцией до ответа пользователю
+        await session.commit()
         
         # Логируем создание заявки
-        chat_log_repo = ChatLogRepository(session)
-        await chat_log_repo.create(
+        chat_log_writer.log(
             user_id=user.id,
             message="Запись на консультацию",
             response=success_text,
             intent="consultation_request"
         )
         
+        # Очищаем состояние
+        await state.clear()
+        
+        # Отправляем подтверждение (edit_text принимает только inline-клавиатуру,
+        # поэтому главное меню приходит отдельным сообщением)
+        await callback.message.edit_text(success_text, parse_mode="HTML")
+        await callback.message.answer(
+            "🏠 Вы в главном меню. Чем могу помочь?",
+            reply_markup=get_main_keyboard()
+        )
+        
         await callback.answer("✅ Заявка создана!")
         
         # Здесь можно добавить отправку уведомления админу
         
     except Exception as e:
         logger.error(f"Error creating consultation request: {e}")
+        await session.rollback()
         await callback.answer("❌ Ошибка при создании заявки", show_alert=True)
 
 
@@ -263,8 +281,8 @@ async def cancel_consultation(callback: types.CallbackQuery, state: FSMContext):
     """Отмена записи на консультацию"""
     await state.clear()
     
-    await callback.message.edit_text(
-        "❌ Запись на консультацию отменена.\n\n"
+    await callback.message.edit_text("❌ Запись на консультацию отменена.")
+    await callback.message.answer(
         "Вы в главном меню. Чем могу помочь?",
         reply_markup=get_main_keyboard()
     )
@@ -277,8 +295,7 @@ async def start_consultation(message: types.Message, session: AsyncSession, stat
     await state.clear()
     
     # Получаем список услуг
-    service_repo = ServiceRepository(session)
-    services = await service_repo.get_all()
+    services = await service_cache.get_all(session)
     
     if not services:
         await message.answer(
@@ -290,8 +307,8 @@ async def start_consultation(message: types.Message, session: AsyncSession, stat
     
     # Показываем выбор услуги
     await message.answer(
-        "📅 *Запись на консультацию*\n\n"
+        "📅 <b>Запись на консультацию</b>\n\n"
         "Пожалуйста, выберите услугу:",
-        parse_mode="Markdown",
+        parse_mode="HTML",
         reply_markup=get_services_keyboard(services)
     )
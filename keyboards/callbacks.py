@@ -0,0 +1,20 @@
+from aiogram.filters.callback_data import CallbackData
+
+
+class ServiceCB(CallbackData, prefix="service"):
+    """Выбор услуги при записи на консультацию"""
+    
+    id: int
+
+
+class FAQCategoryCB(CallbackData, prefix="category"):
+    """Выбор категории FAQ"""
+    
+    name: str
+
+
+class RequestActionCB(CallbackData, prefix="request"):
+    """Действие админа над заявкой: contact, appoint, cancel, complete"""
+    
+    action: str
+    id: int
@@ -1,7 +1,22 @@
+from functools import lru_cache
+from typing import Tuple
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
+from keyboards.callbacks import ServiceCB, FAQCategoryCB, RequestActionCB
 
+# Клавиатуры неизменяемы, поэтому строятся один раз и переиспользуются между апдейтами
+
+FAQ_CATEGORIES = (
+    ("💰 Цены и стоимость", "price"),
+    ("⏰ Длительность и реабилитация", "recovery"),
+    ("⚕️ Безопасность и риски", "safety"),
+    ("📋 Подготовка к операции", "preparation"),
+    ("🏥 Общие вопросы", "general"),
+)
+
+
+@lru_cache(maxsize=None)
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     """Основная клавиатура с главными опциями"""
     builder = ReplyKeyboardBuilder()
@@ -24,13 +39,19 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
 
 def get_services_keyboard(services: list) -> InlineKeyboardMarkup:
     """Клавиатура с выбором услуг"""
+    return _build_services_keyboard(tuple((service.id, service.name) for service in services))
+
+
+@lru_cache(maxsize=256)
+def _build_services_keyboard(services: Tuple[Tuple[int, str], ...]) -> InlineKeyboardMarkup:
+    """Строит клавиатуру услуг по парам (id, название)"""
     builder = InlineKeyboardBuilder()
     
-    for service in services:
+    for service_id, name in services:
         builder.row(
             InlineKeyboardButton(
-                text=service.name,
-                callback_data=f"service_{service.id}"
+                text=name,
+                callback_data=ServiceCB(id=service_id).pack()
             )
         )
     
@@ -41,6 +62,7 @@ def get_services_keyboard(services: list) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения записи"""
     builder = InlineKeyboardBuilder()
@@ -53,6 +75,7 @@ def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_admin_keyboard() -> ReplyKeyboardMarkup:
     """Админская клавиатура"""
     builder = ReplyKeyboardBuilder()
@@ -72,6 +95,7 @@ def get_admin_keyboard() -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура с кнопкой отмены"""
     builder = ReplyKeyboardBuilder()
@@ -81,21 +105,14 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+@lru_cache(maxsize=None)
 def get_faq_categories_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура категорий FAQ"""
     builder = InlineKeyboardBuilder()
     
-    categories = [
-        ("💰 Цены и стоимость", "category_price"),
-        ("⏰ Длительность и реабилитация", "category_recovery"),
-        ("⚕️ Безопасность и риски", "category_safety"),
-        ("📋 Подготовка к операции", "category_preparation"),
-        ("🏥 Общие вопросы", "category_general"),
-    ]
-    
-    for text, callback_data in categories:
+    for text, category in FAQ_CATEGORIES:
         builder.row(
-            InlineKeyboardButton(text=text, callback_data=callback_data)
+            InlineKeyboardButton(text=text, callback_data=FAQCategoryCB(name=category).pack())
         )
     
     builder.row(
@@ -105,17 +122,18 @@ def get_faq_categories_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=256)
 def get_request_status_keyboard(request_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для управления статусом заявки (админ)"""
     builder = InlineKeyboardBuilder()
     
     builder.row(
-        InlineKeyboardButton(text="📞 Связаться", callback_data=f"contact_{request_id}"),
-        InlineKeyboardButton(text="📅 Назначить", callback_data=f"appoint_{request_id}"),
+        InlineKeyboardButton(text="📞 Связаться", callback_data=RequestActionCB(action="contact", id=request_id).pack()),
+        InlineKeyboardButton(text="📅 Назначить", callback_data=RequestActionCB(action="appoint", id=request_id).pack()),
     )
     builder.row(
-        InlineKeyboardButton(text="❌ Отменить", callback_data=f"cancel_{request_id}"),
-        InlineKeyboardButton(text="✅ Завершить", callback_data=f"complete_{request_id}"),
+        InlineKeyboardButton(text="❌ Отменить", callback_data=RequestActionCB(action="cancel", id=request_id).pack()),
+        InlineKeyboardButton(text="✅ Завершить", callback_data=RequestActionCB(action="complete", id=request_id).pack()),
     )
     
     return builder.as_markup()
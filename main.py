@@ -1,26 +1,123 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
+import random
+import ssl
+from typing import Final, Optional
+import certifi
+import orjson
+from aiogram import Bot, Dispatcher, __version__ as aiogram_version
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.utils.backoff import BackoffConfig
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import ClientSession, TCPConnector, hdrs, web
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.settings import settings
 from utils.logger import setup_logging
-from models.base import create_db, async_session_maker
+from utils.rate_limiter import RateLimitMiddleware, telegram_rate_limiter
+from models.base import create_db, dispose_engine, warm_up_pool, async_session_maker
 from handlers.basic_handlers import router as basic_router
 from handlers.consultation_handlers import router as consultation_router
 from services.parser import WebsiteParser
 from services.website_content_service import website_content_service
-from models.repositories import ServiceRepository
+from services.service_cache import service_cache
+from services.openai_service import openai_service
+from services.chat_log_writer import chat_log_writer
+from services.http_session import close_session as close_http_session
+from models.repositories import ServiceRepository, UserRepository, ConsultationStatsRepository
+
+# Типы обновлений, которые получает бот (и polling'ом, и вебхуком)
+ALLOWED_UPDATES: Final[list] = ["message", "callback_query", "inline_query"]
+
+# Максимальная задержка перед перезапуском polling, секунды
+POLLING_BACKOFF_MAX = 60.0
+
+# Пул соединений с Bot API: размер, время жизни простаивающего соединения
+# и таймаут одного запроса (к getUpdates aiogram прибавляет polling_timeout), секунды
+BOT_API_CONNECTION_LIMIT = 100
+BOT_API_KEEPALIVE_TIMEOUT = 75
+BOT_API_TIMEOUT = 30
+
+# Время хранения незавершенных сценариев (записи на консультацию) в Redis, секунды
+FSM_STATE_TTL = 24 * 60 * 60
+
+# Услуга, которая добавляется, если распарсить сайт клиники не удалось
+DEFAULT_SERVICE: Final[dict] = {
+    'name': 'Блефаропластика верхних век',
+    'description': 'Пластика верхних век (блефаропластика) - хирургическая процедура по коррекции возрастных изменений верхних век.',
+    'indications': 'Нависание кожи верхних век, избыточная кожа, мешки под глазами, ухудшение поля зрения.',
+    'methods': 'Хирургическая блефаропластика, трансконъюнктивальная методика.',
+    'duration': '1-2 часа',
+    'recovery': '7-10 дней - отек и синяки, 2 недели - снятие швов, 1 месяц - возврат к обычной жизни.',
+    'price_range': 'от 50 000 до 120 000 рублей',
+    'source_url': settings.clinic_website
+}
+
+
+def orjson_dumps(obj) -> str:
+    """json_dumps для aiogram: orjson отдает bytes, сессии нужна строка"""
+    return orjson.dumps(obj).decode()
+
+
+class BotAPISession(AiohttpSession):
+    """
+    HTTP-сессия Bot API со своим пулом keep-alive соединений
+    
+    Коннектор создается здесь, а не из внутренних параметров AiohttpSession:
+    простаивающие TLS-соединения держим дольше стандартных 15 секунд aiohttp.
+    Прокси эта сессия не поддерживает.
+    """
+    
+    def __init__(self, limit: int, keepalive_timeout: float, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self._client: Optional[ClientSession] = None
+    
+    async def create_session(self) -> ClientSession:
+        if self._client is None or self._client.closed:
+            self._client = ClientSession(
+                connector=TCPConnector(
+                    ssl=ssl.create_default_context(cafile=certifi.where()),
+                    limit=self.limit,
+                    ttl_dns_cache=3600,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                headers={hdrs.USER_AGENT: f"aiogram/{aiogram_version}"},
+            )
+        return self._client
+    
+    async def close(self) -> None:
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
+            # Даем SSL-соединениям закрыться, как это делает aiogram
+            await asyncio.sleep(0.25)
+
+
+def create_bot_session() -> AiohttpSession:
+    """HTTP-сессия Bot API: orjson для JSON и пул keep-alive соединений"""
+    return BotAPISession(
+        limit=BOT_API_CONNECTION_LIMIT,
+        keepalive_timeout=BOT_API_KEEPALIVE_TIMEOUT,
+        timeout=BOT_API_TIMEOUT,
+        json_loads=orjson.loads,
+        json_dumps=orjson_dumps,
+    )
 
 
 async def init_database():
     """Инициализация базы данных и заполнение начальными данными"""
     await create_db()
+    await warm_up_pool()
     
     async with async_session_maker() as session:
+        # Пересчитываем сводку заявок (на случай записей, сделанных в обход репозитория)
+        await ConsultationStatsRepository(session).rebuild()
+        
         # Проверяем, есть ли услуги в базе
         service_repo = ServiceRepository(session)
         services = await service_repo.get_all()
@@ -36,18 +133,10 @@ async def init_database():
                 logging.info(f"Service '{service_data.get('name', 'Unknown')}' added to database")
             else:
                 # Если парсинг не удался, добавляем базовую услугу
-                default_service = {
-                    'name': 'Блефаропластика верхних век',
-                    'description': 'Пластика верхних век (блефаропластика) - хирургическая процедура по коррекции возрастных изменений верхних век.',
-                    'indications': 'Нависание кожи верхних век, избыточная кожа, мешки под глазами, ухудшение поля зрения.',
-                    'methods': 'Хирургическая блефаропластика, трансконъюнктивальная методика.',
-                    'duration': '1-2 часа',
-                    'recovery': '7-10 дней - отек и синяки, 2 недели - снятие швов, 1 месяц - возврат к обычной жизни.',
-                    'price_range': 'от 50 000 до 120 000 рублей',
-                    'source_url': settings.clinic_website
-                }
-                await service_repo.create(**default_service)
+                await service_repo.create(**DEFAULT_SERVICE)
                 logging.info("Default service added to database")
+        
+        await session.commit()
 
 
 async def main():
@@ -67,62 +156,176 @@ async def main():
     # Создание бота с улучшенными настройками
     bot = Bot(
         token=settings.bot_token,
+        session=create_bot_session(),
         default=DefaultBotProperties(
-            parse_mode="Markdown",
+            parse_mode="HTML",
             protect_content=False,
             allow_sending_without_reply=True
         )
     )
+    # Все исходящие вызовы API проходят через общий лимит частоты
+    bot.session.middleware(RateLimitMiddleware(telegram_rate_limiter))
     
     # Создание диспетчера
-    storage = MemoryStorage()
+    # Состояния FSM в Redis переживают перезапуск и доступны нескольким процессам бота
+    if settings.redis_url:
+        storage = RedisStorage.from_url(
+            settings.redis_url,
+            state_ttl=FSM_STATE_TTL,
+            data_ttl=FSM_STATE_TTL,
+            json_loads=orjson.loads,
+            json_dumps=orjson_dumps,
+        )
+    else:
+        storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
-    # Подключаем middleware для работы с БД
-    dp.update.middleware(DbSessionMiddleware())
+    # Подключаем middleware для работы с БД и получения пользователя.
+    # Они внутренние (после выбора хендлера), чтобы не трогать БД там, где она не нужна
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(DbSessionMiddleware())
+        observer.middleware(UserMiddleware())
     
     # Подключаем роутеры
     dp.include_router(basic_router)
     dp.include_router(consultation_router)
     
+    # Фоновая пакетная запись логов диалогов
+    chat_log_writer.start()
+    
     # Запуск бота
     logger.info("Bot started successfully!")
     try:
-        await dp.start_polling(
-            bot,
-            handle_signals=False,  # Отключаем автоматическую обработку сигналов
-            allowed_updates=["message", "callback_query", "inline_query"],  # Только нужные типы обновлений
-            timeout=30,  # Таймаут получения обновлений
-            close_bot_session=True  # Автоматически закрывать сессию
-        )
-    except TelegramNetworkError as e:
-        logger.error(f"Network error: {e}")
-        logger.info("Attempting to reconnect in 5 seconds...")
-        await asyncio.sleep(5)
-        # Пытаемся перезапустить
-        await dp.start_polling(bot)
-    except TelegramRetryAfter as e:
-        logger.warning(f"Rate limit exceeded. Waiting for {e.retry_after} seconds...")
-        await asyncio.sleep(e.retry_after)
-        await dp.start_polling(bot)
+        if settings.webhook_url:
+            await run_webhook(dp, bot)
+        else:
+            await run_polling(dp, bot)
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     finally:
         await bot.session.close()
+        await dp.storage.close()
+        await chat_log_writer.stop()
+        await openai_service.close()
+        await website_content_service.close()
+        await service_cache.close()
+        await close_http_session()
+        await dispose_engine()
         logger.info("Bot session closed")
 
 
+async def run_polling(dp: Dispatcher, bot: Bot):
+    """Получение обновлений long polling'ом с перезапуском при ошибках"""
+    logger = logging.getLogger(__name__)
+    # getUpdates не работает, пока у бота установлен вебхук
+    await bot.delete_webhook()
+    
+    # Ошибки getUpdates aiogram повторяет сам (backoff_config, с джиттером и
+    # сбросом после успешного запроса); здесь перезапускается упавший polling
+    backoff = 1.0
+    while True:
+        try:
+            await dp.start_polling(
+                bot,
+                handle_signals=False,  # Отключаем автоматическую обработку сигналов
+                allowed_updates=ALLOWED_UPDATES,  # Только нужные типы обновлений
+                polling_timeout=30,  # Таймаут получения обновлений
+                backoff_config=BackoffConfig(
+                    min_delay=1.0, max_delay=POLLING_BACKOFF_MAX, factor=2.0, jitter=0.1
+                ),
+                close_bot_session=False  # Сессия закрывается в main()
+            )
+            return
+        except TelegramRetryAfter as e:
+            delay = e.retry_after + random.uniform(0, 1)
+            logger.warning(f"Rate limit exceeded. Restarting polling in {delay:.1f} seconds...")
+        except TelegramNetworkError as e:
+            delay = backoff + random.uniform(0, backoff)
+            logger.error(f"Network error: {e}")
+            logger.info(f"Attempting to reconnect in {delay:.1f} seconds...")
+        backoff = min(backoff * 2, POLLING_BACKOFF_MAX)
+        await asyncio.sleep(delay)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Прием обновлений вебхуком: Telegram сам присылает их на aiohttp-сервер бота"""
+    logger = logging.getLogger(__name__)
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=settings.webhook_secret
+    ).register(app, path=settings.webhook_path)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, host=settings.webhook_host, port=settings.webhook_port)
+        await site.start()
+        await bot.set_webhook(
+            url=settings.webhook_url,
+            secret_token=settings.webhook_secret,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        logger.info(f"Webhook set to {settings.webhook_url}")
+        # Сервер работает до отмены задачи (остановки процесса)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def handler_uses(data, names) -> bool:
+    """Проверяет, принимает ли выбранный хендлер хотя бы один из аргументов names"""
+    handler_object = data.get("handler")
+    if handler_object is None or getattr(handler_object, "varkw", False):
+        return True
+    return bool(handler_object.params & names)
+
+
 class DbSessionMiddleware:
     """Middleware для добавления сессии БД в обработчики"""
     
     async def __call__(self, handler, event, data):
+        # Хендлерам без session/user (справка, FAQ, отмена) сессия не открывается
+        if not handler_uses(data, {"session", "user"}):
+            return await handler(event, data)
+        
+        # Один апдейт - одна транзакция: коммит после успешного хендлера,
+        # при исключении сессия закрывается с откатом
         async with async_session_maker() as session:
             data["session"] = session
-            return await handler(event, data)
+            result = await handler(event, data)
+            await session.commit()
+            return result
+
+
+class UserMiddleware:
+    """Middleware для получения пользователя БД один раз на апдейт"""
+    
+    async def __call__(self, handler, event, data):
+        telegram_user = data.get("event_from_user")
+        if telegram_user and handler_uses(data, {"user"}):
+            user_repo = UserRepository(data["session"])
+            data["user"] = await user_repo.upsert_by_telegram(
+                telegram_id=telegram_user.id,
+                username=telegram_user.username,
+                first_name=telegram_user.first_name,
+                last_name=telegram_user.last_name
+            )
+        return await handler(event, data)
+
+
+def install_event_loop_policy():
+    """Ставит цикл событий uvloop (libuv), если он установлен; иначе остается стандартный"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 
 if __name__ == "__main__":
     logger = logging.getLogger(__name__)
+    install_event_loop_policy()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -1,12 +1,31 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import asyncio
+from contextlib import AsyncExitStack
+from functools import lru_cache
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from config.settings import settings
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=False,  # Set to True for SQL logging
-    future=True,
-)
+
+@lru_cache(maxsize=1)
+def get_engine() -> AsyncEngine:
+    """Create the process-wide engine with a bounded connection pool"""
+    engine_kwargs = {
+        "echo": False,  # Set to True for SQL logging
+        "future": True,
+        "pool_pre_ping": True,
+    }
+    # SQLite uses its own pool, sizing options apply to server databases only
+    if not settings.database_url.startswith("sqlite"):
+        engine_kwargs.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    return create_async_engine(settings.database_url, **engine_kwargs)
+
+
+engine = get_engine()
 
 async_session_maker = async_sessionmaker(
     engine,
@@ -17,7 +36,8 @@ async_session_maker = async_sessionmaker(
 
 class Base(DeclarativeBase):
     """Base class for all models"""
-    pass
+    # Server defaults (created_at, registered_at) come back via RETURNING on flush
+    __mapper_args__ = {"eager_defaults": True}
 
 
 async def get_session() -> AsyncSession:
@@ -29,7 +49,68 @@ async def get_session() -> AsyncSession:
             await session.close()
 
 
+def _applies_to(index, dialect_name: str) -> bool:
+    """Whether an index (maybe limited with ddl_if(dialect=...)) exists on this dialect"""
+    ddl_if = getattr(index, "_ddl_if", None)
+    if ddl_if is None or ddl_if.dialect is None:
+        return True
+    dialects = (ddl_if.dialect,) if isinstance(ddl_if.dialect, str) else ddl_if.dialect
+    return dialect_name in dialects
+
+
+def _sync_schema(conn) -> bool:
+    """Create missing tables and indexes using one reflection pass
+
+    Returns True if anything was created. On an up-to-date database this
+    costs a couple of catalog queries instead of one check per table/index.
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    missing_tables = [
+        table for table in Base.metadata.sorted_tables
+        if table.name not in existing_tables
+    ]
+    existing_indexes = {
+        index["name"]
+        for indexes in inspector.get_multi_indexes().values()
+        for index in indexes
+    }
+    missing_indexes = [
+        index
+        for table in Base.metadata.sorted_tables if table.name in existing_tables
+        for index in table.indexes
+        if index.name not in existing_indexes and _applies_to(index, conn.dialect.name)
+    ]
+    if not missing_tables and not missing_indexes:
+        return False
+
+    if conn.dialect.name == "postgresql":
+        # Needed by the trigram indexes used for FAQ search
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    # New tables are created together with their indexes
+    Base.metadata.create_all(conn, tables=missing_tables, checkfirst=False)
+    for index in missing_indexes:
+        index.create(conn)
+    return True
+
+
 async def create_db():
-    """Create database tables"""
+    """Create database tables and missing indexes"""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_sync_schema)
+
+
+async def warm_up_pool():
+    """Open pool_size connections concurrently so first updates skip connect latency"""
+    if engine.dialect.name == "sqlite":
+        return
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(*(
+            stack.enter_async_context(engine.connect())
+            for _ in range(settings.db_pool_size)
+        ))
+
+
+async def dispose_engine():
+    """Close pooled connections (on shutdown)"""
+    await engine.dispose()
@@ -1,14 +1,21 @@
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Date
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Date, Index, Identity
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from models.base import Base
 
 
+# 64-битные идентификаторы; в SQLite автоинкремент работает только у INTEGER PRIMARY KEY
+IdType = BigInteger().with_variant(Integer, "sqlite")
+
+# Relationships use lazy="raise": implicit lazy loading cannot work under
+# AsyncSession anyway, so related rows must be requested with selectinload.
+
+
 class User(Base):
     """Пользователи Telegram"""
     __tablename__ = "users"
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(IdType, Identity(always=True), primary_key=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
     username = Column(String(255), nullable=True)
     first_name = Column(String(255), nullable=True)
@@ -17,8 +24,8 @@ class User(Base):
     registered_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    consultation_requests = relationship("ConsultationRequest", back_populates="user")
-    chat_logs = relationship("ChatLog", back_populates="user")
+    consultation_requests = relationship("ConsultationRequest", back_populates="user", lazy="raise")
+    chat_logs = relationship("ChatLog", back_populates="user", lazy="raise")
     
     def __repr__(self):
         return f"<User(id={self.id}, telegram_id={self.telegram_id}, first_name={self.first_name})>"
@@ -28,7 +35,7 @@ class Service(Base):
     """Услуги (спарсенные с сайта)"""
     __tablename__ = "services"
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(IdType, Identity(always=True), primary_key=True)
     name = Column(String(255), nullable=False)  # "Блефаропластика верхних век"
     description = Column(Text, nullable=True)  # полное описание
     indications = Column(Text, nullable=True)  # показания
@@ -41,7 +48,7 @@ class Service(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    consultation_requests = relationship("ConsultationRequest", back_populates="service")
+    consultation_requests = relationship("ConsultationRequest", back_populates="service", lazy="raise")
     
     def __repr__(self):
         return f"<Service(id={self.id}, name='{self.name}')>"
@@ -50,10 +57,16 @@ class Service(Base):
 class ConsultationRequest(Base):
     """Заявки на консультацию"""
     __tablename__ = "consultation_requests"
+    __table_args__ = (
+        # Фильтр по статусу + сортировка по дате (B-tree читается и в обратном порядке)
+        Index("ix_cr_status_created", "status", "created_at"),
+        # Заявки пользователя по дате; префикс user_id заодно обслуживает внешний ключ
+        Index("ix_cr_user_created", "user_id", "created_at"),
+    )
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    id = Column(IdType, Identity(always=True), primary_key=True)
+    user_id = Column(IdType, ForeignKey("users.id"), nullable=False)
+    service_id = Column(IdType, ForeignKey("services.id"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     phone = Column(String(20), nullable=False)
     preferred_date = Column(Date, nullable=True)
@@ -63,26 +76,42 @@ class ConsultationRequest(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="consultation_requests")
-    service = relationship("Service", back_populates="consultation_requests")
+    user = relationship("User", back_populates="consultation_requests", lazy="raise")
+    service = relationship("Service", back_populates="consultation_requests", lazy="raise")
     
     def __repr__(self):
         return f"<ConsultationRequest(id={self.id}, user_id={self.user_id}, status='{self.status}')>"
 
 
+class ConsultationStatsDaily(Base):
+    """Сводка заявок по дням и статусам (поддерживается при записи заявок)"""
+    __tablename__ = "consultation_stats_daily"
+    
+    date = Column(Date, primary_key=True)  # дата создания заявки
+    status = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<ConsultationStatsDaily(date={self.date}, status='{self.status}', count={self.count})>"
+
+
 class ChatLog(Base):
     """Логи диалогов (для анализа и дообучения модели)"""
     __tablename__ = "chat_logs"
+    __table_args__ = (
+        # История диалога пользователя: последние сообщения по дате
+        Index("ix_chatlog_user_created", "user_id", "created_at"),
+    )
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    id = Column(IdType, Identity(always=True), primary_key=True)
+    user_id = Column(IdType, ForeignKey("users.id"), nullable=False)
     message = Column(Text, nullable=False)  # вопрос пользователя
     response = Column(Text, nullable=False)  # ответ бота
     intent = Column(String(100), nullable=True)  # распознанная интент
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="chat_logs")
+    user = relationship("User", back_populates="chat_logs", lazy="raise")
     
     def __repr__(self):
         return f"<ChatLog(id={self.id}, user_id={self.user_id}, intent='{self.intent}')>"
@@ -91,17 +120,24 @@ class ChatLog(Base):
 class FAQ(Base):
     """База знаний часто задаваемых вопросов"""
     __tablename__ = "faq"
+    __table_args__ = (
+        # Триграммные индексы для нечеткого поиска (только PostgreSQL с pg_trgm)
+        Index("ix_faq_question_trgm", "question", postgresql_using="gin",
+              postgresql_ops={"question": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_faq_keywords_trgm", "keywords", postgresql_using="gin",
+              postgresql_ops={"keywords": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(IdType, Identity(always=True), primary_key=True)
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     keywords = Column(String(500), nullable=True)  # ключевые слова для поиска
-    service_id = Column(Integer, ForeignKey("services.id"), nullable=True)
+    service_id = Column(IdType, ForeignKey("services.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    service = relationship("Service")
+    service = relationship("Service", lazy="raise")
     
     def __repr__(self):
         return f"<FAQ(id={self.id}, question='{self.question[:50]}...')>"
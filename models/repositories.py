@@ -1,7 +1,20 @@
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, insert, update, delete, func, tuple_, literal, or_
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
-from models.database import User, Service, ConsultationRequest, ChatLog, FAQ
+from sqlalchemy.orm import selectinload, raiseload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from models.database import User, Service, ConsultationRequest, ConsultationStatsDaily, ChatLog, FAQ
+
+
+def dialect_insert(session: AsyncSession):
+    """INSERT with ON CONFLICT support for the session's database"""
+    return pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+
+
+# Repositories only flush; the caller owns the transaction and commits once
+# per unit of work (bot update, admin request, startup step).
 
 
 class UserRepository:
@@ -18,41 +31,75 @@ class UserRepository:
     
     async def get_or_create(self, telegram_id: int, username: str = None,
                     first_name: str = None, last_name: str = None) -> User:
-        """Get existing user or create new one"""
-        # Сначала пытаемся найти существующего пользователя
+        """Get existing user or create new one (single upsert round trip)"""
+        return await self.upsert_by_telegram(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name
+        )
+    
+    async def upsert_by_telegram(self, telegram_id: int, username: str = None,
+                                 first_name: str = None, last_name: str = None) -> User:
+        """Insert user or refresh his Telegram profile fields; writes only if something changed"""
+        # Hot path (every message): a known user with the same profile costs one
+        # indexed SELECT, without row locks, WAL or a burned identity value
         user = await self.get_by_telegram_id(telegram_id)
+        if user is not None and (user.username, user.first_name, user.last_name) == (
+            username, first_name, last_name
+        ):
+            return user
         
-        if user is None:
-            # Если не найден, создаем нового
-            user = await self.create(
-                telegram_id=telegram_id,
-                username=username,
-                first_name=first_name,
-                last_name=last_name
+        stmt = dialect_insert(self.session)(User).values(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={
+                "username": stmt.excluded.username,
+                "first_name": stmt.excluded.first_name,
+                "last_name": stmt.excluded.last_name,
+            },
+            # A concurrent update may already have stored the same profile
+            where=or_(
+                User.username.is_distinct_from(stmt.excluded.username),
+                User.first_name.is_distinct_from(stmt.excluded.first_name),
+                User.last_name.is_distinct_from(stmt.excluded.last_name),
             )
-        
+        ).returning(User)
+        result = await self.session.execute(
+            stmt, execution_options={"populate_existing": True}
+        )
+        user = result.scalar_one_or_none()
+        if user is None:
+            # DO UPDATE was skipped by the WHERE clause: RETURNING yields no row
+            user = await self.get_by_telegram_id(telegram_id)
         return user
     
     async def create(self, telegram_id: int, username: str = None,
                     first_name: str = None, last_name: str = None) -> User:
         """Create new user"""
-        user = User(
+        # RETURNING brings back server defaults (registered_at) without a refresh
+        stmt = insert(User).values(
             telegram_id=telegram_id,
             username=username,
             first_name=first_name,
             last_name=last_name
-        )
-        self.session.add(user)
-        await self.session.commit()
-        await self.session.refresh(user)
+        ).returning(User)
+        result = await self.session.execute(stmt)
+        user = result.scalar_one()
         return user
     
     async def update_phone(self, user_id: int, phone: str) -> Optional[User]:
         """Update user phone"""
-        stmt = update(User).where(User.id == user_id).values(phone=phone)
-        await self.session.execute(stmt)
-        await self.session.commit()
-        return await self.session.get(User, user_id)
+        stmt = update(User).where(User.id == user_id).values(phone=phone).returning(User)
+        result = await self.session.execute(
+            stmt, execution_options={"populate_existing": True}
+        )
+        return result.scalar_one_or_none()
 
 
 class ServiceRepository:
@@ -81,16 +128,16 @@ class ServiceRepository:
         """Create new service"""
         service = Service(**kwargs)
         self.session.add(service)
-        await self.session.commit()
-        await self.session.refresh(service)
+        await self.session.flush()
         return service
     
     async def update(self, service_id: int, **kwargs) -> Optional[Service]:
         """Update service"""
-        stmt = update(Service).where(Service.id == service_id).values(**kwargs)
-        await self.session.execute(stmt)
-        await self.session.commit()
-        return await self.session.get(Service, service_id)
+        stmt = update(Service).where(Service.id == service_id).values(**kwargs).returning(Service)
+        result = await self.session.execute(
+            stmt, execution_options={"populate_existing": True}
+        )
+        return result.scalar_one_or_none()
 
 
 class ConsultationRequestRepository:
@@ -98,27 +145,101 @@ class ConsultationRequestRepository:
     
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.stats = ConsultationStatsRepository(session)
     
     async def create(self, **kwargs) -> ConsultationRequest:
         """Create new consultation request"""
         request = ConsultationRequest(**kwargs)
         self.session.add(request)
-        await self.session.commit()
-        await self.session.refresh(request)
+        await self.session.flush()
+        await self.stats.increment(request.created_at.date(), request.status, 1)
         return request
     
-    async def get_all(self, status: str = None) -> List[ConsultationRequest]:
-        """Get all requests, optionally filtered by status"""
+    async def get_all(self, status: str = None, eager: bool = False,
+                      limit: int = None, offset: int = None) -> List[ConsultationRequest]:
+        """Get requests (newest first), optionally filtered by status and paginated
+
+        With ``eager=True`` user and service are loaded in batched IN queries,
+        any other relationship access raises instead of lazy loading.
+        """
         stmt = select(ConsultationRequest)
+        if eager:
+            stmt = stmt.options(
+                selectinload(ConsultationRequest.user),
+                selectinload(ConsultationRequest.service),
+                raiseload("*"),
+            )
         if status:
             stmt = stmt.where(ConsultationRequest.status == status)
         stmt = stmt.order_by(ConsultationRequest.created_at.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        if offset is not None:
+            stmt = stmt.offset(offset)
         result = await self.session.execute(stmt)
         return result.scalars().all()
     
+    async def page(self, status: str = None, limit: int = 20,
+                   cursor: int = None) -> Tuple[List[ConsultationRequest], Optional[int]]:
+        """Get one page of requests (newest first) using keyset pagination
+
+        ``cursor`` is the id of the last request on the previous page; rows
+        strictly older in (created_at, id) order are returned. Returns the
+        rows and the cursor for the next page (None on the last page).
+        User and service are eager loaded as in ``get_all(eager=True)``.
+        """
+        stmt = select(ConsultationRequest).options(
+            selectinload(ConsultationRequest.user),
+            selectinload(ConsultationRequest.service),
+            raiseload("*"),
+        )
+        if status:
+            stmt = stmt.where(ConsultationRequest.status == status)
+        if cursor is not None:
+            # created_at курсора берем из БД, чтобы не зависеть от формата дат в параметрах
+            cursor_created = select(ConsultationRequest.created_at).where(
+                ConsultationRequest.id == cursor
+            ).scalar_subquery()
+            stmt = stmt.where(
+                tuple_(ConsultationRequest.created_at, ConsultationRequest.id)
+                < tuple_(cursor_created, literal(cursor))
+            )
+        stmt = stmt.order_by(
+            ConsultationRequest.created_at.desc(), ConsultationRequest.id.desc()
+        ).limit(limit + 1)
+        result = await self.session.execute(stmt)
+        rows = list(result.scalars().all())
+        
+        # Лишняя строка показывает, есть ли следующая страница
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1].id
+        return rows, None
+    
+    async def iter_all(self, status: str = None,
+                       batch_size: int = 500) -> AsyncIterator[ConsultationRequest]:
+        """Stream requests (newest first) with their services, batch_size rows at a time
+
+        Rows come from a server-side cursor, so memory stays bounded by
+        ``batch_size`` regardless of table size.
+        """
+        stmt = select(ConsultationRequest).options(
+            selectinload(ConsultationRequest.service)
+        )
+        if status:
+            stmt = stmt.where(ConsultationRequest.status == status)
+        stmt = stmt.order_by(
+            ConsultationRequest.created_at.desc()
+        ).execution_options(yield_per=batch_size)
+        result = await self.session.stream_scalars(stmt)
+        async for request in result:
+            yield request
+    
     async def get_by_user_id(self, user_id: int) -> List[ConsultationRequest]:
-        """Get requests by user ID"""
-        stmt = select(ConsultationRequest).where(
+        """Get requests by user ID, with their services loaded"""
+        stmt = select(ConsultationRequest).options(
+            selectinload(ConsultationRequest.service)
+        ).where(
             ConsultationRequest.user_id == user_id
         ).order_by(ConsultationRequest.created_at.desc())
         result = await self.session.execute(stmt)
@@ -126,12 +247,82 @@ class ConsultationRequestRepository:
     
     async def update_status(self, request_id: int, status: str) -> Optional[ConsultationRequest]:
         """Update request status"""
+        current = await self.session.execute(
+            select(ConsultationRequest.status, ConsultationRequest.created_at).where(
+                ConsultationRequest.id == request_id
+            )
+        )
+        row = current.one_or_none()
+        if row is None:
+            return None
+        
         stmt = update(ConsultationRequest).where(
             ConsultationRequest.id == request_id
-        ).values(status=status)
+        ).values(status=status).returning(ConsultationRequest)
+        result = await self.session.execute(
+            stmt, execution_options={"populate_existing": True}
+        )
+        request = result.scalar_one()
+        
+        # Переносим заявку в сводке из старого статуса в новый
+        if row.status != status:
+            await self.stats.increment(row.created_at.date(), row.status, -1)
+            await self.stats.increment(row.created_at.date(), status, 1)
+        
+        return request
+
+
+class ConsultationStatsRepository:
+    """Repository for the daily consultation request summary"""
+    
+    def __init__(self, session: AsyncSession):
+        self.session = session
+    
+    async def increment(self, day: date, status: str, delta: int):
+        """Add delta to the (day, status) counter"""
+        stmt = dialect_insert(self.session)(ConsultationStatsDaily).values(
+            date=day, status=status, count=delta
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ConsultationStatsDaily.date, ConsultationStatsDaily.status],
+            set_={"count": ConsultationStatsDaily.count + stmt.excluded.count}
+        )
         await self.session.execute(stmt)
-        await self.session.commit()
-        return await self.session.get(ConsultationRequest, request_id)
+    
+    async def get_daily(self, since: date) -> List:
+        """Get request counts per day starting from `since`"""
+        stmt = select(
+            ConsultationStatsDaily.date,
+            func.sum(ConsultationStatsDaily.count).label("count")
+        ).where(
+            ConsultationStatsDaily.date >= since
+        ).group_by(ConsultationStatsDaily.date).order_by(ConsultationStatsDaily.date)
+        result = await self.session.execute(stmt)
+        return result.all()
+    
+    async def get_status_totals(self) -> Dict[str, int]:
+        """Get request counts per status"""
+        stmt = select(
+            ConsultationStatsDaily.status,
+            func.sum(ConsultationStatsDaily.count)
+        ).group_by(ConsultationStatsDaily.status)
+        result = await self.session.execute(stmt)
+        return {status: count for status, count in result.all() if count}
+    
+    async def rebuild(self):
+        """Recompute the summary from consultation_requests"""
+        day = func.date(ConsultationRequest.created_at)
+        source = select(
+            day, ConsultationRequest.status, func.count(ConsultationRequest.id)
+        ).where(
+            ConsultationRequest.status.is_not(None)
+        ).group_by(day, ConsultationRequest.status)
+        await self.session.execute(delete(ConsultationStatsDaily))
+        await self.session.execute(
+            ConsultationStatsDaily.__table__.insert().from_select(
+                ["date", "status", "count"], source
+            )
+        )
 
 
 class ChatLogRepository:
@@ -150,17 +341,21 @@ class ChatLogRepository:
             intent=intent
         )
         self.session.add(log)
-        await self.session.commit()
-        await self.session.refresh(log)
+        await self.session.flush()
         return log
     
+    async def bulk_create(self, entries: List[Dict]):
+        """Insert many chat log entries with a single executemany INSERT"""
+        if entries:
+            await self.session.execute(insert(ChatLog), entries)
+    
     async def get_user_logs(self, user_id: int, limit: int = 50) -> List[ChatLog]:
-        """Get user chat history"""
+        """Get the last `limit` chat log entries in chronological order"""
         stmt = select(ChatLog).where(
             ChatLog.user_id == user_id
         ).order_by(ChatLog.created_at.desc()).limit(limit)
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        return list(reversed(result.scalars().all()))
 
 
 class FAQRepository:
@@ -177,10 +372,22 @@ class FAQRepository:
     
     async def search(self, query: str, limit: int = 5) -> List[FAQ]:
         """Search FAQ by keywords"""
-        stmt = select(FAQ).where(
-            FAQ.question.ilike(f"%{query}%") |
-            FAQ.keywords.ilike(f"%{query}%")
-        ).limit(limit)
+        if self.session.bind.dialect.name == "postgresql":
+            # Trigram similarity can use the GIN indexes, unlike ILIKE '%q%'
+            stmt = select(FAQ).where(
+                FAQ.question.op("%")(query) |
+                FAQ.keywords.op("%")(query)
+            ).order_by(
+                func.greatest(
+                    func.similarity(FAQ.question, query),
+                    func.similarity(func.coalesce(FAQ.keywords, ""), query)
+                ).desc()
+            ).limit(limit)
+        else:
+            stmt = select(FAQ).where(
+                FAQ.question.ilike(f"%{query}%") |
+                FAQ.keywords.ilike(f"%{query}%")
+            ).limit(limit)
         result = await self.session.execute(stmt)
         return result.scalars().all()
     
@@ -194,6 +401,5 @@ class FAQRepository:
             service_id=service_id
         )
         self.session.add(faq)
-        await self.session.commit()
-        await self.session.refresh(faq)
+        await self.session.flush()
         return faq
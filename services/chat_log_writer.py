@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from models.base import async_session_maker
+from models.repositories import ChatLogRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ChatLogWriter:
+    """Фоновая пакетная запись логов диалогов в БД"""
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Очередь создается в start(), внутри работающего event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def log(self, user_id: int, message: str, response: str, intent: str = None):
+        """Ставит запись в очередь, не обращаясь к БД"""
+        if self._queue is None:
+            logger.warning("Chat log writer is not started, log entry dropped")
+            return
+        self._queue.put_nowait({
+            'user_id': user_id,
+            'message': message,
+            'response': response,
+            'intent': intent,
+        })
+
+    def start(self):
+        """Запускает фоновую задачу записи"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает накопленные записи и останавливает задачу"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        """Собирает пачки до batch_size записей или flush_interval секунд"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                break
+
+            batch = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict]):
+        """Записывает пачку одним INSERT и одним коммитом"""
+        try:
+            async with async_session_maker() as session:
+                await ChatLogRepository(session).bulk_create(batch)
+                await session.commit()
+            logger.debug(f"Chat logs flushed: {len(batch)}")
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} chat logs: {e}")
+
+
+# Глобальный экземпляр
+chat_log_writer = ChatLogWriter()
@@ -0,0 +1,35 @@
+import logging
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Общая для сервисов aiohttp-сессия (Ollama, сайт клиники)
+
+    Один пул keep-alive соединений на процесс: повторные запросы к тому же
+    хосту не тратят время на TCP/TLS-рукопожатие. Создается лениво, внутри
+    работающего event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=16, ttl_dns_cache=300, keepalive_timeout=75
+            )
+        )
+    return _session
+
+
+async def close_session():
+    """Закрывает общую сессию (при остановке бота)"""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+        logger.info("Shared HTTP session closed")
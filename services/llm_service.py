@@ -1,12 +1,55 @@
 import asyncio
+import itertools
 import logging
-from typing import Optional, Dict, List
-import json
-import requests
+import random
+import time
+from functools import lru_cache
+from typing import Final, Optional, Dict, List, Tuple
+import ahocorasick
+import aiohttp
+import orjson
 from config.settings import settings
+from utils.query_normalizer import normalize_query
+from services.http_session import get_session
 
 logger = logging.getLogger(__name__)
 
+# Роль и стиль ответа зависят только от настроек и собираются один раз при импорте
+SYSTEM_PROMPT: Final[str] = f"""Ты — Анна, виртуальный помощник клиники пластической хирургии "{settings.clinic_name}".
+Твой стиль общения: дружелюбный, профессиональный, сочувствующий, но без излишней фамильярности.
+Ты даешь точные медицинские информацию, но всегда уточняешь, что окончательный ответ может дать только хирург на консультации.
+
+Правила:
+1. Отвечай кратко (2-5 предложений)
+2. Используй эмпатичные фразы ("Понимаю ваш интерес", "Это хороший вопрос")
+3. Не выдумывай информацию, которой нет в контексте
+4. Если не знаешь ответа, предложи связаться с живым менеджером
+5. Завершай ответ вопросом или предложением помощи
+"""
+
+# Тело запроса сериализуется orjson, поэтому заголовок ставится вручную
+JSON_HEADERS: Final[dict] = {"Content-Type": "application/json"}
+
+# Повторы запросов к Ollama: число попыток, статусы временной недоступности
+# и предел экспоненциальной задержки между попытками, секунды
+OLLAMA_MAX_ATTEMPTS = 3
+OLLAMA_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+OLLAMA_RETRY_MAX_DELAY = 8.0
+
+# Сколько секунд доверять последнему ответу /api/tags (доступность и список моделей)
+OLLAMA_STATUS_TTL = 30.0
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Задержка перед повтором: Retry-After сервера или экспонента с джиттером"""
+    if retry_after:
+        try:
+            return min(float(retry_after), OLLAMA_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    backoff = min(0.5 * 2 ** attempt, OLLAMA_RETRY_MAX_DELAY)
+    return backoff + random.uniform(0, backoff)
+
 
 class LLMService:
     """Сервис для работы с локальной языковой моделью (Ollama)"""
@@ -15,6 +58,9 @@ class LLMService:
         self.host = settings.ollama_host
         self.model = settings.ollama_model
         self.base_url = f"{self.host}/api"
+        # Последний ответ /api/tags и время, до которого он считается актуальным
+        self._tags: Optional[List[str]] = None
+        self._tags_expires_at = 0.0
     
     async def generate_response(self, prompt: str, context: Dict = None) -> Optional[str]:
         """Генерирует ответ с помощью LLM"""
@@ -36,157 +82,207 @@ class LLMService:
             logger.error(f"Error generating LLM response: {e}")
             return None
     
+    async def generate_responses_batch(
+        self, items: List[Tuple[str, Optional[Dict]]]
+    ) -> List[Optional[str]]:
+        """
+        Генерирует ответы на несколько вопросов одновременно
+        
+        items - пары (вопрос, контекст); ответы возвращаются в том же порядке.
+        Параллельно их обработает только сервер с OLLAMA_NUM_PARALLEL > 1,
+        иначе Ollama выстроит запросы в очередь.
+        """
+        return await asyncio.gather(
+            *(self.generate_response(prompt, context) for prompt, context in items)
+        )
+    
     def _build_prompt(self, user_message: str, context: Dict = None) -> str:
         """Строит полный промпт для LLM"""
-        
-        # Базовая роль и стиль
-        system_prompt = f"""Ты — Анна, виртуальный помощник клиники пластической хирургии "{settings.clinic_name}".
-Твой стиль общения: дружелюбный, профессиональный, сочувствующий, но без излишней фамильярности.
-Ты даешь точные медицинские информацию, но всегда уточняешь, что окончательный ответ может дать только хирург на консультации.
-
-Правила:
-1. Отвечай кратко (2-5 предложений)
-2. Используй эмпатичные фразы ("Понимаю ваш интерес", "Это хороший вопрос")
-3. Не выдумывай информацию, которой нет в контексте
-4. Если не знаешь ответа, предложи связаться с живым менеджером
-5. Завершай ответ вопросом или предложением помощи
-"""
+        # Части собираются в список и склеиваются одним join
+        parts = [SYSTEM_PROMPT]
         
         # Добавляем контекст об услуге
-        service_context = ""
         if context and 'service' in context:
             service = context['service']
-            service_context = f"""
-Контекст об услуге:
-Название: {service.get('name', 'Блефаропластика верхних век')}
-Описание: {service.get('description', '')}
-Показания: {service.get('indications', '')}
-Методики: {service.get('methods', '')}
-Длительность: {service.get('duration', '')}
-Реабилитация: {service.get('recovery', '')}
-Цены: {service.get('price_range', '')}
-"""
+            parts.append("\n".join((
+                "Контекст об услуге:",
+                f"Название: {service.get('name', 'Блефаропластика верхних век')}",
+                f"Описание: {service.get('description', '')}",
+                f"Показания: {service.get('indications', '')}",
+                f"Методики: {service.get('methods', '')}",
+                f"Длительность: {service.get('duration', '')}",
+                f"Реабилитация: {service.get('recovery', '')}",
+                f"Цены: {service.get('price_range', '')}",
+            )))
         
         # Добавляем историю диалога
-        chat_history = ""
+        history_lines = ["История диалога:"]
         if context and 'history' in context:
-            history = context['history'][-3:]  # Последние 3 сообщения
-            for msg in history:
+            for msg in context['history'][-3:]:  # Последние 3 сообщения
                 role = "Пользователь" if msg.get('role') == 'user' else "Анна"
-                chat_history += f"{role}: {msg.get('text', '')}\n"
+                history_lines.append(f"{role}: {msg.get('text', '')}")
+        parts.append("\n".join(history_lines))
         
-        # Собираем полный промпт
-        full_prompt = f"""{system_prompt}
-
-{service_context}
-
-История диалога:
-{chat_history}
-
-Текущий вопрос пользователя:
-{user_message}
-
-Ответ Анны (2-5 предложений, закончи эмпатичной фразой или вопросом):
-"""
+        parts.append(f"Текущий вопрос пользователя:\n{user_message}")
+        parts.append("Ответ Анны (2-5 предложений, закончи эмпатичной фразой или вопросом):\n")
         
-        return full_prompt
+        return "\n\n".join(parts)
     
     async def _call_ollama(self, prompt: str) -> Optional[str]:
-        """Отправляет запрос к Ollama API"""
-        try:
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 200
-                }
+        """Отправляет запрос к Ollama API, повторяя его при временных сбоях"""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "max_tokens": 200
             }
-            
-            # Отправляем запрос
-            response = requests.post(
-                f"{self.base_url}/generate",
-                json=payload,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                logger.error(f"Ollama API error: {response.status_code} - {response.text}")
+        }
+        
+        for attempt in range(OLLAMA_MAX_ATTEMPTS):
+            retry_after = None
+            try:
+                # Отправляем запрос
+                async with get_session().post(
+                    f"{self.base_url}/generate",
+                    data=orjson.dumps(payload),
+                    headers=JSON_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    if response.status == 200:
+                        result = orjson.loads(await response.read())
+                        return result.get('response', '').strip()
+                    if response.status not in OLLAMA_RETRY_STATUSES:
+                        logger.error(f"Ollama API error: {response.status} - {await response.text()}")
+                        return None
+                    logger.warning(f"Ollama API busy: {response.status}")
+                    retry_after = response.headers.get("Retry-After")
+                    
+            except asyncio.TimeoutError:
+                logger.warning("Timeout when calling Ollama API")
+            except aiohttp.ClientConnectionError:
+                logger.warning("Connection error when calling Ollama API. Is Ollama running?")
+            except Exception as e:
+                logger.error(f"Unexpected error calling Ollama: {e}")
                 return None
-                
-        except requests.exceptions.Timeout:
-            logger.error("Timeout when calling Ollama API")
-            return None
-        except requests.exceptions.ConnectionError:
-            logger.error("Connection error when calling Ollama API. Is Ollama running?")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error calling Ollama: {e}")
-            return None
+            
+            if attempt < OLLAMA_MAX_ATTEMPTS - 1:
+                await asyncio.sleep(_retry_delay(attempt, retry_after))
+        
+        logger.error(f"Ollama API unavailable after {OLLAMA_MAX_ATTEMPTS} attempts")
+        return None
     
     async def check_connection(self) -> bool:
         """Проверяет доступность Ollama"""
-        try:
-            response = requests.get(f"{self.base_url}/tags", timeout=5)
-            return response.status_code == 200
-        except:
-            return False
+        return await self._get_tags() is not None
     
     async def get_available_models(self) -> List[str]:
         """Получает список доступных моделей"""
+        return await self._get_tags() or []
+    
+    async def _get_tags(self) -> Optional[List[str]]:
+        """
+        Модели из /api/tags; None, если Ollama недоступна
+        
+        Результат (в том числе недоступность) кэшируется на OLLAMA_STATUS_TTL секунд.
+        """
+        now = time.monotonic()
+        if now < self._tags_expires_at:
+            return self._tags
+        
+        tags = None
         try:
-            response = requests.get(f"{self.base_url}/tags", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return [model['name'] for model in data.get('models', [])]
-            return []
-        except:
-            return []
+            async with get_session().get(
+                f"{self.base_url}/tags", timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                if response.status == 200:
+                    # Ответ 200 означает, что Ollama доступна, даже если список не разобрался
+                    tags = []
+                    data = orjson.loads(await response.read())
+                    tags = [model['name'] for model in data.get('models', [])]
+        except Exception:
+            pass
+        
+        self._tags = tags
+        self._tags_expires_at = now + OLLAMA_STATUS_TTL
+        return tags
+
+
+# Готовые ответы на частые вопросы: ключевое слово -> варианты ответа.
+# Порядок ключей - приоритет, если в вопросе встретилось несколько
+FAQ_RESPONSES: Final[Dict[str, Tuple[str, ...]]] = {
+    "цена": (
+        "Стоимость блефаропластики зависит от сложности и методики. Ориентировочно от 50 000 до 120 000 рублей. Точную цену назовет хирург после консультации.",
+        "Цена на блефаропластику верхних век варьируется в зависимости от объема работы. Хотите узнать подробнее о конкретной методике?"
+    ),
+    "длительность": (
+        "Операция длится от 1 до 2 часов, в зависимости от сложности и выбранной методики.",
+        "Блефаропластика занимает около 1-2 часов. После операции потребуется некоторое время на наблюдение."
+    ),
+    "реабилитация": (
+        "Реабилитация занимает 7-10 дней для заживления, 2 недели для снятия швов, 1 месяц для возврата к обычной жизни. Окончательный результат через 3-6 месяцев.",
+        "После операции первые 7-10 дней будет отек, затем 2 недели снимают швы. Через месяц можно вернуться к обычной жизни."
+    ),
+    "риск": (
+        "Как и любая операция, блефаропластика имеет риски: асимметрия, сухость глаз, гематома. В нашей клинике риск минимизирован за счет опыта хирургов.",
+        "Риски включают асимметрию, сухость глаз, редкие осложнения. Наши хирурги минимизируют риски благодаря большому опыту."
+    ),
+    "подготовка": (
+        "Перед операцией требуется консультация хирурга, анализы и отказ от некоторых лекарств. Подробности расскажет врач на консультации.",
+        "Необходима предварительная консультация, сдача анализов и подготовка по рекомендациям врача."
+    )
+}
+
+# Другие слова, по которым узнается тема FAQ: ключевое слово -> тема.
+# Приоритет темы задается порядком FAQ_RESPONSES, а не этим словарем
+FAQ_SYNONYMS: Final[Dict[str, str]] = {
+    "стоит": "цена",
+    "стоимость": "цена",
+    "длится": "длительность",
+    "восстановление": "реабилитация",
+    "осложнени": "риск",
+    "подготовиться": "подготовка",
+}
 
 
 class FallbackService:
     """Сервис для ответов на часто задаваемые вопросы без LLM"""
     
     def __init__(self):
-        self.faq_responses = {
-            "цена": [
-                "Стоимость блефаропластики зависит от сложности и методики. Ориентировочно от 50 000 до 120 000 рублей. Точную цену назовет хирург после консультации.",
-                "Цена на блефаропластику верхних век варьируется в зависимости от объема работы. Хотите узнать подробнее о конкретной методике?"
-            ],
-            "длительность": [
-                "Операция длится от 1 до 2 часов, в зависимости от сложности и выбранной методики.",
-                "Блефаропластика занимает около 1-2 часов. После операции потребуется некоторое время на наблюдение."
-            ],
-            "реабилитация": [
-                "Реабилитация занимает 7-10 дней для заживления, 2 недели для снятия швов, 1 месяц для возврата к обычной жизни. Окончательный результат через 3-6 месяцев.",
-                "После операции первые 7-10 дней будет отек, затем 2 недели снимают швы. Через месяц можно вернуться к обычной жизни."
-            ],
-            "риск": [
-                "Как и любая операция, блефаропластика имеет риски: асимметрия, сухость глаз, гематома. В нашей клинике риск минимизирован за счет опыта хирургов.",
-                "Риски включают асимметрию, сухость глаз, редкие осложнения. Наши хирурги минимизируют риски благодаря большому опыту."
-            ],
-            "подготовка": [
-                "Перед операцией требуется консультация хирурга, анализы и отказ от некоторых лекарств. Подробности расскажет врач на консультации.",
-                "Необходима предварительная консультация, сдача анализов и подготовка по рекомендациям врача."
-            ]
+        self.faq_responses = FAQ_RESPONSES
+        
+        # Все ключевые слова и их синонимы ищутся за один проход по сообщению
+        priorities = {keyword: priority for priority, keyword in enumerate(self.faq_responses)}
+        self._automaton = ahocorasick.Automaton()
+        for keyword, priority in priorities.items():
+            self._automaton.add_word(keyword, (priority, keyword))
+        for synonym, keyword in FAQ_SYNONYMS.items():
+            self._automaton.add_word(synonym, (priorities[keyword], keyword))
+        self._automaton.make_automaton()
+        # Кэш на экземпляр: повторяющиеся вопросы не сканируются заново
+        self._find_keyword = lru_cache(maxsize=2048)(self._match_keyword)
+        # Варианты ответа на тему выдаются по кругу
+        self._response_cycles = {
+            keyword: itertools.cycle(responses) for keyword, responses in self.faq_responses.items()
         }
     
+    def _match_keyword(self, normalized_message: str) -> Optional[str]:
+        """Тема FAQ, первая по порядку faq_responses среди упомянутых в сообщении"""
+        # Совпадения перебираются за один проход по сообщению, без промежуточного списка
+        best = min((value for _, value in self._automaton.iter(normalized_message)), default=None)
+        return best[1] if best else None
+    
     async def get_fallback_response(self, message: str) -> Optional[str]:
         """Возвращает ответ на основе ключевых слов"""
-        message_lower = message.lower()
-        
-        for keyword, responses in self.faq_responses.items():
-            if keyword in message_lower:
-                # Возвращаем случайный ответ из списка
-                import random
-                return random.choice(responses)
+        # Разные написания одного вопроса попадают в одну запись кэша
+        keyword = self._find_keyword(normalize_query(message))
+        if keyword is None:
+            return None
         
-        return None
+        # Возвращаем следующий вариант ответа
+        return next(self._response_cycles[keyword])
 
 
 # Глобальные экземпляры сервисов
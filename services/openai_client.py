@@ -0,0 +1,44 @@
+import logging
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAioHttpClient
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять запрос к OpenAI при временных ошибках
+OPENAI_MAX_RETRIES = 3
+
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_client() -> AsyncOpenAI:
+    """
+    Общий на процесс клиент OpenAI
+
+    Запросы идут через aiohttp-транспорт SDK: пул httpx по умолчанию упирается
+    в конкуренцию за соединения уже при ~10 параллельных запросах, и пропускная
+    способность падает с ростом нагрузки. SDK сам повторяет 429/5xx и сетевые
+    ошибки (экспонента с джиттером, с учетом Retry-After из ответа).
+    """
+    global _client
+    if _client is None:
+        http_client = DefaultAioHttpClient(timeout=httpx.Timeout(30.0, connect=5.0))
+        _client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            http_client=http_client,
+            max_retries=OPENAI_MAX_RETRIES,
+        )
+    return _client
+
+
+async def close_client():
+    """Закрывает клиент и его пул соединений (при остановке бота)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("OpenAI client closed")
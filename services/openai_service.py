@@ -1,12 +1,166 @@
 import asyncio
 import logging
-from typing import Optional, Dict, List, Tuple
-import json
-from openai import AsyncOpenAI
+import re
+from typing import AsyncIterator, Callable, Final, Optional, Dict, List, Tuple
+import orjson
+from openai import AsyncOpenAI, PermissionDeniedError, RateLimitError
 from config.settings import settings
+from services.openai_client import close_client, get_client
+from services.response_cache import ResponseCache
+from services.semantic_cache import SemanticCache
+from services.website_content_service import website_content_service
+from utils.message_splitter import compact_text
+from utils.query_normalizer import normalize_query
 
 logger = logging.getLogger(__name__)
 
+# Системный промпт не зависит от запроса и собирается один раз при импорте
+SYSTEM_PROMPT: Final[str] = """Ты - умный ассистент. ОТВЕЧАЙ ТОЛЬКО НА ЗАДАННЫЙ ВОПРОС.
+
+СТРОГИЕ ПРАВИЛА:
+1. ОТВЕЧАЙ ИМЕННО НА ТОТ ВОПРОС, КОТОРЫЙ ЗАДАЛИ
+2. НЕ ДОБАВЛЯЙ "Анна:" или другие префиксы
+3. НЕ УПОМИНАЙ ПЛАСТИЧЕСКУЮ ХИРУРГИЮ, если вопрос не о ней
+4. БУДЬ КРАТКИМ (макс. 200 символов)
+5. НЕ ПРЕДЛАГАЙ ПОМОЩЬ, если не спрашивают
+
+ПРИМЕРЫ:
+Вопрос: "какая столица у Парижа?"
+Ответ: "Париж - это столица Франции."
+
+Вопрос: "Какая площадь африки?"
+Ответ: "Площадь Африки - около 30,3 млн км²."
+
+Вопрос: "Что такое блефаропластика?"
+Ответ: "Блефаропластика - операция по коррекции век. Цена от 50 000 руб."
+
+ОТВЕЧАЙ ТОЧНО И КРАТКО!
+"""
+
+# Контент сайта клиники модель запрашивает сама: он не попадает в промпт
+# вопросов, к сайту не относящихся, и начало промпта остается одинаковым
+TOOLS: Final[list] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_site",
+            "description": (
+                "Ищет на сайте клиники описание услуги: показания, методики, "
+                "длительность, реабилитацию и цены. Вызывай только для вопросов "
+                "об услугах клиники."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Название услуги или вопрос о ней, например «блефаропластика»",
+                    }
+                },
+                "required": ["query"],
+            },
+        },
+    }
+]
+
+# Признаки медицинского вопроса (только для таких вопросов в промпт идет история диалога)
+MEDICAL_RE = re.compile(r"пластик|хирург|операция|блефаропластика|грудь|лицо", re.IGNORECASE)
+
+RESPONSE_CACHE_SIZE = 4096
+
+# Сколько последних сообщений истории попадает в промпт (один обмен: вопрос и ответ)
+HISTORY_PROMPT_MESSAGES = 2
+# Предел длины одного сообщения истории в промпте, символов (прошлые ответы бывают длинными)
+HISTORY_MESSAGE_LIMIT = 500
+
+# Ограничение длины ответа (Telegram считает 4096 в UTF-16 единицах, оставляем запас)
+MAX_RESPONSE_LENGTH = 3500
+
+# Предел ответа модели в токенах: развернутый для вопросов о процедурах, для остальных
+# короткий (системный промпт просит до 200 символов, ~80 токенов)
+MAX_RESPONSE_TOKENS = 600
+SHORT_RESPONSE_TOKENS = 200
+
+
+def uses_history(question: str) -> bool:
+    """Нужна ли для ответа на вопрос история диалога (только для медицинских вопросов)"""
+    return MEDICAL_RE.search(question) is not None
+
+
+def response_token_limit(question: str) -> int:
+    """max_tokens для ответа на вопрос: за токены сверх него не платим"""
+    return MAX_RESPONSE_TOKENS if uses_history(question) else SHORT_RESPONSE_TOKENS
+
+
+def trim_response(response: str) -> str:
+    """Обрезает ответ модели до MAX_RESPONSE_LENGTH UTF-16 единиц с пометкой о сокращении"""
+    # Символ занимает не больше двух UTF-16 единиц: короткий ответ не кодируем
+    if len(response) * 2 <= MAX_RESPONSE_LENGTH:
+        return response
+    
+    encoded = response.encode('utf-16-le')
+    if len(encoded) <= MAX_RESPONSE_LENGTH * 2:
+        return response
+    # errors='ignore' отбрасывает половину суррогатной пары на границе среза
+    trimmed = encoded[:MAX_RESPONSE_LENGTH * 2].decode('utf-16-le', errors='ignore')
+    return trimmed + "...\n\n(ответ сокращен для отображения в Telegram)"
+
+
+class SharedStream:
+    """
+    Один потоковый ответ OpenAI для нескольких читателей
+    
+    Фрагменты читаются из источника в отдельной задаче и копятся в буфере:
+    каждый читатель получает все фрагменты с начала, даже если подключился позже.
+    Чтение останавливается после MAX_RESPONSE_LENGTH символов, как и в stream_response.
+    """
+    
+    def __init__(self, source: AsyncIterator[str]):
+        self.pieces: List[str] = []
+        self.error: Optional[BaseException] = None
+        self._updated = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+    
+    async def _pump(self, source: AsyncIterator[str]):
+        """Читает источник до конца, до предела длины или до ошибки"""
+        length = 0
+        try:
+            async for piece in source:
+                self.pieces.append(piece)
+                length += len(piece)
+                self._notify()
+                if length > MAX_RESPONSE_LENGTH:
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            self._notify()
+    
+    def _notify(self):
+        """Будит читателей, ждущих новых фрагментов"""
+        self._updated.set()
+        self._updated = asyncio.Event()
+    
+    async def read(self) -> AsyncIterator[str]:
+        """Фрагменты ответа с начала; ошибка источника пробрасывается каждому читателю"""
+        position = 0
+        while True:
+            while position < len(self.pieces):
+                yield self.pieces[position]
+                position += 1
+            if self.task.done():
+                break
+            await self._updated.wait()
+        if self.error is not None:
+            raise self.error
+    
+    def result(self) -> Optional[str]:
+        """Полный ответ, если поток завершился без ошибки"""
+        if self.task.cancelled() or self.error is not None:
+            return None
+        return "".join(self.pieces).strip() or None
+
 
 class OpenAIService:
     """Сервис для работы с OpenAI GPT-4o-mini"""
@@ -14,26 +168,47 @@ class OpenAIService:
     def __init__(self):
         self.api_key = settings.openai_api_key
         self.model = settings.openai_model
-        self.base_url = getattr(settings, 'openai_base_url', 'https://api.openai.com/v1')
-        self.client = AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
+        self.base_url = settings.openai_base_url
+        self.response_cache = ResponseCache(
+            maxsize=RESPONSE_CACHE_SIZE, ttl=settings.openai_response_cache_ttl
         )
+        # Кэш по смыслу вопроса: каждый промах стоит запроса эмбеддинга, поэтому он включается настройкой
+        self.semantic_cache: Optional[SemanticCache] = None
+        if settings.openai_semantic_cache_threshold > 0:
+            self.semantic_cache = SemanticCache(
+                self._embed,
+                threshold=settings.openai_semantic_cache_threshold,
+                ttl=settings.openai_response_cache_ttl,
+            )
+        # Запросы к OpenAI, ответ на которые еще не пришел: (системный промпт, сообщение) -> задача
+        self._in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Потоковые ответы, которые еще генерируются: ключ кэша ответов -> общий поток
+        self._in_flight_streams: Dict[Tuple, SharedStream] = {}
+    
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Общий клиент OpenAI (services.openai_client)"""
+        return get_client()
     
     async def generate_response(self, prompt: str, context: Dict = None) -> Optional[str]:
         """Генерирует ответ с помощью OpenAI GPT-4o-mini"""
         try:
-            # Формируем полный промпт
-            system_prompt, user_message = await self._build_prompt(prompt, context)
+            # Частые вопросы отдаем из кэша ответов
+            response, store = await self._lookup_cache(prompt, context)
             
-            # Отправляем запрос к OpenAI
-            response = await self._call_openai(system_prompt, user_message, context)
+            if response is None:
+                # Формируем полный промпт
+                system_prompt, user_message = self._build_prompt(prompt, context)
+                
+                # Отправляем запрос к OpenAI
+                response = await self._call_openai_once(
+                    system_prompt, user_message, response_token_limit(prompt)
+                )
+                if response and store:
+                    store(response)
             
             if response:
-                # Ограничиваем длину ответа (Telegram ограничение ~4096 символов)
-                max_length = 3500  # Оставляем запас
-                if len(response) > max_length:
-                    response = response[:max_length] + "...\n\n(ответ сокращен для отображения в Telegram)"
+                response = trim_response(response)
                 logger.info(f"OpenAI response generated successfully")
                 return response
             else:
@@ -44,78 +219,208 @@ class OpenAIService:
             logger.error(f"Error generating OpenAI response: {e}")
             return None
     
-    async def _build_prompt(self, user_message: str, context: Dict = None) -> Tuple[str, str]:
-        """Строит полный промпт для OpenAI"""
+    async def stream_response(self, prompt: str, context: Dict = None) -> AsyncIterator[str]:
+        """
+        Генерирует ответ потоком: фрагменты текста отдаются по мере генерации
         
-        # Проверяем, есть ли релевантный контент с сайта
-        from services.website_content_service import website_content_service
-        website_content = await website_content_service.get_relevant_content_for_query(user_message)
+        Генерация останавливается, как только ответ превысил MAX_RESPONSE_LENGTH
+        (обрезает его получатель через trim_response), ошибки API пробрасываются
+        вызывающему коду. Одинаковые одновременные вопросы (тот же ключ кэша)
+        читают один общий поток OpenAI.
+        """
+        key = self._cache_key(prompt, context)
+        shared = self._in_flight_streams.get(key) if key else None
+        if shared is None:
+            cached, store = await self._lookup_cache(prompt, context)
+            if cached is not None:
+                yield cached
+                return
+            
+            if key is None:
+                # Ответ зависит от истории конкретного клиента: поток не разделяется и не кэшируется
+                async for piece in self._stream_own(prompt, context):
+                    yield piece
+                return
+            
+            # Пока шел поиск в кэше, такой же вопрос мог уже запустить генерацию
+            shared = self._in_flight_streams.get(key)
+            if shared is None:
+                shared = SharedStream(self._stream_openai(prompt, context))
+                self._in_flight_streams[key] = shared
+                shared.task.add_done_callback(lambda _: self._finish_stream(key, shared, store))
         
-        # Более короткий и гибкий системный промпт
-        system_prompt = f"""Ты - умный ассистент. ОТВЕЧАЙ ТОЛЬКО НА ЗАДАННЫЙ ВОПРОС.
-
-СТРОГИЕ ПРАВИЛА:
-1. ОТВЕЧАЙ ИМЕННО НА ТОТ ВОПРОС, КОТОРЫЙ ЗАДАЛИ
-2. НЕ ДОБАВЛЯЙ "Анна:" или другие префиксы
-3. НЕ УПОМИНАЙ ПЛАСТИЧЕСКУЮ ХИРУРГИЮ, если вопрос не о ней
-4. БУДЬ КРАТКИМ (макс. 200 символов)
-5. НЕ ПРЕДЛАГАЙ ПОМОЩЬ, если не спрашивают
-
-ПРИМЕРЫ:
-Вопрос: "какая столица у Парижа?"
-Ответ: "Париж - это столица Франции."
-
-Вопрос: "Какая площадь африки?"
-Ответ: "Площадь Африки - около 30,3 млн км²."
-
-Вопрос: "Что такое блефаропластика?"
-Ответ: "Блефаропластика - операция по коррекции век. Цена от 50 000 руб."
-
-ОТВЕЧАЙ ТОЧНО И КРАТКО!
-"""
+        async for piece in shared.read():
+            yield piece
+    
+    def _finish_stream(self, key: Tuple, shared: SharedStream, store: Optional[Callable[[str], None]]):
+        """Убирает завершенный общий поток и кэширует ответ (если поток дочитан без ошибки)"""
+        self._in_flight_streams.pop(key, None)
+        response = shared.result()
+        if response and store:
+            store(response)
+    
+    async def _stream_own(self, prompt: str, context: Dict = None) -> AsyncIterator[str]:
+        """Поток только для одного читателя: HTTP-ответ закрывается, как только чтение прервано"""
+        length = 0
+        stream = self._stream_openai(prompt, context)
+        try:
+            async for piece in stream:
+                length += len(piece)
+                yield piece
+                # Длиннее Telegram все равно не покажет: закрываем поток, чтобы не платить за лишние токены
+                if length > MAX_RESPONSE_LENGTH:
+                    break
+        finally:
+            await stream.aclose()
+    
+    async def _stream_openai(self, prompt: str, context: Dict = None) -> AsyncIterator[str]:
+        """Потоковый запрос к OpenAI с выполнением вызовов инструментов"""
+        system_prompt, user_message = self._build_prompt(prompt, context)
+        max_tokens = response_token_limit(prompt)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+        
+        # Вызовы инструментов приходят по частям: собираем их по индексу
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        # async with закрывает HTTP-ответ, даже если чтение прервано на середине
+        async with await self._create_completion(messages, max_tokens, tools=TOOLS, stream=True) as stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                for part in delta.tool_calls or ():
+                    call = tool_calls.setdefault(part.index, {"id": "", "name": "", "arguments": ""})
+                    if part.id:
+                        call["id"] = part.id
+                    if part.function:
+                        call["name"] += part.function.name or ""
+                        call["arguments"] += part.function.arguments or ""
+                if delta.content:
+                    yield delta.content
+        
+        if not tool_calls:
+            return
+        
+        await self._append_tool_results(messages, None, [tool_calls[i] for i in sorted(tool_calls)])
+        async with await self._create_completion(messages, max_tokens, stream=True) as stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    
+    def _cache_namespace(self, prompt: str, context: Dict = None) -> Optional[Tuple]:
+        """
+        Условия, при которых ответ можно переиспользовать: модель и данные услуги из промпта
+        
+        При изменении услуги (например, цены) меняется ключ, и старые ответы не выдаются.
+        None - ответ не кэшируется: в промпт попадет история диалога конкретного клиента.
+        """
+        if context and context.get('history') and uses_history(prompt):
+            return None
+        service = (context or {}).get('service') or {}
+        return (self.model, service.get('name'), service.get('price_range'), service.get('duration'))
+    
+    def _cache_key(self, prompt: str, context: Dict = None) -> Optional[Tuple]:
+        """Ключ кэша ответов: условия из _cache_namespace и вопрос без регистра, пунктуации и вежливых слов"""
+        namespace = self._cache_namespace(prompt, context)
+        return namespace + (normalize_query(prompt),) if namespace is not None else None
+    
+    async def _lookup_cache(self, prompt: str, context: Dict = None
+                            ) -> Tuple[Optional[str], Optional[Callable[[str], None]]]:
+        """
+        Ищет готовый ответ: сначала точное совпадение вопроса, затем близкий по смыслу
+        
+        Returns:
+            (ответ из кэша или None, функция сохранения нового ответа или None)
+        """
+        key = self._cache_key(prompt, context)
+        if key is None:
+            return None, None
+        
+        namespace, question = key[:-1], key[-1]
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached, None
+        
+        vector = None
+        if self.semantic_cache is not None:
+            cached, vector = await self.semantic_cache.get(namespace, question)
+            if cached is not None:
+                self.response_cache.set(key, cached)
+                return cached, None
+        
+        def store(response: str):
+            self.response_cache.set(key, response)
+            if vector is not None:
+                self.semantic_cache.set(namespace, vector, response)
+        
+        return None, store
+    
+    async def _embed(self, text: str) -> List[float]:
+        """Эмбеддинг текста для семантического кэша"""
+        response = await self.client.embeddings.create(
+            model=settings.openai_embedding_model, input=text
+        )
+        return response.data[0].embedding
+    
+    def invalidate_cache(self):
+        """Сбрасывает кэш готовых ответов (например, после правки промпта или услуг)"""
+        self.response_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+    
+    def _build_prompt(self, user_message: str, context: Dict = None) -> Tuple[str, str]:
+        """Строит полный промпт для OpenAI (контент сайта модель запрашивает сама, через search_site)"""
+        # Сначала редко меняющиеся части (услуга), в конце история и сам вопрос:
+        # одинаковое начало запросов OpenAI берет из кэша промптов.
+        # Части собираются в список и склеиваются одним join
+        parts = []
         
         # Добавляем контекст об услуге только если релевантно
-        service_context = ""
         if context and 'service' in context:
             service = context['service']
             # Добавляем только краткую информацию
-            service_context = f"""
-Краткая информация об услуге:
-Название: {service.get('name', '')}
-Цены: {service.get('price_range', '')}
-Длительность: {service.get('duration', '')}
-"""
+            parts.append("\n".join((
+                "Краткая информация об услуге:",
+                f"Название: {service.get('name', '')}",
+                f"Цены: {service.get('price_range', '')}",
+                f"Длительность: {service.get('duration', '')}",
+            )))
         
         # Добавляем историю диалога для контекста (только для медицинских вопросов)
-        chat_history = ""
-        if context and 'history' in context:
-            # Добавляем историю только если вопрос о медицине
-            medical_keywords = ['пластик', 'хирург', 'операция', 'блефаропластика', 'грудь', 'лицо']
-            if any(keyword in user_message.lower() for keyword in medical_keywords):
-                history = context['history'][-2:]  # Последние 2 сообщения
-                for msg in history:
-                    role = "Клиент" if msg.get('role') == 'user' else "Анна"
-                    chat_history += f"{role}: {msg.get('text', '')}\n"
-        
-        # Получаем контент с сайта (если есть)
-        website_info = ""
-        if website_content:
-            website_info = f"\n{website_content}\n"
-        
-        # Формируем сообщение для пользователя
-        full_user_message = f"""ВОПРОС: {user_message}
-
-{website_info}
-{service_context}
-
-{chat_history}
-
-ОТВЕТЬ ТОЛЬКО НА ЭТОТ ВОПРОС: "{user_message}"
-"""
+        if context and context.get('history') and uses_history(user_message):
+            history = context['history'][-HISTORY_PROMPT_MESSAGES:]
+            parts.append("\n".join(
+                f"{'Клиент' if msg.get('role') == 'user' else 'Анна'}: "
+                f"{compact_text(msg.get('text') or '', HISTORY_MESSAGE_LIMIT)}"
+                for msg in history
+            ))
         
-        return system_prompt, full_user_message
+        parts.append(f"ВОПРОС: {user_message}")
+        parts.append("ОТВЕТЬ ТОЛЬКО НА ЭТОТ ВОПРОС.\n")
+        
+        return SYSTEM_PROMPT, "\n\n".join(parts)
     
-    async def _call_openai(self, system_prompt: str, user_message: str, context: Dict = None) -> Optional[str]:
+    async def _call_openai_once(self, system_prompt: str, user_message: str,
+                                max_tokens: int = MAX_RESPONSE_TOKENS) -> Optional[str]:
+        """
+        Одинаковые одновременные запросы разделяют один вызов OpenAI
+        
+        Пока ответ на запрос не пришел, такие же запросы (популярный вопрос от
+        нескольких клиентов сразу) ждут его, а не обращаются к API повторно.
+        """
+        key = (system_prompt, user_message)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._call_openai(system_prompt, user_message, max_tokens))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Отмена одного ожидающего (например, по таймауту) не отменяет запрос для остальных
+        return await asyncio.shield(task)
+    
+    async def _call_openai(self, system_prompt: str, user_message: str,
+                           max_tokens: int = MAX_RESPONSE_TOKENS) -> Optional[str]:
         """Отправляет запрос к OpenAI API"""
         try:
             messages = [
@@ -123,33 +428,106 @@ class OpenAIService:
                 {"role": "user", "content": user_message}
             ]
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.8,  # Увеличиваем для более креативных ответов
-                max_tokens=600,    # Увеличиваем для развернутых ответов
-                top_p=0.9,
-                frequency_penalty=0.2,  # Уменьшаем повторения
-                presence_penalty=0.2
-            )
+            response = await self._create_completion(messages, max_tokens, tools=TOOLS)
             
-            if response.choices:
-                result = response.choices[0].message.content.strip()
-                logger.info(f"OpenAI response generated successfully, length: {len(result)}")
-                return result
-            else:
+            if not response.choices:
                 logger.error("No choices in OpenAI response")
                 return None
+            
+            # Модель попросила контент сайта: выполняем вызовы и запрашиваем итоговый ответ
+            message = response.choices[0].message
+            if message.tool_calls:
+                self._log_cache_usage(response)
+                await self._append_tool_results(messages, message.content, [
+                    {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                    for call in message.tool_calls
+                ])
+                response = await self._create_completion(messages, max_tokens)
+                
+                if not response.choices:
+                    logger.error("No choices in OpenAI response")
+                    return None
+            
+            result = (response.choices[0].message.content or "").strip()
+            logger.info(f"OpenAI response generated successfully, length: {len(result)}")
+            self._log_cache_usage(response)
+            return result
                 
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
-            # Проверяем тип ошибки для лучшей обработки
-            if "403" in str(e):
+            # Тип ошибки определяется по классу исключения, без поиска кода в его тексте
+            if isinstance(e, PermissionDeniedError):
                 logger.warning("OpenAI API key issue or region restriction")
-            elif "429" in str(e):
+            elif isinstance(e, RateLimitError):
                 logger.warning("OpenAI rate limit exceeded")
             return None
     
+    async def _create_completion(self, messages: List[Dict], max_tokens: int = MAX_RESPONSE_TOKENS,
+                                 tools: Optional[List[Dict]] = None, stream: bool = False):
+        """Один запрос chat completions с общими параметрами генерации"""
+        kwargs = {"tools": tools} if tools else {}
+        if stream:
+            kwargs["stream"] = True
+        return await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.8,  # Увеличиваем для более креативных ответов
+            max_tokens=max_tokens,
+            top_p=0.9,
+            frequency_penalty=0.2,  # Уменьшаем повторения
+            presence_penalty=0.2,
+            **kwargs
+        )
+    
+    async def _append_tool_results(self, messages: List[Dict], content: Optional[str],
+                                   calls: List[Dict[str, str]]):
+        """Добавляет в диалог вызовы инструментов модели и их результаты"""
+        messages.append({
+            "role": "assistant",
+            "content": content,
+            "tool_calls": [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"]},
+                }
+                for call in calls
+            ],
+        })
+        # Вызовы независимы: выполняем их одновременно
+        results = await asyncio.gather(
+            *(self._run_tool(call["name"], call["arguments"]) for call in calls)
+        )
+        for call, result in zip(calls, results):
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call["id"],
+                "content": result,
+            })
+    
+    async def _run_tool(self, name: str, arguments: str) -> str:
+        """Выполняет вызов инструмента, запрошенный моделью"""
+        if name != "search_site":
+            logger.warning(f"Unknown tool requested by OpenAI: {name}")
+            return "Инструмент недоступен."
+        
+        try:
+            query = orjson.loads(arguments or "{}").get("query", "")
+        except orjson.JSONDecodeError:
+            query = ""
+        
+        content = await website_content_service.get_relevant_content_for_query(query)
+        return content or "На сайте клиники нет информации по этому запросу."
+    
+    @staticmethod
+    def _log_cache_usage(response):
+        """Пишет в debug-лог, сколько токенов промпта OpenAI взял из кэша"""
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', None)
+        if cached_tokens is not None:
+            logger.debug(f"OpenAI prompt tokens: {usage.prompt_tokens}, cached: {cached_tokens}")
+    
     async def check_connection(self) -> bool:
         """Проверяет доступность OpenAI"""
         try:
@@ -159,6 +537,10 @@ class OpenAIService:
             logger.error(f"OpenAI connection check failed: {e}")
             return False
     
+    async def close(self):
+        """Закрывает пул HTTP-соединений (при остановке бота)"""
+        await close_client()
+    
     async def get_available_models(self) -> List[str]:
         """Получает список доступных моделей"""
         try:
@@ -1,70 +1,144 @@
 import asyncio
 import logging
-from typing import Dict, Optional
-from bs4 import BeautifulSoup
-import requests
+import re
+from typing import Dict, List, NamedTuple, Optional
+from bs4 import BeautifulSoup, NavigableString, Tag
+import aiohttp
 from config.settings import settings
+from services.http_session import close_session, get_session
 
 logger = logging.getLogger(__name__)
 
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+# Таймаут загрузки страницы целиком, секунды
+PAGE_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+# Ключевые слова разделов страницы (в порядке приоритета для каждого поля услуги)
+INDICATIONS_KEYWORDS = ('показания', 'показан', 'рекомендуется')
+METHODS_KEYWORDS = ('метод', 'методика', 'техника', 'проведение')
+DURATION_KEYWORDS = ('длительность', 'время', 'минут', 'час')
+RECOVERY_KEYWORDS = ('реабилитация', 'восстановление', 'период', 'после')
+PRICE_KEYWORDS = ('цена', 'стоимость', 'руб', '₽')
+SCAN_KEYWORDS = tuple(dict.fromkeys(
+    INDICATIONS_KEYWORDS + METHODS_KEYWORDS + DURATION_KEYWORDS + RECOVERY_KEYWORDS + PRICE_KEYWORDS
+))
+
+# Текстовые узлы страницы по ключевым словам, в порядке документа
+TextIndex = Dict[str, List[NavigableString]]
+# Следующий за элементом абзац или список: кэш на одну страницу, по id элемента
+NextBlocks = Dict[int, Optional[Tag]]
+
+# Проверки найденного текста (регистр не важен)
+DURATION_TEXT_RE = re.compile(r'минут|час|длительность', re.IGNORECASE)
+PRICE_TEXT_RE = re.compile(r'руб|цена|стоимость', re.IGNORECASE)
+DIGIT_RE = re.compile(r'\d')
+
+
+class PageFetch(NamedTuple):
+    """Результат загрузки страницы"""
+    html: Optional[str]  # None - страница не менялась с прошлой загрузки (304)
+    etag: Optional[str]
+    last_modified: Optional[str]
+
 
 class WebsiteParser:
     """Парсер для извлечения информации с сайта клиники"""
     
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-    
     async def parse_service_page(self, url: str) -> Dict[str, str]:
         """Парсит страницу услуги и извлекает основную информацию"""
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            response.encoding = 'utf-8'
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Извлекаем заголовок услуги
-            title = self._extract_title(soup)
-            
-            # Извлекаем описание
-            description = self._extract_description(soup)
-            
-            # Извлекаем показания
-            indications = self._extract_indications(soup)
-            
-            # Извлекаем методики
-            methods = self._extract_methods(soup)
-            
-            # Извлекаем информацию о длительности
-            duration = self._extract_duration(soup)
-            
-            # Извлекаем информацию о реабилитации
-            recovery = self._extract_recovery(soup)
-            
-            # Извлекаем информацию о ценах
-            price_range = self._extract_price(soup)
-            
-            service_data = {
-                'name': title,
-                'description': description,
-                'indications': indications,
-                'methods': methods,
-                'duration': duration,
-                'recovery': recovery,
-                'price_range': price_range,
-                'source_url': url
-            }
-            
-            logger.info(f"Successfully parsed service: {title}")
-            return service_data
-            
+            page = await self.fetch_page(url)
+            # Разбор - чистая работа CPU: выполняем в потоке, чтобы не держать event loop
+            return await asyncio.to_thread(self.parse_html, page.html, url)
         except Exception as e:
             logger.error(f"Error parsing {url}: {e}")
             return {}
     
+    async def fetch_page(self, url: str, etag: Optional[str] = None,
+                         last_modified: Optional[str] = None) -> PageFetch:
+        """
+        Загружает страницу; с etag/last_modified прошлой загрузки - условным запросом
+        
+        Если страница не менялась, сайт отвечает 304 без тела: не тратим трафик и разбор.
+        Ошибки HTTP и сети пробрасываются.
+        """
+        headers = dict(HEADERS)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        # Страница загружается через общий пул соединений, не блокируя event loop
+        async with get_session().get(url, headers=headers, timeout=PAGE_TIMEOUT) as response:
+            if response.status == 304:
+                return PageFetch(None, etag, last_modified)
+            response.raise_for_status()
+            html = await response.text(encoding='utf-8')
+            return PageFetch(html, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    
+    def parse_html(self, html: str, url: str) -> Dict[str, str]:
+        """Извлекает информацию об услуге из HTML страницы (синхронно, вызывать через asyncio.to_thread)"""
+        # lxml (C) строит дерево в разы быстрее встроенного html.parser
+        soup = BeautifulSoup(html, 'lxml')
+        
+        # Извлекаем заголовок услуги
+        title = self._extract_title(soup)
+        
+        # Извлекаем описание
+        description = self._extract_description(soup)
+        
+        # Один обход текста страницы на все поиски по ключевым словам
+        index = self._scan_once(soup)
+        next_blocks: NextBlocks = {}
+        
+        # Извлекаем показания
+        indications = self._extract_indications(index, next_blocks)
+        
+        # Извлекаем методики
+        methods = self._extract_methods(index, next_blocks)
+        
+        # Извлекаем информацию о длительности
+        duration = self._extract_duration(index)
+        
+        # Извлекаем информацию о реабилитации
+        recovery = self._extract_recovery(index, next_blocks)
+        
+        # Извлекаем информацию о ценах
+        price_range = self._extract_price(index)
+        
+        service_data = {
+            'name': title,
+            'description': description,
+            'indications': indications,
+            'methods': methods,
+            'duration': duration,
+            'recovery': recovery,
+            'price_range': price_range,
+            'source_url': url
+        }
+        
+        logger.info(f"Successfully parsed service: {title}")
+        return service_data
+    
+    def _scan_once(self, soup: BeautifulSoup) -> TextIndex:
+        """Раскладывает текстовые узлы страницы по ключевым словам за один обход дерева"""
+        index: TextIndex = {keyword: [] for keyword in SCAN_KEYWORDS}
+        for node in soup.find_all(string=True):
+            text = node.lower()
+            for keyword in SCAN_KEYWORDS:
+                if keyword in text:
+                    index[keyword].append(node)
+        return index
+    
+    def _next_block(self, parent: Tag, next_blocks: NextBlocks) -> Optional[Tag]:
+        """Следующий абзац или список после элемента (один поиск на элемент за страницу)"""
+        key = id(parent)
+        if key not in next_blocks:
+            next_blocks[key] = parent.find_next(['p', 'ul', 'ol'])
+        return next_blocks[key]
+    
     def _extract_title(self, soup: BeautifulSoup) -> str:
         """Извлекает заголовок услуги"""
         # Ищем h1 или другие заголовки
@@ -103,63 +177,51 @@ class WebsiteParser:
         
         return "Пластика верхних век (блефаропластика) - хирургическая процедура по коррекции возрастных изменений верхних век."
     
-    def _extract_indications(self, soup: BeautifulSoup) -> str:
+    def _extract_indications(self, index: TextIndex, next_blocks: NextBlocks) -> str:
         """Извлекает показания к процедуре"""
-        indications_keywords = ['показания', 'показан', 'рекомендуется']
-        
         # Ищем секции с показаниями
-        for keyword in indications_keywords:
-            elements = soup.find_all(text=lambda text: text and keyword.lower() in text.lower())
-            for element in elements:
+        for keyword in INDICATIONS_KEYWORDS:
+            for element in index[keyword]:
                 parent = element.parent
                 if parent:
                     # Берем следующий абзац или список
-                    next_sibling = parent.find_next(['p', 'ul', 'ol'])
+                    next_sibling = self._next_block(parent, next_blocks)
                     if next_sibling:
                         return next_sibling.get_text(strip=True)
         
         # Возвращаем стандартные показания для блефаропластики
         return "Нависание кожи верхних век, избыточная кожа, мешки под глазами, ухудшение поля зрения, усталый вид глаз."
     
-    def _extract_methods(self, soup: BeautifulSoup) -> str:
+    def _extract_methods(self, index: TextIndex, next_blocks: NextBlocks) -> str:
         """Извлекает методики проведения"""
-        methods_keywords = ['метод', 'методика', 'техника', 'проведение']
-        
-        for keyword in methods_keywords:
-            elements = soup.find_all(text=lambda text: text and keyword.lower() in text.lower())
-            for element in elements:
+        for keyword in METHODS_KEYWORDS:
+            for element in index[keyword]:
                 parent = element.parent
                 if parent:
-                    next_sibling = parent.find_next(['p', 'ul', 'ol'])
+                    next_sibling = self._next_block(parent, next_blocks)
                     if next_sibling:
                         return next_sibling.get_text(strip=True)
         
         return "Хирургическая блефаропластика, трансконъюнктивальная методика, лазерная коррекция."
     
-    def _extract_duration(self, soup: BeautifulSoup) -> str:
+    def _extract_duration(self, index: TextIndex) -> str:
         """Извлекает информацию о длительности"""
-        duration_keywords = ['длительность', 'время', 'минут', 'час']
-        
-        for keyword in duration_keywords:
-            elements = soup.find_all(text=lambda text: text and keyword.lower() in text.lower())
-            for element in elements:
+        for keyword in DURATION_KEYWORDS:
+            for element in index[keyword]:
                 text = element.get_text(strip=True)
-                if any(word in text.lower() for word in ['минут', 'час', 'длительность']):
+                if DURATION_TEXT_RE.search(text):
                     return text
         
         return "1-2 часа"
     
-    def _extract_recovery(self, soup: BeautifulSoup) -> str:
+    def _extract_recovery(self, index: TextIndex, next_blocks: NextBlocks) -> str:
         """Извлекает информацию о реабилитации"""
-        recovery_keywords = ['реабилитация', 'восстановление', 'период', 'после']
-        
-        for keyword in recovery_keywords:
-            elements = soup.find_all(text=lambda text: text and keyword.lower() in text.lower())
-            for element in elements:
+        for keyword in RECOVERY_KEYWORDS:
+            for element in index[keyword]:
                 parent = element.parent
                 if parent:
                     # Ищем список или абзац с информацией о восстановлении
-                    next_sibling = parent.find_next(['p', 'ul', 'ol'])
+                    next_sibling = self._next_block(parent, next_blocks)
                     if next_sibling:
                         text = next_sibling.get_text(strip=True)
                         if len(text) > 30:  # Фильтруем короткие совпадения
@@ -167,16 +229,13 @@ class WebsiteParser:
         
         return "Реабилитационный период: 7-10 дней - отек и синяки, 2 недели - снятие швов, 1 месяц - возврат к обычной жизни, 3-6 месяцев - окончательный результат."
     
-    def _extract_price(self, soup: BeautifulSoup) -> str:
+    def _extract_price(self, index: TextIndex) -> str:
         """Извлекает информацию о ценах"""
-        price_keywords = ['цена', 'стоимость', 'руб', '₽']
-        
-        for keyword in price_keywords:
-            elements = soup.find_all(text=lambda text: text and keyword.lower() in text.lower())
-            for element in elements:
+        for keyword in PRICE_KEYWORDS:
+            for element in index[keyword]:
                 text = element.get_text(strip=True)
                 # Ищем числа и слова о ценах
-                if any(char.isdigit() for char in text) and any(word in text.lower() for word in ['руб', 'цена', 'стоимость']):
+                if DIGIT_RE.search(text) and PRICE_TEXT_RE.search(text):
                     return text
         
         # Если не нашли точную цену, возвращаем примерный диапазон
@@ -186,7 +245,10 @@ class WebsiteParser:
 async def main():
     """Тестовая функция для проверки парсера"""
     parser = WebsiteParser()
-    service_data = await parser.parse_service_page(settings.clinic_website)
+    try:
+        service_data = await parser.parse_service_page(settings.clinic_website)
+    finally:
+        await close_session()
     
     print("Извлеченные данные:")
     for key, value in service_data.items():
@@ -0,0 +1,44 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Кэш готовых ответов модели в памяти процесса: TTL и вытеснение давно не использованных
+
+    Значения не копируются, поэтому в нем же хранятся и разобранные страницы сайта.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает ответ, если он есть и не устарел"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, response = item
+        if time.monotonic() >= expires_at:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return response
+
+    def set(self, key: Hashable, response: Any):
+        """Сохраняет ответ; при переполнении вытесняет самый старый по использованию"""
+        if self.ttl <= 0:
+            return
+        self._items[key] = (time.monotonic() + self.ttl, response)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Сбрасывает кэш"""
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,83 @@
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EmbedFunc = Callable[[str], Awaitable[List[float]]]
+
+
+class SemanticCache:
+    """
+    Кэш ответов по смыслу вопроса: «сколько стоит» и «какая цена» дают один ответ
+
+    Вопросы хранятся как нормированные эмбеддинги в кольцевом буфере numpy;
+    поиск - одно умножение матрицы на вектор (косинусная близость). Ответ
+    выдается, если близость не ниже threshold, запись не устарела и совпадает
+    namespace (модель и данные услуги, с которыми ответ был получен).
+    """
+
+    def __init__(self, embed: EmbedFunc, threshold: float = 0.92,
+                 maxsize: int = 2000, ttl: float = 3600):
+        self.embed = embed
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None
+        self._namespaces = np.full(maxsize, -1, dtype=np.int32)
+        self._expires_at = np.zeros(maxsize, dtype=np.float64)
+        self._responses: List[Optional[str]] = [None] * maxsize
+        self._namespace_ids: Dict[Hashable, int] = {}
+        self._next = 0
+
+    async def get(self, namespace: Hashable, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Ищет ответ на близкий по смыслу вопрос
+
+        Returns:
+            (ответ или None, эмбеддинг вопроса для set или None, если его получить не удалось)
+        """
+        try:
+            vector = np.asarray(await self.embed(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Failed to embed question for semantic cache: {e}")
+            return None, None
+
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None, None
+        vector /= norm
+
+        namespace_id = self._namespace_ids.get(namespace)
+        if self._vectors is None or namespace_id is None:
+            return None, vector
+
+        scores = self._vectors @ vector
+        valid = (self._namespaces == namespace_id) & (self._expires_at > time.monotonic())
+        scores[~valid] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            logger.debug(f"Semantic cache hit, similarity {scores[best]:.3f}")
+            return self._responses[best], vector
+        return None, vector
+
+    def set(self, namespace: Hashable, vector: np.ndarray, response: str):
+        """Запоминает ответ; при заполнении буфера вытесняется самая старая запись"""
+        if self._vectors is None:
+            self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+
+        slot = self._next
+        self._next = (self._next + 1) % self.maxsize
+        self._vectors[slot] = vector
+        self._namespaces[slot] = self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+        self._expires_at[slot] = time.monotonic() + self.ttl
+        self._responses[slot] = response
+
+    def clear(self):
+        """Сбрасывает кэш"""
+        self._namespaces.fill(-1)
+        self._responses = [None] * self.maxsize
+        self._namespace_ids.clear()
+        self._next = 0
@@ -0,0 +1,117 @@
+import logging
+import time
+from typing import Dict, List, Optional
+from redis import asyncio as aioredis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.settings import settings
+from models.database import Service
+from models.repositories import ServiceRepository
+
+logger = logging.getLogger(__name__)
+
+# Версия списка услуг в Redis: админ-панель (другой процесс) увеличивает ее
+# после правки услуги, и процессы бота перечитывают услуги, не дожидаясь ttl
+SERVICES_VERSION_KEY = "med-plastic:services-version"
+
+
+class ServiceCache:
+    """Кэш списка услуг в памяти процесса (справочные данные, меняются редко)"""
+
+    def __init__(self, ttl: float = 300, store: Optional[aioredis.Redis] = None):
+        self.ttl = ttl
+        # Общая для процессов версия списка услуг (если настроен Redis)
+        self._store = store
+        self._services: Optional[List[Service]] = None
+        self._service_context: Optional[Dict] = None
+        self._expires_at = 0.0
+        self._version: Optional[bytes] = None
+
+    async def get_all(self, session: AsyncSession) -> List[Service]:
+        """Возвращает список услуг, обращаясь к БД не чаще раза в ttl секунд или после смены версии"""
+        version = await self._load_version()
+        if (self._services is not None and time.monotonic() < self._expires_at
+                and version == self._version):
+            return self._services
+
+        services = list(await ServiceRepository(session).get_all())
+
+        # Пустой список не кэшируем, чтобы сразу увидеть добавленные услуги
+        if services:
+            self._services = services
+            self._service_context = self._to_context(services[0])
+            self._expires_at = time.monotonic() + self.ttl
+            self._version = version
+            logger.debug(f"Service cache refreshed: {len(services)} services")
+
+        return services
+
+    async def _load_version(self) -> Optional[bytes]:
+        """
+        Текущая версия списка услуг из Redis
+
+        Недоступность Redis не мешает отвечать: кэш тогда живет до истечения ttl.
+        """
+        if self._store is None:
+            return None
+        try:
+            return await self._store.get(SERVICES_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to load services version: {e}")
+            return self._version
+
+    async def get_by_id(self, session: AsyncSession, service_id: int) -> Optional[Service]:
+        """Ищет услугу в кэше, при промахе обращается к БД"""
+        for service in await self.get_all(session):
+            if service.id == service_id:
+                return service
+        # Услуга могла появиться после обновления кэша
+        return await ServiceRepository(session).get_by_id(service_id)
+
+    async def get_service_context(self, session: AsyncSession) -> Optional[Dict]:
+        """Возвращает основную услугу в виде словаря для контекста LLM"""
+        services = await self.get_all(session)
+        if not services:
+            return None
+        return self._service_context
+
+    @staticmethod
+    def _to_context(service: Service) -> Dict:
+        """Снимок полей услуги без служебного состояния SQLAlchemy"""
+        return {
+            'name': service.name,
+            'description': service.description,
+            'indications': service.indications,
+            'methods': service.methods,
+            'duration': service.duration,
+            'recovery': service.recovery,
+            'price_range': service.price_range,
+            'source_url': service.source_url,
+        }
+
+    def invalidate(self):
+        """Сбрасывает кэш (после изменения услуг)"""
+        self._services = None
+        self._service_context = None
+        self._expires_at = 0.0
+
+    async def invalidate_shared(self):
+        """Сбрасывает кэш услуг в этом процессе и (через версию в Redis) во всех процессах бота"""
+        self.invalidate()
+        if self._store is None:
+            return
+        try:
+            await self._store.incr(SERVICES_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to bump services version: {e}")
+
+    async def close(self):
+        """Закрывает соединение с Redis (при остановке процесса)"""
+        if self._store is not None:
+            await self._store.aclose()
+
+
+# Глобальный экземпляр
+service_cache = ServiceCache(
+    store=aioredis.from_url(settings.redis_url) if settings.redis_url else None
+)
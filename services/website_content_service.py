@@ -1,18 +1,51 @@
 import asyncio
 import logging
+import time
+from functools import lru_cache
 from typing import Dict, Optional, List
+import ahocorasick
+import orjson
+from redis import asyncio as aioredis
+from config.settings import settings
 from services.parser import WebsiteParser
+from services.response_cache import ResponseCache
 from models.repositories import ServiceRepository
+from utils.message_splitter import compact_text
+from utils.query_normalizer import normalize_query
 
 logger = logging.getLogger(__name__)
 
+# Поля страницы услуги в промпте и предел длины каждого, символов
+CONTENT_FIELDS = (
+    ('name', 'Название услуги'),
+    ('description', 'Описание'),
+    ('indications', 'Показания'),
+    ('methods', 'Методики проведения'),
+    ('duration', 'Длительность'),
+    ('recovery', 'Реабилитация'),
+    ('price_range', 'Стоимость'),
+)
+CONTENT_FIELD_LIMIT = 600
+
+# Сколько страниц сайта загружается одновременно при предзагрузке
+PRELOAD_CONCURRENCY = 8
+
+# Кэш разобранных страниц: число страниц и время до повторной загрузки, секунды
+PAGE_CACHE_SIZE = 256
+PAGE_CACHE_TTL = 3600
+
+# Разобранные страницы в Redis переживают перезапуск бота: холодный старт без запросов к сайту
+PAGE_STORE_PREFIX = "med-plastic:site-page:"
+PAGE_STORE_TTL = 24 * 60 * 60
+
 
 class WebsiteContentService:
     """Сервис для получения контента с сайта клиники и интеграции в GPT"""
     
     def __init__(self):
         self.parser = WebsiteParser()
-        self.cached_content = {}
+        # Разобранные страницы по URL: синонимы одной услуги делят одну запись
+        self.cached_content = ResponseCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
         self.service_urls = {
             "блефаропластика": "https://med-plastic.ru/plastika-verhnih-vek/",
             "пластика век": "https://med-plastic.ru/plastika-verhnih-vek/",
@@ -20,87 +53,159 @@ class WebsiteContentService:
             "пластика верхних век": "https://med-plastic.ru/plastika-verhnih-vek/",
             # Можно добавить другие услуги по мере необходимости
         }
+        # Готовый текст для промпта по URL страницы: для одной услуги он побайтно
+        # одинаков во всех запросах и обновляется вместе со страницей
+        self._formatted_content = ResponseCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+        # Все ключевые слова услуг ищутся за один проход по запросу
+        self._automaton = ahocorasick.Automaton()
+        for priority, keywords in enumerate(self.service_urls):
+            self._automaton.add_word(keywords, (priority, keywords))
+        self._automaton.make_automaton()
+        # Постоянное хранилище страниц (если настроен Redis)
+        self._store: Optional[aioredis.Redis] = (
+            aioredis.from_url(settings.redis_url) if settings.redis_url else None
+        )
+        # Кэш на экземпляр: нормализованный запрос -> ключевое слово услуги
+        self._find_query_keyword = lru_cache(maxsize=1024)(self._match_query_keyword)
     
     async def get_service_content(self, service_name: str) -> Optional[Dict]:
         """Получает контент для конкретной услуги"""
-        # Проверяем кэш
-        if service_name in self.cached_content:
-            return self.cached_content[service_name]
-        
         # Ищем URL для услуги
         url = self._find_service_url(service_name)
         if not url:
             logger.warning(f"No URL found for service: {service_name}")
             return None
+        return await self._get_page(url)
+    
+    async def _get_page(self, url: str) -> Optional[Dict]:
+        """Разобранная страница сайта: из кэша или с сайта"""
+        # Проверяем кэш
+        content = self.cached_content.get(url)
+        if content is not None:
+            return content
+        
+        # Страница, разобранная раньше (в том числе до перезапуска): свежую берем как есть
+        record = await self._load_stored_page(url)
+        if record and time.time() - record.get('checked_at', 0) < PAGE_CACHE_TTL:
+            self.cached_content.set(url, record['content'])
+            return record['content']
         
         try:
-            # Парсим страницу
-            content = await self.parser.parse_service_page(url)
-            if content:
-                # Кэшируем результат
-                self.cached_content[service_name] = content
-                logger.info(f"Successfully cached content for {service_name}")
-                return content
+            # Условный запрос: если страница не менялась, сайт ответит 304 без тела
+            page = await self.parser.fetch_page(
+                url,
+                etag=record.get('etag') if record else None,
+                last_modified=record.get('last_modified') if record else None,
+            )
+            if page.html is None:
+                logger.debug(f"Page not modified: {url}")
+                content = record['content'] if record else None
             else:
-                logger.warning(f"Failed to parse content for {service_name}")
-                return None
-                
+                # Разбор страницы не блокирует ответы другим пользователям
+                content = await asyncio.to_thread(self.parser.parse_html, page.html, url)
         except Exception as e:
-            logger.error(f"Error getting service content for {service_name}: {e}")
+            logger.error(f"Error getting service content for {url}: {e}")
+            # Устаревшая копия лучше, чем никакой; в кэш ее не кладем, чтобы повторить загрузку
+            return record['content'] if record else None
+        
+        if not content:
+            logger.warning(f"Failed to parse content for {url}")
+            return None
+        
+        # Кэшируем результат
+        self.cached_content.set(url, content)
+        await self._store_page(url, {
+            'content': content,
+            'etag': page.etag,
+            'last_modified': page.last_modified,
+            'checked_at': time.time(),
+        })
+        logger.info(f"Successfully cached content for {url}")
+        return content
+    
+    async def _load_stored_page(self, url: str) -> Optional[Dict]:
+        """
+        Запись о странице из Redis: content, etag, last_modified и checked_at (время проверки)
+        
+        Недоступность Redis не мешает загрузить страницу с сайта.
+        """
+        if self._store is None:
             return None
+        try:
+            data = await self._store.get(PAGE_STORE_PREFIX + url)
+        except Exception as e:
+            logger.warning(f"Failed to load stored page {url}: {e}")
+            return None
+        return orjson.loads(data) if data else None
+    
+    async def _store_page(self, url: str, record: Dict):
+        """Сохраняет запись о странице в Redis на PAGE_STORE_TTL"""
+        if self._store is None:
+            return
+        try:
+            await self._store.set(PAGE_STORE_PREFIX + url, orjson.dumps(record), ex=PAGE_STORE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to store page {url}: {e}")
+    
+    async def close(self):
+        """Закрывает соединение с Redis (при остановке бота)"""
+        if self._store is not None:
+            await self._store.aclose()
     
     def _find_service_url(self, service_name: str) -> Optional[str]:
         """Находит URL для услуги по ключевым словам"""
-        service_name_lower = service_name.lower()
-        
-        for keywords, url in self.service_urls.items():
-            if keywords in service_name_lower:
-                return url
-        
-        return None
+        keywords = self._find_query_keyword(normalize_query(service_name))
+        return self.service_urls[keywords] if keywords else None
+    
+    def _match_query_keyword(self, normalized_query: str) -> Optional[str]:
+        """Первое по порядку service_urls ключевое слово, встречающееся в нормализованном запросе"""
+        best = min((value for _, value in self._automaton.iter(normalized_query)), default=None)
+        return best[1] if best else None
     
     async def get_relevant_content_for_query(self, query: str) -> Optional[str]:
         """Получает релевантный контент для запроса"""
-        query_lower = query.lower()
-        
         # Проверяем, относится ли запрос к услугам с сайта
-        for keywords in self.service_urls.keys():
-            if keywords in query_lower:
-                content = await self.get_service_content(keywords)
-                if content:
-                    return self._format_content_for_gpt(content)
+        keywords = self._find_query_keyword(normalize_query(query))
+        if keywords is None:
+            return None
         
-        return None
+        url = self.service_urls[keywords]
+        formatted = self._formatted_content.get(url)
+        if formatted is None:
+            content = await self.get_service_content(keywords)
+            if not content:
+                # Неудачу не кэшируем: при следующем запросе попробуем снова
+                return None
+            formatted = self._format_content_for_gpt(content)
+            self._formatted_content.set(url, formatted)
+        return formatted
     
     def _format_content_for_gpt(self, content: Dict) -> str:
         """Форматирует контент для использования в GPT промпте"""
-        formatted = f"""
-ИНФОРМАЦИЯ С САЙТА КЛИНИКИ:
-
-Название услуги: {content.get('name', '')}
-
-Описание: {content.get('description', '')}
-
-Показания: {content.get('indications', '')}
-
-Методики проведения: {content.get('methods', '')}
-
-Длительность: {content.get('duration', '')}
-
-Реабилитация: {content.get('recovery', '')}
-
-Стоимость: {content.get('price_range', '')}
-
-Источник: {content.get('source_url', '')}
-"""
-        return formatted.strip()
+        # Каждое поле сжимается до CONTENT_FIELD_LIMIT: модель не перечитывает
+        # многословные блоки страницы, пустые поля пропускаются
+        lines = ["ИНФОРМАЦИЯ С САЙТА КЛИНИКИ:"]
+        for field, label in CONTENT_FIELDS:
+            value = compact_text(content.get(field) or '', CONTENT_FIELD_LIMIT)
+            if value:
+                lines.append(f"{label}: {value}")
+        if content.get('source_url'):
+            lines.append(f"Источник: {content['source_url']}")
+        return "\n\n".join(lines)
     
     async def preload_all_services(self):
         """Предзагружает контент всех услуг"""
         logger.info("Preloading service content...")
-        for service_name in self.service_urls.keys():
-            await self.get_service_content(service_name)
-        logger.info(f"Preloaded {len(self.cached_content)} services")
+        # Страницы загружаются параллельно: предзагрузка занимает время одного запроса, а не N
+        semaphore = asyncio.Semaphore(PRELOAD_CONCURRENCY)
+        
+        async def preload(url: str):
+            async with semaphore:
+                await self._get_page(url)
+        
+        # Каждая страница загружается один раз, сколько бы синонимов на нее ни вело
+        await asyncio.gather(*(preload(url) for url in dict.fromkeys(self.service_urls.values())))
+        logger.info(f"Preloaded {len(self.cached_content)} service pages")
 
 
 # Глобальный экземпляр
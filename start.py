@@ -4,6 +4,7 @@ import os
 import sys
 import subprocess
 import asyncio
+from importlib import metadata
 from pathlib import Path
 
 def check_python_version():
@@ -21,18 +22,39 @@ def check_env_file():
         print("Скопируйте .env.example в .env и настройте его")
         return False
     
-    # Проверяем ключевые переменные
-    with open(env_file) as f:
-        content = f.read()
-        if "your_telegram_bot_token_here" in content:
-            print("❌ Настройте BOT_TOKEN в .env файле")
-            return False
+    # Проверяем ключевые переменные по тем же настройкам, что прочитает бот:
+    # .env разбирается один раз, get_settings кэширует результат на процесс
+    try:
+        from config.settings import get_settings
+        settings = get_settings()
+    except Exception as e:
+        print(f"❌ Ошибка в настройках .env: {e}")
+        return False
+    if settings.bot_token == "your_telegram_bot_token_here":
+        print("❌ Настройте BOT_TOKEN в .env файле")
+        return False
     
     print("✅ .env файл настроен")
     return True
 
-def install_dependencies():
-    """Установка зависимостей"""
+def dependencies_installed() -> bool:
+    """Проект уже установлен в окружение той же версии, что в pyproject.toml"""
+    # tomllib есть только в Python 3.11+: импорт после check_python_version
+    import tomllib
+    
+    try:
+        with open("pyproject.toml", "rb") as f:
+            project = tomllib.load(f)["project"]
+        return metadata.version(project["name"]) == project["version"]
+    except (OSError, KeyError, tomllib.TOMLDecodeError, metadata.PackageNotFoundError):
+        return False
+
+def install_dependencies(force: bool = False):
+    """Установка зависимостей (pip запускается, только если проект не установлен или force)"""
+    if not force and dependencies_installed():
+        print("✅ Зависимости уже установлены")
+        return True
+    
     print("📦 Установка зависимостей...")
     try:
         subprocess.run([sys.executable, "-m", "pip", "install", "-e", "."], check=True)
@@ -43,57 +65,27 @@ def install_dependencies():
         return False
 
 async def init_database():
-    """Инициализация базы данных"""
+    """Инициализация базы данных и заполнение услуг (та же процедура, что при запуске бота)"""
     print("🗄️ Инициализация базы данных...")
     try:
-        from models.base import create_db
-        await create_db()
+        from main import init_database as init_bot_database
+        await init_bot_database()
         print("✅ База данных инициализирована")
         return True
     except Exception as e:
         print(f"❌ Ошибка инициализации БД: {e}")
         return False
 
-async def parse_services():
-    """Парсинг услуг с сайта"""
-    print("🌐 Парсинг услуг с сайта...")
-    try:
-        from services.parser import WebsiteParser
-        from config.settings import settings
-        from models.base import async_session_maker
-        from models.repositories import ServiceRepository
-        
-        parser = WebsiteParser()
-        service_data = await parser.parse_service_page(settings.clinic_website)
-        
-        async with async_session_maker() as session:
-            repo = ServiceRepository(session)
-            services = await repo.get_all()
-            
-            if not services and service_data:
-                await repo.create(**service_data)
-                print(f"✅ Услуга '{service_data.get('name')}' добавлена в БД")
-            elif services:
-                print("✅ Услуги уже есть в БД")
-            else:
-                print("⚠️ Не удалось получить данные с сайта, используются данные по умолчанию")
-        
-        return True
-    except Exception as e:
-        print(f"⚠️ Ошибка парсинга: {e}")
-        return True  # Не критичная ошибка
-
-def check_openai():
+async def check_openai():
     """Проверка доступности OpenAI"""
     print("🤖 Проверка OpenAI...")
     try:
-        import asyncio
         from services.openai_service import openai_service
         
-        async def test_connection():
-            return await openai_service.check_connection()
-        
-        result = asyncio.run(test_connection())
+        try:
+            result = await openai_service.check_connection()
+        finally:
+            await openai_service.close()
         if result:
             print("✅ OpenAI доступен")
             return True
@@ -104,43 +96,99 @@ def check_openai():
         print(f"⚠️ Ошибка проверки OpenAI: {e}")
         return False
 
-def run_tests():
+async def initialize():
+    """Инициализация БД и проверка OpenAI: шаги независимы и выполняются одновременно"""
+    from models.base import dispose_engine
+    from services.http_session import close_session
+    
+    try:
+        results = await asyncio.gather(init_database(), check_openai(), return_exceptions=True)
+    finally:
+        # Сессия, через которую при пустой базе загружалась страница услуги,
+        # и пул соединений с БД привязаны к этому циклу событий
+        await close_session()
+        await dispose_engine()
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"❌ Ошибка инициализации: {result}")
+
+async def run_process(*args: str) -> int:
+    """Запускает python-процесс (вывод идет в консоль) и ждет его завершения"""
+    proc = await asyncio.create_subprocess_exec(sys.executable, *args)
+    try:
+        return await proc.wait()
+    except asyncio.CancelledError:
+        # Остановка start.py останавливает и дочерний процесс
+        if proc.returncode is None:
+            proc.terminate()
+            await proc.wait()
+        raise
+
+async def run_tests():
     """Запуск тестов"""
     print("🧪 Запуск тестов...")
     try:
-        result = subprocess.run([sys.executable, "-m", "pytest", "tests/", "-v"], 
-                              capture_output=True, text=True)
-        if result.returncode == 0:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "pytest", "tests/", "-v",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        # Вывод печатается построчно по мере выполнения, а не копится в памяти
+        async for line in proc.stdout:
+            print(line.decode(errors="replace"), end="")
+        if await proc.wait() == 0:
             print("✅ Тесты пройдены")
             return True
         else:
-            print("⚠️ Некоторые тесты не пройдены:")
-            print(result.stdout)
+            print("⚠️ Некоторые тесты не пройдены")
             return False
     except Exception as e:
         print(f"❌ Ошибка запуска тестов: {e}")
         return False
 
-def start_bot():
+async def start_bot():
     """Запуск бота"""
     print("🚀 Запуск Telegram бота...")
     try:
-        subprocess.run([sys.executable, "main.py"])
-    except KeyboardInterrupt:
-        print("\n👋 Бот остановлен")
+        await run_process("main.py")
     except Exception as e:
         print(f"❌ Ошибка запуска бота: {e}")
 
-def start_admin():
+async def start_admin():
     """Запуск админ-панели"""
     print("🎛️ Запуск админ-панели...")
     try:
-        subprocess.run([sys.executable, "admin/main.py"])
-    except KeyboardInterrupt:
-        print("\n👋 Админ-панель остановлена")
+        await run_process("admin/main.py")
     except Exception as e:
         print(f"❌ Ошибка запуска админ-панели: {e}")
 
+async def run_services(*starters):
+    """Запускает бота и/или админ-панель в одном цикле событий и ждет их завершения"""
+    await asyncio.gather(*(starter() for starter in starters))
+
+def print_usage():
+    """Список команд запуска"""
+    print("\n🎉 Проект готов к запуску!")
+    print("\nДоступные команды:")
+    print("  python start.py              - Запуск бота")
+    print("  python start.py admin        - Запуск админ-панели")
+    print("  python start.py all          - Запуск бота и админ-панели")
+    print("  python start.py --test       - Запуск тестов")
+    print("  python start.py --force-install - Переустановка зависимостей")
+    print("  docker-compose up -d         - Запуск в Docker")
+
+async def startup(with_tests: bool, starters):
+    """Инициализация, тесты и запуск сервисов в одном цикле событий"""
+    await initialize()
+    
+    # Тесты (опционально)
+    if with_tests:
+        await run_tests()
+    
+    print_usage()
+    
+    if starters:
+        await run_services(*starters)
+
 def main():
     """Главная функция"""
     print("🏥 Med-Plastic Bot - Инициализация проекта\n")
@@ -148,38 +196,29 @@ def main():
     # Проверки
     check_python_version()
     
-    if not check_env_file():
+    # Зависимости ставятся до проверки .env: она читает настройки через pydantic-settings
+    if not install_dependencies(force="--force-install" in sys.argv):
         return
     
-    if not install_dependencies():
+    if not check_env_file():
         return
     
-    # Инициализация
-    async def init():
-        await init_database()
-        await parse_services()
-    
-    asyncio.run(init())
-    
-    # Проверки (не блокирующие)
-    check_openai()
-    
-    # Тесты (опционально)
-    if "--test" in sys.argv:
-        run_tests()
-    
-    print("\n🎉 Проект готов к запуску!")
-    print("\nДоступные команды:")
-    print("  python start.py              - Запуск бота")
-    print("  python start.py admin        - Запуск админ-панели")
-    print("  python start.py --test       - Запуск тестов")
-    print("  docker-compose up -d         - Запуск в Docker")
-    
+    starters = ()
     if len(sys.argv) > 1:
         if sys.argv[1] == "admin":
-            start_admin()
+            starters = (start_admin,)
+        elif sys.argv[1] == "all":
+            starters = (start_bot, start_admin)
         else:
-            start_bot()
+            starters = (start_bot,)
+    
+    # Один цикл событий uvloop (как у бота) на все шаги: инициализацию, тесты и сервисы
+    from main import install_event_loop_policy
+    install_event_loop_policy()
+    try:
+        asyncio.run(startup("--test" in sys.argv, starters))
+    except KeyboardInterrupt:
+        print("\n👋 Остановлено")
 
 if __name__ == "__main__":
     main()
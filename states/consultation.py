@@ -1,3 +1,4 @@
+from typing import Final
 from aiogram.fsm.state import State, StatesGroup
 
 
@@ -9,3 +10,11 @@ class ConsultationStates(StatesGroup):
     entering_phone = State()    # Ввод телефона
     entering_date = State()     # Ввод предпочтительной даты
     entering_comment = State()  # Ввод комментария
+
+
+# Готовые строки состояний для фильтров хендлеров: State.state собирает строку
+# заново при каждом обращении, а фильтр проверяется на каждое входящее сообщение
+ENTERING_NAME: Final[str] = ConsultationStates.entering_name.state
+ENTERING_PHONE: Final[str] = ConsultationStates.entering_phone.state
+ENTERING_DATE: Final[str] = ConsultationStates.entering_date.state
+ENTERING_COMMENT: Final[str] = ConsultationStates.entering_comment.state
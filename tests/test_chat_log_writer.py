@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.chat_log_writer import ChatLogWriter
+
+
+class TestChatLogWriter:
+    """Тесты для пакетной записи логов диалогов"""
+
+    @pytest.mark.asyncio
+    async def test_batches_entries(self):
+        """Тест записи нескольких логов одной пачкой"""
+        writer = ChatLogWriter(batch_size=10, flush_interval=0.05)
+        session = MagicMock()
+        session.commit = AsyncMock()
+        session_maker = MagicMock()
+        session_maker.return_value.__aenter__ = AsyncMock(return_value=session)
+        session_maker.return_value.__aexit__ = AsyncMock(return_value=False)
+
+        with patch('services.chat_log_writer.async_session_maker', session_maker), \
+                patch('services.chat_log_writer.ChatLogRepository') as mock_repo:
+            mock_repo.return_value.bulk_create = AsyncMock()
+
+            writer.start()
+            for i in range(3):
+                writer.log(user_id=1, message=f"Вопрос {i}", response="Ответ", intent="question")
+            await writer.stop()
+
+            mock_repo.return_value.bulk_create.assert_called_once()
+            batch = mock_repo.return_value.bulk_create.call_args[0][0]
+            assert [entry['message'] for entry in batch] == ["Вопрос 0", "Вопрос 1", "Вопрос 2"]
+            session.commit.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_pending(self):
+        """Тест записи оставшихся логов при остановке"""
+        writer = ChatLogWriter(batch_size=100, flush_interval=60)
+
+        with patch.object(writer, '_flush', AsyncMock()) as mock_flush:
+            writer.start()
+            writer.log(user_id=1, message="/start", response="Привет", intent="start")
+            await writer.stop()
+
+            mock_flush.assert_called_once()
+            assert mock_flush.call_args[0][0][0]['intent'] == "start"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
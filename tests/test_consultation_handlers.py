@@ -0,0 +1,68 @@
+import orjson
+import pytest
+from datetime import date, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from handlers.consultation_handlers import parse_preferred_date, preferred_date_from_state, process_date
+from main import orjson_dumps
+
+
+class TestParsePreferredDate:
+    """Тесты для разбора даты консультации"""
+
+    def test_supported_formats(self):
+        """Тест поддерживаемых форматов даты"""
+        future = date.today() + timedelta(days=30)
+
+        for fmt in ('%d.%m.%Y', '%d.%m.%y', '%d-%m-%Y', '%d-%m-%y'):
+            assert parse_preferred_date(future.strftime(fmt)) == future
+
+    def test_past_date(self):
+        """Тест даты в прошлом"""
+        past = date.today() - timedelta(days=1)
+
+        assert parse_preferred_date(past.strftime('%d.%m.%Y')) is None
+
+    def test_invalid_input(self):
+        """Тест некорректного ввода"""
+        assert parse_preferred_date("31.02.2099") is None
+        assert parse_preferred_date("01.01-2099") is None
+        assert parse_preferred_date("завтра") is None
+
+
+class TestPreferredDateState:
+    """Тесты хранения даты консультации в данных FSM"""
+
+    async def _stored_data(self, text):
+        """Данные, которые process_date сохраняет в FSM, после сериализации RedisStorage"""
+        message = MagicMock()
+        message.text = text
+        message.answer = AsyncMock()
+        state = MagicMock()
+        state.update_data = AsyncMock()
+        state.set_state = AsyncMock()
+
+        await process_date(message, state)
+
+        data = state.update_data.await_args.kwargs
+        return orjson.loads(orjson_dumps(data))
+
+    @pytest.mark.asyncio
+    async def test_date_round_trip(self):
+        """Тест: дата переживает JSON-сериализацию хранилища FSM"""
+        future = date.today() + timedelta(days=30)
+
+        data = await self._stored_data(future.strftime('%d.%m.%Y'))
+
+        assert preferred_date_from_state(data) == future
+
+    @pytest.mark.asyncio
+    async def test_any_time_round_trip(self):
+        """Тест: без даты в заявку передается None"""
+        data = await self._stored_data("удобно в любое время")
+
+        assert preferred_date_from_state(data) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,33 @@
+import pytest
+
+from models.database import Service
+from keyboards.callbacks import ServiceCB
+from keyboards.reply_keyboards import (
+    get_main_keyboard, get_faq_categories_keyboard, get_services_keyboard,
+    get_request_status_keyboard
+)
+
+
+class TestKeyboards:
+    """Тесты для клавиатур"""
+
+    def test_static_keyboards_cached(self):
+        """Тест повторного использования статических клавиатур"""
+        assert get_main_keyboard() is get_main_keyboard()
+        assert get_faq_categories_keyboard() is get_faq_categories_keyboard()
+        assert get_request_status_keyboard(1) is get_request_status_keyboard(1)
+
+    def test_services_keyboard_cached_by_content(self):
+        """Тест кэширования клавиатуры услуг по id и названию"""
+        first = get_services_keyboard([Service(id=1, name="Блефаропластика")])
+        same = get_services_keyboard([Service(id=1, name="Блефаропластика")])
+        renamed = get_services_keyboard([Service(id=1, name="Пластика век")])
+
+        assert first is same
+        assert renamed is not first
+        assert renamed.inline_keyboard[0][0].text == "Пластика век"
+        assert renamed.inline_keyboard[0][0].callback_data == ServiceCB(id=1).pack()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
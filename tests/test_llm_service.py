@@ -1,6 +1,25 @@
+import orjson
 import pytest
-from unittest.mock import MagicMock, patch
-from services.llm_service import LLMService, FallbackService
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.llm_service import LLMService, FallbackService, SYSTEM_PROMPT
+
+
+def mock_http_session(status=200, json_data=None, error=None):
+    """Сессия aiohttp, у которой post/get отдают заранее заданный ответ"""
+    response = MagicMock()
+    response.status = status
+    response.read = AsyncMock(return_value=orjson.dumps(json_data))
+    response.text = AsyncMock(return_value="")
+    
+    request = MagicMock()
+    request.__aenter__ = AsyncMock(return_value=response, side_effect=error)
+    request.__aexit__ = AsyncMock(return_value=False)
+    
+    session = MagicMock()
+    session.closed = False
+    session.post.return_value = request
+    session.get.return_value = request
+    return session
 
 
 class TestLLMService:
@@ -10,36 +29,57 @@ class TestLLMService:
     async def test_generate_response_success(self):
         """Тест успешной генерации ответа"""
         service = LLMService()
+        session = mock_http_session(json_data={'response': 'Тестовый ответ от LLM'})
         
-        # Мокаем requests
-        with patch('services.llm_service.requests.post') as mock_post:
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = {
-                'response': 'Тестовый ответ от LLM'
-            }
-            mock_post.return_value = mock_response
-            
+        with patch('services.llm_service.get_session', return_value=session):
             result = await service.generate_response(
                 "Тестовый вопрос",
                 {'service': {'name': 'Блефаропластика'}}
             )
-            
-            assert result == 'Тестовый ответ от LLM'
-            mock_post.assert_called_once()
+        
+        assert result == 'Тестовый ответ от LLM'
+        session.post.assert_called_once()
     
     @pytest.mark.asyncio
     async def test_generate_response_error(self):
         """Тест генерации ответа с ошибкой"""
         service = LLMService()
+        session = mock_http_session(error=Exception("Network error"))
         
-        # Мокаем requests с ошибкой
-        with patch('services.llm_service.requests.post') as mock_post:
-            mock_post.side_effect = Exception("Network error")
-            
+        with patch('services.llm_service.get_session', return_value=session):
             result = await service.generate_response("Тестовый вопрос")
-            
-            assert result is None
+        
+        assert result is None
+    
+    @pytest.mark.asyncio
+    async def test_call_ollama_retries_when_busy(self):
+        """Тест повтора запроса, пока Ollama отвечает 503"""
+        service = LLMService()
+        busy = mock_http_session(status=503).post.return_value
+        busy.__aenter__.return_value.headers = {"Retry-After": "0"}
+        ok = mock_http_session(json_data={'response': 'Ответ'}).post.return_value
+        session = MagicMock()
+        session.post.side_effect = [busy, ok]
+        
+        with patch('services.llm_service.get_session', return_value=session):
+            result = await service._call_ollama("Вопрос")
+        
+        assert result == 'Ответ'
+        assert session.post.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_generate_responses_batch(self):
+        """Тест пакетной генерации: ответ на каждый вопрос, порядок сохраняется"""
+        service = LLMService()
+        service.generate_response = AsyncMock(side_effect=lambda prompt, context: f"ответ: {prompt}")
+        
+        result = await service.generate_responses_batch([
+            ("Первый", None),
+            ("Второй", {'service': {'name': 'Блефаропластика'}}),
+        ])
+        
+        assert result == ["ответ: Первый", "ответ: Второй"]
+        assert service.generate_response.await_count == 2
     
     def test_build_prompt(self):
         """Тест построения промпта"""
@@ -64,19 +104,34 @@ class TestLLMService:
         assert "Какая цена?" in prompt
         assert "от 50 000 руб" in prompt
     
+    def test_build_prompt_reuses_system_prompt(self):
+        """Системная часть промпта одна и та же для любых вопросов"""
+        service = LLMService()
+        
+        assert service._build_prompt("Первый вопрос").startswith(SYSTEM_PROMPT)
+        assert service._build_prompt("Второй вопрос").startswith(SYSTEM_PROMPT)
+    
     @pytest.mark.asyncio
     async def test_check_connection(self):
         """Тест проверки соединения с Ollama"""
         service = LLMService()
         
-        with patch('services.llm_service.requests.get') as mock_get:
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_get.return_value = mock_response
-            
+        with patch('services.llm_service.get_session', return_value=mock_http_session(status=200)):
             result = await service.check_connection()
-            
-            assert result is True
+        
+        assert result is True
+    
+    @pytest.mark.asyncio
+    async def test_status_cached(self):
+        """Тест кэширования ответа /api/tags между проверками"""
+        service = LLMService()
+        session = mock_http_session(json_data={'models': [{'name': 'mistral:7b'}]})
+        
+        with patch('services.llm_service.get_session', return_value=session):
+            assert await service.check_connection() is True
+            assert await service.get_available_models() == ['mistral:7b']
+        
+        session.get.assert_called_once()
 
 
 class TestFallbackService:
@@ -103,6 +158,25 @@ class TestFallbackService:
         assert result is not None
         assert "час" in result.lower() or "длительность" in result.lower()
     
+    def test_keyword_priority_follows_faq_order(self):
+        """При нескольких ключевых словах выбирается первое в словаре FAQ"""
+        service = FallbackService()
+        
+        assert service._find_keyword("риск и цена операции") == "цена"
+        assert service._find_keyword("подготовка и реабилитация") == "реабилитация"
+        # Синоним дает тему со своим приоритетом
+        assert service._find_keyword("сколько длится восстановление") == "длительность"
+    
+    @pytest.mark.asyncio
+    async def test_fallback_responses_alternate(self):
+        """Варианты ответа на одну тему чередуются"""
+        service = FallbackService()
+        first, second = service.faq_responses["риск"]
+        
+        results = [await service.get_fallback_response("какой риск?") for _ in range(3)]
+        
+        assert results == [first, second, first]
+    
     @pytest.mark.asyncio
     async def test_get_fallback_response_unknown(self):
         """Тест ответа на неизвестный вопрос"""
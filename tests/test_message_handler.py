@@ -0,0 +1,60 @@
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from utils.message_handler import safe_send_message
+from utils.rate_limiter import RateLimitMiddleware, TokenBucket
+
+
+def message_through_middleware(middleware, make_request):
+    """Сообщение, у которого answer проходит через middleware сессии бота, как в main.py"""
+    method = SendMessage(chat_id=1, text="Привет")
+
+    async def answer(text, **kwargs):
+        return await middleware(make_request, MagicMock(), method)
+
+    message = MagicMock()
+    message.answer = answer
+    return message, method
+
+
+class TestSafeSendMessage:
+    """Тесты для безопасной отправки сообщений"""
+
+    @pytest.mark.asyncio
+    async def test_retry_after_waits_for_rate_limiter(self):
+        """Тест: после ответа 429 повтор ждет паузы общего ограничителя частоты"""
+        bucket = TokenBucket(rate=1000, burst=10)
+        make_request = AsyncMock()
+        message, method = message_through_middleware(RateLimitMiddleware(bucket), make_request)
+        make_request.side_effect = [
+            TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.1),
+            None,
+        ]
+
+        start = time.monotonic()
+        assert await safe_send_message(message, "Привет") is True
+
+        assert make_request.await_count == 2
+        assert time.monotonic() - start >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_other_sender_waits_for_pause(self):
+        """Тест: пока ограничитель на паузе, другая отправка ждет, а не получает отказ"""
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.pause(0.1)
+        make_request = AsyncMock()
+        message, _ = message_through_middleware(RateLimitMiddleware(bucket), make_request)
+
+        start = time.monotonic()
+        assert await safe_send_message(message, "Привет") is True
+
+        make_request.assert_awaited_once()
+        assert time.monotonic() - start >= 0.09
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,69 @@
+import pytest
+
+from utils.message_splitter import compact_text, split_message, truncate_message
+
+
+class TestCompactText:
+    """Тесты для сжатия текста под промпт модели"""
+
+    def test_short_text_whitespace_collapsed(self):
+        """Короткий текст только очищается от лишних пробелов"""
+        assert compact_text("  Цена   от\n50 000 руб  ", 100) == "Цена от 50 000 руб"
+
+    def test_cut_at_sentence_end(self):
+        """Длинный текст обрезается по концу предложения"""
+        text = "Первое предложение. Второе предложение тут. Третье очень длинное"
+
+        assert compact_text(text, 45) == "Первое предложение. Второе предложение тут."
+
+    def test_cut_at_word(self):
+        """Без подходящего конца предложения текст обрезается по слову"""
+        result = compact_text("слово " * 20, 30)
+
+        assert result == "слово слово слово слово слово…"
+
+
+class TestSplitMessage:
+    """Тесты для разбиения длинных сообщений"""
+
+    def test_short_text_unchanged(self):
+        """Короткое сообщение не делится"""
+        assert split_message("Привет", 100) == ["Привет"]
+
+    def test_split_at_paragraph(self):
+        """Сообщение делится по абзацам"""
+        text = "Первый абзац.\n\nВторой абзац."
+
+        assert split_message(text, 20) == ["Первый абзац.", "Второй абзац."]
+
+    def test_split_at_sentence_and_word(self):
+        """Без абзацев сообщение делится по предложениям, затем по словам"""
+        parts = split_message("Раз два. Три четыре пять шесть", 12)
+
+        assert parts == ["Раз два.", "Три четыре", "пять шесть"]
+        assert all(len(part) <= 12 for part in parts)
+
+    def test_long_word_cut(self):
+        """Слово длиннее лимита режется принудительно"""
+        assert split_message("а" * 25, 10) == ["а" * 10, "а" * 10, "а" * 5]
+
+
+
+class TestTruncateMessage:
+    """Тесты для обрезки сообщения"""
+
+    def test_cut_at_last_sentence_end(self):
+        """Обрезка по последнему концу предложения в пределах лимита"""
+        result = truncate_message("Первое. Второе! Третье без конца", 20)
+
+        assert result.startswith("Первое. Второе!...")
+
+    def test_no_sentence_end_nearby(self):
+        """Без конца предложения в последних 100 символах обрезка ровно по лимиту"""
+        result = truncate_message("Начало. " + "а" * 300, 200)
+
+        assert result.startswith("Начало. " + "а" * 192 + "...")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,70 @@
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetUpdates, SendMessage
+
+from utils.rate_limiter import TokenBucket, RateLimitMiddleware
+
+
+class TestTokenBucket:
+    """Тесты для ограничителя частоты запросов"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_rate(self):
+        """Тест пропуска пачки запросов и ожидания после нее"""
+        bucket = TokenBucket(rate=20, burst=3)
+
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        assert time.monotonic() - start < 0.05
+
+        await bucket.acquire()
+        assert time.monotonic() - start >= 0.04
+
+    @pytest.mark.asyncio
+    async def test_pause(self):
+        """Тест паузы после ответа 429"""
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.pause(0.1)
+
+        start = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - start >= 0.09
+
+
+class TestRateLimitMiddleware:
+    """Тесты для middleware сессии бота"""
+
+    @pytest.mark.asyncio
+    async def test_get_updates_not_limited(self):
+        """Тест: long polling не расходует токены"""
+        bucket = MagicMock()
+        bucket.acquire = AsyncMock()
+        middleware = RateLimitMiddleware(bucket)
+        make_request = AsyncMock(return_value="ok")
+
+        await middleware(make_request, MagicMock(), GetUpdates())
+        bucket.acquire.assert_not_called()
+
+        await middleware(make_request, MagicMock(), SendMessage(chat_id=1, text="Привет"))
+        bucket.acquire.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_bucket(self):
+        """Тест паузы при ответе 429"""
+        bucket = MagicMock()
+        bucket.acquire = AsyncMock()
+        middleware = RateLimitMiddleware(bucket)
+        method = SendMessage(chat_id=1, text="Привет")
+        make_request = AsyncMock(side_effect=TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=5))
+
+        with pytest.raises(TelegramRetryAfter):
+            await middleware(make_request, MagicMock(), method)
+        bucket.pause.assert_called_once_with(5)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,20 +1,32 @@
 import pytest
 import asyncio
+import aiohttp
+from aioresponses import aioresponses
 from unittest.mock import AsyncMock, MagicMock
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.repositories import ServiceRepository, UserRepository
+from models.repositories import ServiceRepository, UserRepository, ConsultationRequestRepository
 from models.database import Service, User
+from services.http_session import close_session
 from services.parser import WebsiteParser
 
 
 @pytest.fixture
-async def session():
+def session():
     """Фикстура для тестовой сессии БД"""
-    # Здесь можно создать тестовую сессию
-    # Для простоты используем mock
-    session = AsyncMock(spec=AsyncSession)
-    return session
+    # Для простоты используем mock. Фикстура синхронная: event loop ей не нужен,
+    # и pytest-asyncio не создает для нее отдельный цикл
+    return AsyncMock(spec=AsyncSession)
+
+
+def _mock_execute(session, scalars=(), **results):
+    """Подменяет session.execute: результат отдает scalars().all() и заданные scalar_*()"""
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = list(scalars)
+    for name, value in results.items():
+        getattr(result, name).return_value = value
+    session.execute = AsyncMock(return_value=result)
+    return result
 
 
 @pytest.fixture
@@ -44,8 +56,8 @@ class TestServiceRepository:
         )
         
         service_repo.session.add = MagicMock()
+        service_repo.session.flush = AsyncMock()
         service_repo.session.commit = AsyncMock()
-        service_repo.session.refresh = AsyncMock()
         
         # Вызываем метод
         result = await service_repo.create(
@@ -54,19 +66,16 @@ class TestServiceRepository:
             price_range="от 10000 руб"
         )
         
-        # Проверяем, что методы были вызваны
+        # Проверяем: репозиторий только сбрасывает изменения, коммитит вызывающий код
         service_repo.session.add.assert_called_once()
-        service_repo.session.commit.assert_called_once()
-        service_repo.session.refresh.assert_called_once()
+        service_repo.session.flush.assert_called_once()
+        service_repo.session.commit.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_get_all_services(self, service_repo):
         """Тест получения всех услуг"""
         # Мокаем результат
-        mock_result = AsyncMock()
-        mock_result.scalars.return_value.all.return_value = []
-        
-        service_repo.session.execute = AsyncMock(return_value=mock_result)
+        _mock_execute(service_repo.session)
         
         # Вызываем метод
         result = await service_repo.get_all()
@@ -83,10 +92,7 @@ class TestUserRepository:
     async def test_get_by_telegram_id(self, user_repo):
         """Тест поиска пользователя по Telegram ID"""
         # Мокаем результат
-        mock_result = AsyncMock()
-        mock_result.scalar_one_or_none.return_value = None
-        
-        user_repo.session.execute = AsyncMock(return_value=mock_result)
+        _mock_execute(user_repo.session, scalar_one_or_none=None)
         
         # Вызываем метод
         result = await user_repo.get_by_telegram_id(12345)
@@ -105,9 +111,9 @@ class TestUserRepository:
             first_name="Тест"
         )
         
-        user_repo.session.add = MagicMock()
+        _mock_execute(user_repo.session, scalar_one=mock_user)
         user_repo.session.commit = AsyncMock()
-        user_repo.session.refresh = AsyncMock(return_value=mock_user)
+        user_repo.session.refresh = AsyncMock()
         
         # Вызываем метод
         result = await user_repo.create(
@@ -115,73 +121,94 @@ class TestUserRepository:
             first_name="Тест"
         )
         
-        # Проверяем
-        user_repo.session.add.assert_called_once()
-        user_repo.session.commit.assert_called_once()
-        user_repo.session.refresh.assert_called_once()
+        # Проверяем: один INSERT ... RETURNING без дополнительного refresh
+        assert result is mock_user
+        user_repo.session.execute.assert_called_once()
+        user_repo.session.commit.assert_not_called()
+        user_repo.session.refresh.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_upsert_unchanged_profile_skips_write(self, user_repo):
+        """Тест: известный пользователь с тем же профилем - только SELECT, без upsert"""
+        mock_user = User(id=1, telegram_id=12345, username="test", first_name="Тест")
+        _mock_execute(user_repo.session, scalar_one_or_none=mock_user)
+        
+        result = await user_repo.upsert_by_telegram(
+            telegram_id=12345, username="test", first_name="Тест"
+        )
+        
+        assert result is mock_user
+        user_repo.session.execute.assert_called_once()
+
+
+class TestConsultationRequestRepository:
+    """Тесты для репозитория заявок"""
+    
+    @pytest.mark.asyncio
+    async def test_get_all_eager(self, session):
+        """Тест загрузки заявок вместе с пользователями и услугами"""
+        request_repo = ConsultationRequestRepository(session)
+        _mock_execute(request_repo.session)
+        
+        # Вызываем метод
+        await request_repo.get_all(status="new", eager=True)
+        
+        # Проверяем, что к запросу добавлены опции загрузки связей
+        stmt = request_repo.session.execute.call_args[0][0]
+        assert len(stmt._with_options) == 3
 
 
 class TestWebsiteParser:
     """Тесты для парсера сайта"""
     
+    @pytest.fixture(autouse=True)
+    async def http_session(self):
+        """Общая aiohttp-сессия привязана к event loop теста: закрываем ее после теста"""
+        yield
+        await close_session()
+    
     @pytest.mark.asyncio
     async def test_parse_service_page_success(self):
         """Тест успешного парсинга страницы"""
         parser = WebsiteParser()
         
-        # Мокаем requests
-        import requests
-        original_get = requests.Session.get
-        
-        def mock_get(self, url, timeout=None):
-            mock_response = MagicMock()
-            mock_response.raise_for_status = MagicMock()
-            mock_response.encoding = 'utf-8'
-            mock_response.text = """
+        with aioresponses() as mocked:
+            mocked.get("http://example.com", body="""
             <html>
                 <h1>Блефаропластика верхних век</h1>
                 <p>Описание услуги</p>
                 <div class="price">от 50 000 рублей</div>
             </html>
-            """
-            return mock_response
-        
-        requests.Session.get = mock_get
-        
-        try:
+            """)
             result = await parser.parse_service_page("http://example.com")
-            
-            # Проверяем результат
-            assert "name" in result
-            assert "Блефаропластика" in result.get("name", "")
-            
-        finally:
-            # Восстанавливаем оригинальный метод
-            requests.Session.get = original_get
+        
+        # Проверяем результат
+        assert "name" in result
+        assert "Блефаропластика" in result.get("name", "")
     
     @pytest.mark.asyncio
     async def test_parse_service_page_error(self):
         """Тест парсинга с ошибкой"""
         parser = WebsiteParser()
         
-        # Мокаем requests с исключением
-        import requests
-        original_get = requests.Session.get
+        with aioresponses() as mocked:
+            mocked.get("http://example.com", exception=aiohttp.ClientConnectionError("Network error"))
+            result = await parser.parse_service_page("http://example.com")
         
-        def mock_get_error(self, url, timeout=None):
-            raise requests.exceptions.RequestException("Network error")
+        # Проверяем, что при ошибке возвращается пустой dict
+        assert result == {}
+    
+    @pytest.mark.asyncio
+    async def test_fetch_page_not_modified(self):
+        """Тест условного запроса: при 304 страница не загружается заново"""
+        parser = WebsiteParser()
         
-        requests.Session.get = mock_get_error
+        with aioresponses() as mocked:
+            mocked.get("http://example.com", status=304)
+            page = await parser.fetch_page("http://example.com", etag='"v1"')
         
-        try:
-            result = await parser.parse_service_page("http://example.com")
-            
-            # Проверяем, что при ошибке возвращается пустой dict
-            assert result == {}
-            
-        finally:
-            # Восстанавливаем оригинальный метод
-            requests.Session.get = original_get
+        assert page.html is None
+        assert page.etag == '"v1"'
 
 
 if __name__ == "__main__":
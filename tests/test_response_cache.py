@@ -0,0 +1,52 @@
+import pytest
+from unittest.mock import patch
+
+from services.response_cache import ResponseCache
+
+
+class TestResponseCache:
+    """Тесты для кэша ответов модели"""
+
+    def test_get_set(self):
+        """Тест сохранения и получения ответа"""
+        cache = ResponseCache(maxsize=10, ttl=60)
+
+        cache.set(("сколько стоит", "Блефаропластика"), "от 50 000 руб")
+
+        assert cache.get(("сколько стоит", "Блефаропластика")) == "от 50 000 руб"
+        assert cache.get(("сколько стоит", None)) is None
+
+    def test_expired(self):
+        """Тест устаревания ответа по TTL"""
+        cache = ResponseCache(maxsize=10, ttl=60)
+
+        with patch('services.response_cache.time.monotonic', return_value=100.0):
+            cache.set("вопрос", "ответ")
+        with patch('services.response_cache.time.monotonic', return_value=161.0):
+            assert cache.get("вопрос") is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        """Тест вытеснения давно не использованного ответа"""
+        cache = ResponseCache(maxsize=2, ttl=60)
+
+        cache.set("первый", "1")
+        cache.set("второй", "2")
+        cache.get("первый")
+        cache.set("третий", "3")
+
+        assert cache.get("первый") == "1"
+        assert cache.get("второй") is None
+        assert cache.get("третий") == "3"
+
+    def test_disabled(self):
+        """Тест отключенного кэша (ttl = 0)"""
+        cache = ResponseCache(ttl=0)
+
+        cache.set("вопрос", "ответ")
+
+        assert cache.get("вопрос") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
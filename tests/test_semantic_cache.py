@@ -0,0 +1,65 @@
+import pytest
+
+from services.semantic_cache import SemanticCache
+
+# Эмбеддинги-заглушки: вопросы о цене близки друг к другу и далеки от вопроса о реабилитации
+EMBEDDINGS = {
+    "сколько стоит": [1.0, 0.0, 0.0],
+    "какая цена": [0.98, 0.2, 0.0],
+    "сколько длится реабилитация": [0.0, 0.0, 1.0],
+}
+
+
+async def fake_embed(text):
+    return EMBEDDINGS[text]
+
+
+class TestSemanticCache:
+    """Тесты для кэша ответов по смыслу вопроса"""
+
+    @pytest.mark.asyncio
+    async def test_similar_question_hit(self):
+        """Тест ответа на перефразированный вопрос"""
+        cache = SemanticCache(fake_embed, threshold=0.9, maxsize=10)
+
+        response, vector = await cache.get("услуга", "сколько стоит")
+        assert response is None
+        cache.set("услуга", vector, "от 50 000 руб")
+
+        assert (await cache.get("услуга", "какая цена"))[0] == "от 50 000 руб"
+        assert (await cache.get("услуга", "сколько длится реабилитация"))[0] is None
+
+    @pytest.mark.asyncio
+    async def test_namespace_isolated(self):
+        """Тест: ответ для другой услуги не выдается"""
+        cache = SemanticCache(fake_embed, threshold=0.9, maxsize=10)
+
+        _, vector = await cache.get("первая", "сколько стоит")
+        cache.set("первая", vector, "от 50 000 руб")
+
+        assert (await cache.get("вторая", "сколько стоит"))[0] is None
+
+    @pytest.mark.asyncio
+    async def test_embed_error(self):
+        """Тест: ошибка эмбеддинга не ломает генерацию ответа"""
+        async def failing_embed(text):
+            raise RuntimeError("API error")
+
+        cache = SemanticCache(failing_embed)
+
+        assert await cache.get("услуга", "сколько стоит") == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_clear(self):
+        """Тест сброса кэша"""
+        cache = SemanticCache(fake_embed, threshold=0.9, maxsize=10)
+        _, vector = await cache.get("услуга", "сколько стоит")
+        cache.set("услуга", vector, "от 50 000 руб")
+
+        cache.clear()
+
+        assert (await cache.get("услуга", "сколько стоит"))[0] is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
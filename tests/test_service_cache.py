@@ -0,0 +1,98 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from models.database import Service
+from services.service_cache import ServiceCache
+
+
+class TestServiceCache:
+    """Тесты для кэша услуг"""
+
+    @pytest.mark.asyncio
+    async def test_get_all_cached(self):
+        """Тест повторного получения услуг без обращения к БД"""
+        cache = ServiceCache(ttl=60)
+        services = [Service(id=1, name="Блефаропластика")]
+
+        with patch('services.service_cache.ServiceRepository') as mock_repo:
+            mock_repo.return_value.get_all = AsyncMock(return_value=services)
+
+            first = await cache.get_all(MagicMock())
+            second = await cache.get_all(MagicMock())
+
+            assert first == services
+            assert second is first
+            mock_repo.return_value.get_all.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_get_service_context(self):
+        """Тест словаря услуги для контекста LLM"""
+        cache = ServiceCache(ttl=60)
+        services = [Service(id=1, name="Блефаропластика", price_range="от 50 000 руб")]
+
+        with patch('services.service_cache.ServiceRepository') as mock_repo:
+            mock_repo.return_value.get_all = AsyncMock(return_value=services)
+
+            context = await cache.get_service_context(MagicMock())
+
+            assert context['name'] == "Блефаропластика"
+            assert context['price_range'] == "от 50 000 руб"
+            assert '_sa_instance_state' not in context
+
+    @pytest.mark.asyncio
+    async def test_get_by_id(self):
+        """Тест поиска услуги по ID в кэше"""
+        cache = ServiceCache(ttl=60)
+        services = [Service(id=1, name="Блефаропластика"), Service(id=2, name="Ринопластика")]
+
+        with patch('services.service_cache.ServiceRepository') as mock_repo:
+            mock_repo.return_value.get_all = AsyncMock(return_value=services)
+            mock_repo.return_value.get_by_id = AsyncMock(return_value=None)
+
+            assert (await cache.get_by_id(MagicMock(), 2)).name == "Ринопластика"
+            mock_repo.return_value.get_by_id.assert_not_called()
+
+            assert await cache.get_by_id(MagicMock(), 3) is None
+            mock_repo.return_value.get_by_id.assert_called_once_with(3)
+
+    @pytest.mark.asyncio
+    async def test_invalidate(self):
+        """Тест сброса кэша"""
+        cache = ServiceCache(ttl=60)
+
+        with patch('services.service_cache.ServiceRepository') as mock_repo:
+            mock_repo.return_value.get_all = AsyncMock(return_value=[Service(id=1, name="Тест")])
+
+            await cache.get_all(MagicMock())
+            cache.invalidate()
+            await cache.get_all(MagicMock())
+
+            assert mock_repo.return_value.get_all.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate_shared_reaches_other_process(self):
+        """Тест: сброс в админ-панели через версию в Redis сбрасывает кэш бота"""
+        versions = {}
+        store = MagicMock()
+        store.get = AsyncMock(side_effect=lambda key: versions.get(key))
+
+        async def incr(key):
+            versions[key] = str(int(versions.get(key) or 0) + 1).encode()
+
+        store.incr = AsyncMock(side_effect=incr)
+        bot_cache = ServiceCache(ttl=60, store=store)
+        admin_cache = ServiceCache(ttl=60, store=store)
+
+        with patch('services.service_cache.ServiceRepository') as mock_repo:
+            mock_repo.return_value.get_all = AsyncMock(return_value=[Service(id=1, name="Тест")])
+
+            await bot_cache.get_all(MagicMock())
+            await bot_cache.get_all(MagicMock())
+            await admin_cache.invalidate_shared()
+            await bot_cache.get_all(MagicMock())
+
+            assert mock_repo.return_value.get_all.call_count == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+
+from services.openai_service import OpenAIService, SharedStream
+
+
+async def pieces(*items, error=None):
+    """Источник фрагментов с небольшой задержкой между ними"""
+    for item in items:
+        await asyncio.sleep(0.01)
+        yield item
+    if error is not None:
+        raise error
+
+
+class TestSharedStream:
+    """Тесты для общего потокового ответа"""
+
+    @pytest.mark.asyncio
+    async def test_late_reader_gets_all_pieces(self):
+        """Тест: читатель, подключившийся позже, получает фрагменты с начала"""
+        shared = SharedStream(pieces("Цена ", "от 50 000 руб"))
+
+        async def read(delay):
+            await asyncio.sleep(delay)
+            return [piece async for piece in shared.read()]
+
+        first, late = await asyncio.gather(read(0), read(0.015))
+
+        assert first == late == ["Цена ", "от 50 000 руб"]
+        assert shared.result() == "Цена от 50 000 руб"
+
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_reader(self):
+        """Тест: ошибка API пробрасывается каждому читателю, ответ не кэшируется"""
+        shared = SharedStream(pieces("Цена", error=RuntimeError("API error")))
+
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                [piece async for piece in shared.read()]
+        assert shared.result() is None
+
+
+class TestStreamResponseSingleFlight:
+    """Тесты объединения одинаковых одновременных вопросов"""
+
+    @pytest.mark.asyncio
+    async def test_same_question_shares_one_stream(self):
+        """Тест: одинаковые вопросы читают один поток OpenAI, ответ попадает в кэш"""
+        service = OpenAIService()
+        calls = []
+
+        def fake_stream(prompt, context=None):
+            calls.append(prompt)
+            return pieces("Стоимость ", "от 50 000 руб")
+
+        service._stream_openai = fake_stream
+
+        async def ask(question):
+            return "".join([piece async for piece in service.stream_response(question)])
+
+        answers = await asyncio.gather(ask("Сколько стоит?"), ask("сколько стоит"))
+
+        assert answers == ["Стоимость от 50 000 руб"] * 2
+        assert len(calls) == 1
+        assert await ask("Сколько стоит?") == "Стоимость от 50 000 руб"
+        assert len(calls) == 1
+        assert not service._in_flight_streams
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
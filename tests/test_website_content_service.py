@@ -0,0 +1,93 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.parser import PageFetch
+from services.website_content_service import WebsiteContentService, normalize_query
+
+
+class TestWebsiteContentService:
+    """Тесты для сервиса контента с сайта клиники"""
+
+    def test_normalize_query(self):
+        """Тест нормализации запроса для ключа кэша"""
+        assert normalize_query("  Что   такое\tБлефаропластика? ") == "что такое блефаропластика"
+        assert normalize_query("Пластика ВЕК, ёлки") == "пластика век елки"
+        assert normalize_query("Скажите, пожалуйста: сколько стоит?") == "сколько стоит"
+
+    @pytest.mark.asyncio
+    async def test_relevant_content_cached_for_similar_queries(self):
+        """Похожие запросы получают один и тот же текст без повторного парсинга"""
+        service = WebsiteContentService()
+        service.get_service_content = AsyncMock(return_value={'name': 'Блефаропластика'})
+
+        first = await service.get_relevant_content_for_query("Сколько стоит блефаропластика?")
+        second = await service.get_relevant_content_for_query("сколько  стоит БЛЕФАРОПЛАСТИКА?")
+
+        assert "Блефаропластика" in first
+        assert second is first
+        service.get_service_content.assert_awaited_once_with("блефаропластика")
+
+    @pytest.mark.asyncio
+    async def test_aliases_share_cached_page(self):
+        """Синонимы одной услуги не парсят страницу повторно"""
+        service = WebsiteContentService()
+        service.parser.fetch_page = AsyncMock(
+            return_value=PageFetch("<html><h1>Блефаропластика</h1></html>", None, None)
+        )
+
+        first = await service.get_service_content("блефаропластика")
+        second = await service.get_service_content("пластика век")
+
+        assert first['name'] == "Блефаропластика"
+        assert second is first
+        service.parser.fetch_page.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unchanged_page_not_reparsed(self):
+        """Устаревшая запись проверяется условным запросом; при 304 страница не разбирается"""
+        service = WebsiteContentService()
+        stored = {'content': {'name': 'Блефаропластика'}, 'etag': '"v1"', 'checked_at': 0}
+        service._load_stored_page = AsyncMock(return_value=stored)
+        service._store_page = AsyncMock()
+        service.parser.fetch_page = AsyncMock(return_value=PageFetch(None, '"v1"', None))
+        service.parser.parse_html = MagicMock()
+
+        content = await service.get_service_content("блефаропластика")
+
+        assert content == {'name': 'Блефаропластика'}
+        assert service.parser.fetch_page.await_args.kwargs['etag'] == '"v1"'
+        service.parser.parse_html.assert_not_called()
+        service._store_page.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_relevant_content_failure_not_cached(self):
+        """Неудачный парсинг не кэшируется"""
+        service = WebsiteContentService()
+        service.get_service_content = AsyncMock(side_effect=[None, {'name': 'Блефаропластика'}])
+
+        assert await service.get_relevant_content_for_query("блефаропластика") is None
+        assert await service.get_relevant_content_for_query("блефаропластика") is not None
+
+    def test_format_content_compacts_fields(self):
+        """Пустые поля пропускаются, длинные сжимаются"""
+        service = WebsiteContentService()
+
+        formatted = service._format_content_for_gpt({
+            'name': 'Блефаропластика',
+            'description': 'Очень подробно. ' * 100,
+            'indications': '',
+            'source_url': 'https://med-plastic.ru/plastika-verhnih-vek/',
+        })
+
+        assert "Название услуги: Блефаропластика" in formatted
+        assert "Показания" not in formatted
+        assert len(formatted) < 800
+
+    @pytest.mark.asyncio
+    async def test_unrelated_query(self):
+        """Запрос не про услуги сайта"""
+        service = WebsiteContentService()
+        service.get_service_content = AsyncMock()
+
+        assert await service.get_relevant_content_for_query("какая столица Франции?") is None
+        service.get_service_content.assert_not_called()
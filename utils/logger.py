@@ -1,17 +1,42 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from config.settings import settings
 
+# Ротация bot.log: размер одного файла, байт, и число старых файлов
+LOG_FILE_MAX_BYTES = 10_000_000
+LOG_FILE_BACKUP_COUNT = 3
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
 
 def setup_logging():
     """Настройка логирования"""
+    # Запись в файл идет в фоновом потоке: logger.info в хендлерах не ждет диска
+    log_queue = queue.Queue(-1)
+    file_handler = RotatingFileHandler(
+        "bot.log",
+        maxBytes=LOG_FILE_MAX_BYTES,
+        backupCount=LOG_FILE_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем в файл оставшиеся в очереди записи
+    atexit.register(listener.stop)
+    
+    # QueueHandler передает в очередь только текст (с трассировкой исключения),
+    # оформляет запись файловый обработчик
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    
     logging.basicConfig(
         level=getattr(logging, settings.log_level.upper()),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler("bot.log", encoding="utf-8"),
-        ],
+        format=LOG_FORMAT,
+        handlers=[logging.StreamHandler(sys.stdout), queue_handler],
     )
     
     # Устанавливаем уровень для aiogram
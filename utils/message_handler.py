@@ -10,6 +10,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
+# Сообщение, которое Telegram отверг как слишком длинное, отправляется сокращенным
+SHORTENED_LENGTH = 4000
+SHORTENED_SUFFIX = "...\n\n(сообщение сокращено)"
+
 
 async def safe_send_message(message: types.Message, text: str, **kwargs) -> bool:
     """
@@ -32,8 +36,10 @@ async def safe_send_message(message: types.Message, text: str, **kwargs) -> bool
             return True
             
         except TelegramRetryAfter as e:
-            logger.warning(f"Rate limit exceeded, waiting {e.retry_after} seconds")
-            await asyncio.sleep(e.retry_after)
+            # Своя пауза не нужна: RateLimitMiddleware сессии бота уже приостановил
+            # общий telegram_rate_limiter, и повтор (как и все параллельные отправки)
+            # дождется одного срока в bucket.acquire()
+            logger.warning(f"Rate limit exceeded, retrying after {e.retry_after} seconds")
             continue
             
         except TelegramNetworkError as e:
@@ -46,10 +52,11 @@ async def safe_send_message(message: types.Message, text: str, **kwargs) -> bool
                 return False
                 
         except TelegramBadRequest as e:
-            if "message is too long" in str(e):
+            # e.message - описание ошибки от Telegram, без форматирования всего исключения
+            if "message is too long" in e.message:
                 # Если сообщение слишком длинное, пытаемся сократить
-                if len(text) > 4000:
-                    shortened_text = text[:4000] + "...\n\n(сообщение сокращено)"
+                if len(text) > SHORTENED_LENGTH:
+                    shortened_text = text[:SHORTENED_LENGTH] + SHORTENED_SUFFIX
                     try:
                         await message.answer(shortened_text, **kwargs)
                         return True
@@ -78,13 +85,15 @@ async def safe_send_messages(message: types.Message, texts: List[str], **kwargs)
     Returns:
         True если все сообщения отправлены успешно
     """
+    # Части отправляются строго по очереди: параллельные запросы в один чат
+    # Telegram может доставить в другом порядке. Общий лимит частоты соблюдает
+    # RateLimitMiddleware сессии бота, а повторы с паузами - safe_send_message,
+    # поэтому после неудачной части сразу переходим к следующей
     success = True
     for i, text in enumerate(texts):
         if not await safe_send_message(message, text, **kwargs):
             logger.error(f"Failed to send message {i + 1}/{len(texts)}")
             success = False
-            # Небольшая задержка перед следующей попыткой
-            await asyncio.sleep(0.5)
     
     return success
 
@@ -1,11 +1,27 @@
 """Утилиты для работы с сообщениями Telegram"""
 
+import re
 from typing import List
 
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Границы частей длинного сообщения в порядке предпочтения: абзац, предложение, слово
+_SPLIT_SEPARATORS = ('\n\n', '. ', ' ')
+
+# Последний знак конца предложения в строке
+_LAST_SENTENCE_END_RE = re.compile(r"[.!?][^.!?]*$")
+
+# Знаки конца предложения
+_SENTENCE_ENDS = frozenset('.!?')
+
 def split_message(text: str, max_length: int = 4096) -> List[str]:
     """
     Разделяет длинное сообщение на части для Telegram
     
+    Части режутся по концу абзаца, а если его нет в пределах лимита - по концу
+    предложения, затем по пробелу; слово длиннее лимита режется принудительно.
+    Один проход по тексту: части - срезы исходной строки, без склеек.
+    
     Args:
         text: Текст сообщения
         max_length: Максимальная длина одной части
@@ -17,65 +33,19 @@ def split_message(text: str, max_length: int = 4096) -> List[str]:
         return [text]
     
     parts = []
-    current_part = ""
-    
-    # Разделяем по абзацам
-    paragraphs = text.split('\n\n')
-    
-    for paragraph in paragraphs:
-        # Если абзац сам по себе слишком длинный, разделяем его по предложениям
-        if len(paragraph) > max_length:
-            sentences = paragraph.split('. ')
-            for sentence in sentences:
-                sentence = sentence.strip()
-                if not sentence:
-                    continue
-                    
-                # Добавляем точку если её нет
-                if not sentence.endswith('.'):
-                    sentence += '.'
-                
-                # Если добавление предложения превысит лимит
-                if len(current_part) + len(sentence) + 2 > max_length:
-                    if current_part:
-                        parts.append(current_part.strip())
-                        current_part = sentence
-                    else:
-                        # Предложение слишком длинное, режем по словам
-                        words = sentence.split()
-                        temp_sentence = ""
-                        for word in words:
-                            if len(temp_sentence) + len(word) + 1 > max_length:
-                                if temp_sentence:
-                                    parts.append(temp_sentence.strip())
-                                    temp_sentence = word
-                                else:
-                                    # Слово слишком длинное, режем принудительно
-                                    while len(word) > max_length:
-                                        parts.append(word[:max_length])
-                                        word = word[max_length:]
-                                    temp_sentence = word
-                            else:
-                                temp_sentence += (" " if temp_sentence else "") + word
-                        current_part = temp_sentence
-                else:
-                    current_part += (" " if current_part else "") + sentence
-        else:
-            # Если добавление абзаца превысит лимит
-            if len(current_part) + len(paragraph) + 2 > max_length:
-                if current_part:
-                    parts.append(current_part.strip())
-                    current_part = paragraph
-                else:
-                    # Абзац слишком длинный (маловероятно после проверки выше)
-                    parts.append(paragraph[:max_length])
-                    current_part = paragraph[max_length:]
-            else:
-                current_part += ("\n\n" if current_part else "") + paragraph
-    
-    # Добавляем последнюю часть
-    if current_part:
-        parts.append(current_part.strip())
+    start, end = 0, len(text)
+    while start < end:
+        stop = min(start + max_length, end)
+        if stop < end:
+            for separator in _SPLIT_SEPARATORS:
+                cut = text.rfind(separator, start, stop)
+                if cut > start:
+                    stop = cut + len(separator)
+                    break
+        part = text[start:stop].strip()
+        if part:
+            parts.append(part)
+        start = stop
     
     return parts
 
@@ -94,16 +64,41 @@ def truncate_message(text: str, max_length: int = 3500) -> str:
     if len(text) <= max_length:
         return text
     
-    # Находим последнее предложение для красивой обрезки
+    # Находим последнее предложение для красивой обрезки: конец предложения
+    # ищется одним проходом и только в последних 100 символах
     truncated = text[:max_length]
-    last_period = truncated.rfind('.')
-    last_exclamation = truncated.rfind('!')
-    last_question = truncated.rfind('?')
-    
-    # Берем последний конец предложения
-    last_end = max(last_period, last_exclamation, last_question)
+    match = _LAST_SENTENCE_END_RE.search(truncated, max(max_length - 99, 0))
     
-    if last_end > max_length - 100:  # Если конец предложения недалеко от конца
-        truncated = truncated[:last_end + 1]
+    if match:  # Если конец предложения недалеко от конца
+        truncated = truncated[:match.start() + 1]
     
     return truncated + "...\n\n(ответ сокращен для отображения в Telegram)"
+
+
+def compact_text(text: str, max_length: int) -> str:
+    """
+    Сжимает текст для промпта модели: схлопывает пробелы и обрезает до max_length
+    
+    Обрезка идет по концу последнего предложения (или слова), попавшего в лимит.
+    
+    Args:
+        text: Исходный текст
+        max_length: Максимальная длина результата (без многоточия)
+        
+    Returns:
+        Сжатый текст
+    """
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    if len(text) <= max_length:
+        return text
+    
+    truncated = text[:max_length]
+    # Конец предложения ищется с конца одним проходом и только во второй половине
+    for i in range(len(truncated) - 2, max_length // 2, -1):
+        if truncated[i] in _SENTENCE_ENDS and truncated[i + 1] == ' ':
+            return truncated[:i + 1]
+    
+    last_space = truncated.rfind(' ')
+    if last_space > 0:
+        truncated = truncated[:last_space]
+    return truncated + "…"
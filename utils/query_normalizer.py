@@ -0,0 +1,26 @@
+"""Нормализация вопросов пользователей для ключей кэшей и поиска по ключевым словам"""
+
+import re
+import unicodedata
+from typing import Final
+
+# Все, кроме букв, цифр и пробелов, сводится к пробелу
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+# Вежливые слова не меняют смысла вопроса
+STOPWORDS: Final[frozenset] = frozenset({
+    "пожалуйста", "скажите", "подскажите", "расскажите", "будьте", "добры",
+})
+
+
+def normalize_query(query: str) -> str:
+    """
+    Приводит вопрос к каноническому виду: NFKC, без регистра, ё -> е,
+    без пунктуации, вежливых слов и лишних пробелов
+
+    Одинаковые по смыслу формулировки («Скажите, сколько стоит?» и
+    «сколько  СТОИТ») дают один ключ кэша.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return " ".join(word for word in text.split() if word not in STOPWORDS)
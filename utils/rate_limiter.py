@@ -0,0 +1,84 @@
+"""Ограничение частоты исходящих запросов к Telegram Bot API"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Адаптивный token bucket
+
+    Пропускает в среднем rate запросов в секунду с пиками до burst.
+    После ответа 429 (pause) новые запросы ждут, пока не истечет retry_after.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        """Ждет, пока появится свободный токен"""
+        # Блокировка создается лениво, внутри работающего event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (сервер ответил 429)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: пропускает вызовы API через token bucket"""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # Long polling не расходует лимит на отправку сообщений
+        if not isinstance(method, GetUpdates):
+            await self.bucket.acquire()
+
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Rate limit hit on {type(method).__name__}, pausing for {e.retry_after}s")
+            self.bucket.pause(e.retry_after)
+            raise
+
+
+# Глобальный лимит Telegram - около 30 сообщений в секунду
+telegram_rate_limiter = TokenBucket(rate=30, burst=30)